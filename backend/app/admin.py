@@ -0,0 +1,18 @@
+"""
+Admin-only route guard.
+Admin routes require the X-Admin-Token header to match ADMIN_TOKEN; they are disabled when ADMIN_TOKEN is unset.
+"""
+
+import hmac
+import os
+from fastapi import Header, HTTPException
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: str | None = Header(None)) -> None:
+    """FastAPI dependency: raise 403 unless the request carries the admin token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled (set ADMIN_TOKEN)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
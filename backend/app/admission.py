@@ -0,0 +1,201 @@
+"""
+Admission control for expensive routes (/api/chat, /api/tts).
+Each AdmissionLimiter caps concurrent requests for a route. Up to queue_size requests wait briefly
+(max_wait) for a slot, best priority first; beyond that, requests get 503 + Retry-After immediately.
+Priority 0 (in-progress conversations) beats priority 1 (new ones): the last `reserved` slots are
+held back for priority 0, and a full queue evicts its worst waiter to make room for a better one.
+Limiters live on the event loop, so waiting never occupies a threadpool thread that cheap sync
+routes need. Per-upstream caps are enforced separately by app.resilience.Upstream.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+PRIORITY_ACTIVE = 0
+PRIORITY_NEW = 1
+
+_registry: dict[str, "AdmissionLimiter"] = {}
+
+
+class Overloaded(HTTPException):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{name} is at capacity, please retry shortly",
+            headers={"Retry-After": str(max(int(retry_after), 1))},
+        )
+
+
+class Ticket:
+    """A held slot. release() is idempotent."""
+
+    def __init__(self, limiter: "AdmissionLimiter"):
+        self._limiter = limiter
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter._release()
+
+
+class AdmissionLimiter:
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float, reserved: int = 0, retry_after: float = 2):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.reserved = min(reserved, limit - 1)
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters: list = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.timeouts = 0
+        _registry[name] = self
+
+    def _has_room(self, priority: int) -> bool:
+        free = self.limit - self.active
+        return free > (self.reserved if priority > PRIORITY_ACTIVE else 0)
+
+    def _pending(self) -> list:
+        return [w for w in self._waiters if not w[2].done()]
+
+    def _reject(self) -> Overloaded:
+        self.rejected += 1
+        return Overloaded(self.name, self.retry_after)
+
+    async def acquire(self, priority: int = PRIORITY_NEW) -> Ticket:
+        """Take a slot, waiting up to max_wait in the priority queue. Raises Overloaded (503)."""
+        pending = self._pending()
+        if self._has_room(priority) and not any(w[0] <= priority for w in pending):
+            self.active += 1
+            self.admitted += 1
+            return Ticket(self)
+        if len(pending) >= self.queue_size:
+            worst = max(pending, key=lambda w: (w[0], w[1]))
+            if worst[0] <= priority:
+                raise self._reject()
+            self.evicted += 1
+            worst[2].set_exception(self._reject())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), future])
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                return Ticket(self)  # granted as the wait ran out
+            future.cancel()
+            self.timeouts += 1
+            raise self._reject()
+        except asyncio.CancelledError:
+            # Caller went away; give back a slot that was granted in the meantime
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._release()
+            else:
+                future.cancel()
+            raise
+        return Ticket(self)
+
+    def _release(self) -> None:
+        self.active -= 1
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._has_room(priority):
+                return
+            heapq.heappop(self._waiters)
+            self.active += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "limit": self.limit,
+            "reservedForActive": self.reserved,
+            "waiting": len(self._pending()),
+            "queueSize": self.queue_size,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "timeouts": self.timeouts,
+        }
+
+
+def get_admission_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in _registry.items()}
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that releases its admission ticket when streaming ends, however it ends,
+    along with an upstream reservation (app.resilience.StreamReservation) the content may not have reached.
+    """
+
+    def __init__(self, content, ticket: Ticket, reservation=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+        self.reservation = reservation
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+            if self.reservation is not None:
+                self.reservation.release()
+
+
+async def iterate_in_executor(iterator: Iterator, executor: ThreadPoolExecutor) -> AsyncIterator:
+    """Consume a blocking iterator on executor so the event loop stays free between items."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        item = await loop.run_in_executor(executor, next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def _limit(env: str, default: int) -> int:
+    return int(os.getenv(env, str(default)))
+
+
+CHAT_MAX_CONCURRENCY = _limit("CHAT_MAX_CONCURRENCY", 24)
+TTS_MAX_CONCURRENCY = _limit("TTS_MAX_CONCURRENCY", 8)
+
+chat_admission = AdmissionLimiter(
+    "chat",
+    limit=CHAT_MAX_CONCURRENCY,
+    queue_size=_limit("CHAT_QUEUE_SIZE", 16),
+    max_wait=float(os.getenv("CHAT_QUEUE_WAIT_SECONDS", "2")),
+    reserved=CHAT_MAX_CONCURRENCY // 4,
+)
+tts_admission = AdmissionLimiter(
+    "tts",
+    limit=TTS_MAX_CONCURRENCY,
+    queue_size=_limit("TTS_QUEUE_SIZE", 8),
+    max_wait=float(os.getenv("TTS_QUEUE_WAIT_SECONDS", "2")),
+)
+# Chat streams are read on their own threads, never the shared threadpool cheap routes run on
+chat_stream_executor = ThreadPoolExecutor(max_workers=CHAT_MAX_CONCURRENCY, thread_name_prefix="chat-stream")
+# Likewise the risk checks and timeline writes that follow each reply; work beyond this many threads queues
+post_stream_executor = ThreadPoolExecutor(
+    max_workers=_limit("POST_STREAM_WORKERS", 8),
+    thread_name_prefix="post-stream",
+)
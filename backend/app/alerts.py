@@ -3,10 +3,58 @@ Alerts (Supabase).
 Same pattern as app.patients / app.doctors: one module for public.alerts.
 """
 
+import base64
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+import orjson
 from fastapi import HTTPException
 
+from app.care_graph import doctors_of, is_linked, patients_of
+from app.changes import is_remote, notify, on_resync, subscribe
+from app.export import paged_rows
+from app.logs import phi
 from app.supabase import supabase
 
+logger = logging.getLogger(__name__)
+
+# Repeated triggers for the same patient and keyword within this window collapse into one open alert.
+ALERT_DEDUP_WINDOW_SECONDS = int(os.getenv("ALERT_DEDUP_WINDOW_SECONDS", "1800"))
+
+# (patient_id, dedup_key) -> {"alert": row, "occurrences": int, "expires_at": monotonic seconds}
+_open_alerts: dict[tuple[str, str], dict] = {}
+_open_alerts_lock = threading.Lock()
+# Held across raise_alert's check-and-insert, striped by key so unrelated alerts do not queue.
+_raise_locks = [threading.Lock() for _ in range(64)]
+# Set to False once we learn alerts.occurrences does not exist, so we stop trying to persist it.
+_persist_occurrences = True
+# Likewise for alerts.dedup_key (and the alerts_open_dedup unique index that relies on it).
+_persist_dedup_key = True
+
+SEVERITIES = ("critical", "warning")
+INBOX_MAX_PAGE_SIZE = 200
+# Bulk acknowledge updates at most this many ids in one statement
+ACKNOWLEDGE_MAX_IDS = 500
+# Full recount from the database, as a safety net for writes that bypass app.*
+ALERT_COUNTS_REBUILD_SECONDS = int(os.getenv("ALERT_COUNTS_REBUILD_SECONDS", "900"))
+
+# Unacknowledged alerts, kept current from app.changes: patient_id -> {alert_id: severity}.
+# Doctors' totals are kept alongside for the doctors that have asked (doctor_id -> Counter by severity).
+_unacked: dict[str, dict[str, str]] = {}
+_unacked_loaded_at: float | None = None
+_doctor_unacked: dict[str, Counter] = {}
+_counts_lock = threading.Lock()
+_counts_load_lock = threading.Lock()
+
+
+def sort_alerts(rows: list) -> list:
+    """Sort rows in place for get_alerts: by severity bucket, then created_at descending."""
+    rows.sort(key=lambda r: (0 if r.get("severity") == "critical" else 1, r.get("created_at") or ""), reverse=True)
+    return rows
+
 
 def get_alerts(patient_id: str | None = None, doctor_id: str | None = None) -> list:
     """
@@ -21,10 +69,9 @@ def get_alerts(patient_id: str | None = None, doctor_id: str | None = None) -> l
     try:
         if doctor_id:
             # Doctors: only alerts for their assigned patients
-            links = supabase.table("patient_doctors").select("patient_id").eq("doctor_id", doctor_id).execute()
-            if not links.data:
+            patient_ids = list(patients_of(doctor_id))
+            if not patient_ids:
                 return []
-            patient_ids = [r["patient_id"] for r in links.data]
             res = supabase.table("alerts").select("*").in_("patient_id", patient_ids).execute()
             data = res.data or []
         elif patient_id:
@@ -32,9 +79,156 @@ def get_alerts(patient_id: str | None = None, doctor_id: str | None = None) -> l
             data = res.data or []
         else:
             return []
-        # Critical first, then by created_at descending (newest first)
-        data.sort(key=lambda r: (0 if r.get("severity") == "critical" else 1, r.get("created_at") or ""), reverse=True)
-        return data
+        return sort_alerts(data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _encode_cursor(row: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([row["created_at"], row["id"]])).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, alert_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), str(alert_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _doctor_counts(doctor_id: str) -> Counter:
+    """The doctor's unacknowledged counts, computed on first use and then kept current. Caller holds _counts_lock."""
+    counts = _doctor_unacked.get(doctor_id)
+    if counts is None:
+        counts = Counter()
+        for patient_id in patients_of(doctor_id):
+            counts.update(_unacked.get(patient_id, {}).values())
+        _doctor_unacked[doctor_id] = counts
+    return counts
+
+
+def get_alert_inbox(
+    doctor_id: str | None = None,
+    patient_id: str | None = None,
+    severity: str | None = None,
+    acknowledged: bool | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+) -> dict:
+    """
+    One page of alerts, newest first, scoped like get_alerts (doctor_id or patient_id).
+    Filters and keyset pagination on (created_at, id) run in the database, so each page is one
+    index range scan however many alerts the panel has accumulated. Pass the returned nextCursor
+    to get the following page (None on the last one). Includes the scope's unacknowledged counts.
+    With both doctor_id and patient_id, returns that patient's alerts (403 unless they are linked).
+    """
+    if severity is not None and severity not in SEVERITIES:
+        raise HTTPException(status_code=400, detail=f"severity must be one of {', '.join(SEVERITIES)}")
+    limit = max(1, min(limit, INBOX_MAX_PAGE_SIZE))
+    try:
+        if doctor_id and patient_id:
+            if not is_linked(patient_id, doctor_id):
+                raise HTTPException(status_code=403, detail="Patient is not linked to this doctor")
+            patient_ids = [patient_id]
+            counts = get_unacknowledged_counts(patient_id=patient_id)
+        elif doctor_id:
+            patient_ids = sorted(patients_of(doctor_id))
+            counts = get_unacknowledged_counts(doctor_id=doctor_id)
+        elif patient_id:
+            patient_ids = [patient_id]
+            counts = get_unacknowledged_counts(patient_id=patient_id)
+        else:
+            return {"alerts": [], "nextCursor": None, "unacknowledged": _count_summary(Counter())}
+        if not patient_ids:
+            return {"alerts": [], "nextCursor": None, "unacknowledged": counts}
+        q = supabase.table("alerts").select("*").in_("patient_id", patient_ids)
+        if severity is not None:
+            q = q.eq("severity", severity)
+        if acknowledged is not None:
+            q = q.eq("acknowledged", acknowledged)
+        if cursor:
+            created_at, alert_id = _decode_cursor(cursor)
+            q = q.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{alert_id}")')
+        # One extra row tells us whether there is a next page
+        rows = q.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute().data or []
+        next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return {"alerts": rows[:limit], "nextCursor": next_cursor, "unacknowledged": counts}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _count_summary(counts: Counter) -> dict:
+    return {"total": sum(counts.values()), **{severity: counts.get(severity, 0) for severity in SEVERITIES}}
+
+
+def _is_fresh() -> bool:
+    return _unacked_loaded_at is not None and time.monotonic() - _unacked_loaded_at < ALERT_COUNTS_REBUILD_SECONDS
+
+
+def _ensure_counts() -> None:
+    """(Re)load every unacknowledged alert when the counters are missing or due a rebuild."""
+    global _unacked, _unacked_loaded_at
+    if _is_fresh():
+        return
+    with _counts_load_lock:
+        if _is_fresh():
+            return
+        # Scanned without holding _counts_lock, so change handlers on writer threads never wait on it
+        unacked: dict[str, dict[str, str]] = {}
+        for row in paged_rows("alerts", [("eq", "acknowledged", False)], columns="id,patient_id,severity"):
+            unacked.setdefault(row["patient_id"], {})[row["id"]] = row["severity"]
+        with _counts_lock:
+            _unacked = unacked
+            _unacked_loaded_at = time.monotonic()
+            _doctor_unacked.clear()
+
+
+def get_unacknowledged_counts(doctor_id: str | None = None, patient_id: str | None = None) -> dict:
+    """
+    Unacknowledged alert counts ({"total", "critical", "warning"}) for a doctor's panel, with a
+    per-patient breakdown, or for one patient. Served from memory; no query after the first load.
+    """
+    try:
+        if doctor_id:
+            _ensure_counts()
+            with _counts_lock:
+                by_patient = {p: len(_unacked[p]) for p in patients_of(doctor_id) if _unacked.get(p)}
+                return {**_count_summary(_doctor_counts(doctor_id)), "byPatient": by_patient}
+        if patient_id:
+            _ensure_counts()
+            with _counts_lock:
+                return _count_summary(Counter(_unacked.get(patient_id, {}).values()))
+        return _count_summary(Counter())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def acknowledge_alerts(alert_ids: list[str]) -> list[dict]:
+    """
+    Set acknowledged = true for many alerts in a single update statement.
+    Unknown or already-acknowledged ids are skipped. Returns the rows that were acknowledged.
+    """
+    alert_ids = list(dict.fromkeys(alert_ids))
+    if not alert_ids:
+        return []
+    if len(alert_ids) > ACKNOWLEDGE_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {ACKNOWLEDGE_MAX_IDS} alerts can be acknowledged at once")
+    try:
+        res = (
+            supabase.table("alerts")
+            .update({"acknowledged": True})
+            .in_("id", alert_ids)
+            .eq("acknowledged", False)
+            .execute()
+        )
+        notify("alerts", "update", res.data)
+        return res.data or []
     except HTTPException:
         raise
     except Exception as e:
@@ -50,6 +244,7 @@ def acknowledge_alert(alert_id: str) -> dict:
         res = supabase.table("alerts").update({"acknowledged": True}).eq("id", alert_id).execute()
         if not res.data or len(res.data) == 0:
             raise HTTPException(status_code=404, detail="Alert not found")
+        notify("alerts", "update", res.data)
         return res.data[0]
     except HTTPException:
         raise
@@ -62,11 +257,15 @@ def create_alert(
     severity: str,
     message: str,
     reasoning: str | None = None,
+    dedup_key: str | None = None,
 ) -> dict:
     """
     Insert an alert row. alerts.patient_id references patients(user_id), so we store patient_user_id.
-    severity: 'warning' or 'critical'. Returns the created row.
+    severity: 'warning' or 'critical'. dedup_key is stored in alerts.dedup_key when the column exists;
+    the alerts_open_dedup index then rejects a second open alert with the same key.
+    Returns the created row.
     """
+    global _persist_dedup_key
     try:
         payload = {
             "patient_id": patient_user_id,
@@ -75,11 +274,216 @@ def create_alert(
             "reasoning": reasoning,
             "acknowledged": False,
         }
-        res = supabase.table("alerts").insert(payload).execute()
+        if dedup_key and _persist_dedup_key:
+            payload["dedup_key"] = dedup_key
+        try:
+            res = supabase.table("alerts").insert(payload).execute()
+        except Exception as e:
+            if "dedup_key" not in payload or _is_unique_violation(e) or "dedup_key" not in str(e):
+                raise
+            logger.warning("alerts.dedup_key is missing; open alerts are de-duplicated per worker only")
+            _persist_dedup_key = False
+            del payload["dedup_key"]
+            res = supabase.table("alerts").insert(payload).execute()
         if not res.data or len(res.data) == 0:
             raise HTTPException(status_code=500, detail="Failed to create alert")
+        notify("alerts", "insert", res.data)
         return res.data[0]
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _is_unique_violation(error: Exception) -> bool:
+    """True for a unique-index conflict from Postgres (23505) or SQLite."""
+    text = str(error)
+    return "23505" in text or "duplicate key" in text or "UNIQUE constraint failed" in text
+
+
+def _find_open_alert(patient_user_id: str, dedup_key: str) -> dict | None:
+    """The open (unacknowledged) alert holding dedup_key for a patient, or None."""
+    res = (
+        supabase.table("alerts")
+        .select("*")
+        .eq("patient_id", patient_user_id)
+        .eq("dedup_key", dedup_key)
+        .eq("acknowledged", False)
+        .limit(1)
+        .execute()
+    )
+    return res.data[0] if res.data else None
+
+
+def _forget_open_alerts(alert_ids: set) -> None:
+    """Drop acknowledged alerts from the de-duplication index so the next trigger opens a new alert."""
+    with _open_alerts_lock:
+        for key in [k for k, entry in _open_alerts.items() if entry["alert"].get("id") in alert_ids]:
+            del _open_alerts[key]
+
+
+def _sweep_expired_alerts(now: float) -> None:
+    """Remove expired entries. Caller must hold _open_alerts_lock."""
+    for key in [k for k, entry in _open_alerts.items() if entry["expires_at"] <= now]:
+        del _open_alerts[key]
+
+
+def _persist_alert_occurrences(alert_id: str, occurrences: int) -> None:
+    """Write the occurrence counter to alerts.occurrences, if the column exists."""
+    global _persist_occurrences
+    if not _persist_occurrences:
+        return
+    try:
+        res = supabase.table("alerts").update({"occurrences": occurrences}).eq("id", alert_id).execute()
+        notify("alerts", "update", res.data)
+    except Exception as e:
+        err_str = str(e).lower()
+        # If table doesn't have the occurrences column yet, keep the counter in memory only
+        if "column" in err_str and ("does not exist" in err_str or "unknown" in err_str or "could not find" in err_str):
+            logger.warning("alerts.occurrences column missing; occurrence counts will not be persisted")
+            _persist_occurrences = False
+        else:
+            logger.error("Failed to update occurrences for alert %s: %s", alert_id, e)
+
+
+def raise_alert(
+    patient_user_id: str,
+    severity: str,
+    message: str,
+    reasoning: str | None = None,
+    dedup_key: str | None = None,
+) -> dict:
+    """
+    Create an alert unless an equivalent one is already open.
+    Alerts are de-duplicated per (patient_user_id, dedup_key, severity) within ALERT_DEDUP_WINDOW_SECONDS
+    (the window slides with each repeat). A repeat bumps the open alert's occurrence counter
+    instead of inserting a new row. Acknowledging the alert closes it.
+
+    The check and insert run under a per-key lock, so concurrent triggers in one worker cannot both
+    insert. Across workers the alerts_open_dedup unique index decides: the losing insert is folded
+    into the open alert that won (which also absorbs repeats after the in-memory window lapses,
+    for as long as it stays unacknowledged).
+    Returns the alert row with an "occurrences" count.
+    """
+    key = (patient_user_id, f"{severity}:{dedup_key or message}")
+    with _raise_locks[hash(key) % len(_raise_locks)]:
+        now = time.monotonic()
+        with _open_alerts_lock:
+            entry = _open_alerts.get(key)
+            if entry and entry["expires_at"] > now:
+                entry["occurrences"] += 1
+                entry["expires_at"] = now + ALERT_DEDUP_WINDOW_SECONDS
+                alert = dict(entry["alert"], occurrences=entry["occurrences"])
+            else:
+                alert = None
+            if len(_open_alerts) > 1024:
+                _sweep_expired_alerts(now)
+
+        if alert is None:
+            try:
+                alert = dict(create_alert(patient_user_id, severity, message, reasoning, dedup_key=key[1]))
+                alert.setdefault("occurrences", 1)
+            except HTTPException as e:
+                existing = _find_open_alert(patient_user_id, key[1]) if _is_unique_violation(e) else None
+                if existing is None:
+                    raise
+                alert = dict(existing, occurrences=(existing.get("occurrences") or 1) + 1)
+            with _open_alerts_lock:
+                _open_alerts[key] = {
+                    "alert": alert,
+                    "occurrences": alert["occurrences"],
+                    "expires_at": time.monotonic() + ALERT_DEDUP_WINDOW_SECONDS,
+                }
+            if alert["occurrences"] == 1:
+                return alert
+
+    logger.info("Collapsed repeat alert for patient %s (occurrences=%s)", phi(patient_user_id), alert["occurrences"])
+    _persist_alert_occurrences(alert["id"], alert["occurrences"])
+    return alert
+
+
+def _count_alert(row: dict, unacknowledged: bool) -> None:
+    """Add or remove one alert from the counters. Caller holds _counts_lock."""
+    patient_id, alert_id = row.get("patient_id"), row.get("id")
+    alerts = _unacked.get(patient_id, {})
+    if unacknowledged == (alert_id in alerts):
+        return
+    if unacknowledged:
+        severity = row.get("severity")
+        _unacked.setdefault(patient_id, {})[alert_id] = severity
+        delta = 1
+    else:
+        severity = alerts.pop(alert_id)
+        if not alerts:
+            _unacked.pop(patient_id, None)
+        delta = -1
+    for doctor_id in doctors_of(patient_id):
+        if doctor_id in _doctor_unacked:
+            _doctor_unacked[doctor_id][severity] += delta
+
+
+def _index_open_alerts(op: str, rows: list[dict]) -> None:
+    """Mirror other workers' open alerts (and their occurrence counts) into the de-duplication index."""
+    now = time.monotonic()
+    with _open_alerts_lock:
+        for row in rows:
+            if op == "insert" and row.get("dedup_key") and row.get("patient_id") and not row.get("acknowledged"):
+                key = (row["patient_id"], row["dedup_key"])
+                entry = _open_alerts.get(key)
+                if entry is None or entry["expires_at"] <= now:
+                    _open_alerts[key] = {
+                        "alert": row,
+                        "occurrences": row.get("occurrences") or 1,
+                        "expires_at": now + ALERT_DEDUP_WINDOW_SECONDS,
+                    }
+            elif op == "update" and row.get("occurrences"):
+                for entry in _open_alerts.values():
+                    if entry["alert"].get("id") == row.get("id"):
+                        entry["occurrences"] = max(entry["occurrences"], row["occurrences"])
+                        entry["expires_at"] = now + ALERT_DEDUP_WINDOW_SECONDS
+                        break
+
+
+def _on_alerts(op: str, rows: list[dict]) -> None:
+    # An acknowledged alert (on any worker) is closed for de-duplication
+    acknowledged = {row.get("id") for row in rows if op == "update" and row.get("acknowledged")}
+    if acknowledged:
+        _forget_open_alerts(acknowledged)
+    if is_remote():
+        _index_open_alerts(op, rows)
+    with _counts_lock:
+        if _unacked_loaded_at is None:
+            return
+        for row in rows:
+            if op == "delete":
+                _count_alert(row, False)
+            elif "acknowledged" in row and row.get("patient_id"):
+                _count_alert(row, not row["acknowledged"])
+
+
+def _on_links(op: str, rows: list[dict]) -> None:
+    # A patient joining or leaving a panel moves their open alerts into or out of the doctor's counts
+    with _counts_lock:
+        for row in rows:
+            counts = _doctor_unacked.get(row.get("doctor_id"))
+            if counts is None:
+                continue
+            patient_counts = Counter(_unacked.get(row.get("patient_id"), {}).values())
+            if op == "delete":
+                counts.subtract(patient_counts)
+            else:
+                counts.update(patient_counts)
+
+
+def _on_resync() -> None:
+    # Counters reload on next use; the alerts_open_dedup index covers de-duplication meanwhile
+    global _unacked_loaded_at
+    with _counts_lock:
+        _unacked_loaded_at = None
+    with _open_alerts_lock:
+        _open_alerts.clear()
+
+
+subscribe("alerts", _on_alerts)
+subscribe("patient_doctors", _on_links)
+on_resync(_on_resync)
@@ -0,0 +1,389 @@
+"""
+Panel-level risk analytics for providers.
+Each doctor's panel (patients, alerts, timeline events) is loaded once into columnar NumPy arrays
+and then kept current from app.changes notifications, so requests only re-run the vectorized
+aggregation (and only when something changed). A periodic rebuild catches writes made outside app.*.
+Concurrent first requests for a doctor share one build; changes that arrive during it are replayed.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from cachetools import TTLCache
+from fastapi import HTTPException
+
+from app.care_graph import patients_of
+from app.changes import on_resync, subscribe
+from app.supabase import supabase
+
+logger = logging.getLogger(__name__)
+
+RISK_LEVELS = ("low", "medium", "high")
+WEEK_SECONDS = 7 * 24 * 3600
+# Symptom vocabulary kept per panel for the condition x symptom matrix; rarer symptoms are dropped
+TOP_SYMPTOMS = 50
+TOP_SYMPTOMS_PER_CONDITION = 10
+# Full reload from the database, as a safety net for writes that bypass app.*
+PANEL_REBUILD_SECONDS = int(os.getenv("ANALYTICS_REBUILD_SECONDS", "900"))
+# Panels kept in memory at once; the least recently requested is dropped beyond this
+MAX_PANELS = int(os.getenv("ANALYTICS_MAX_PANELS", "256"))
+# Week-over-week windows move with the clock, so results are recomputed at least this often
+RESULT_MAX_AGE_SECONDS = 60
+PAGE_SIZE = 1000
+IN_CHUNK_SIZE = 500
+
+
+def _timestamp(value) -> float:
+    """ISO timestamp string -> epoch seconds (naive values are UTC). NaN when missing/unparseable."""
+    if not value:
+        return float("nan")
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return float("nan")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _chunks(values: list, size: int = IN_CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _fetch_in(table: str, columns: str, column: str, values: list) -> list[dict]:
+    """Select rows where column is in values, chunking the IN list and paging past the row limit."""
+    rows: list[dict] = []
+    for chunk in _chunks(values):
+        offset = 0
+        while True:
+            res = (
+                supabase.table(table)
+                .select(columns)
+                .in_(column, chunk)
+                .order("id")
+                .range(offset, offset + PAGE_SIZE - 1)
+                .execute()
+            )
+            page = res.data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+    return rows
+
+
+class _Columns:
+    """Append-only columnar buffer with amortized O(1) appends and row-id lookup."""
+
+    def __init__(self, dtypes: dict[str, type], capacity: int = 256):
+        self.size = 0
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+        self._columns["alive"] = np.zeros(capacity, dtype=bool)
+        self.positions: dict[str, int] = {}
+
+    def append(self, row_id: str, **values) -> None:
+        if row_id in self.positions:
+            return
+        capacity = len(self._columns["alive"])
+        if self.size == capacity:
+            for name, column in self._columns.items():
+                grown = np.zeros(capacity * 2, dtype=column.dtype)
+                grown[:capacity] = column
+                self._columns[name] = grown
+        for name, value in values.items():
+            self._columns[name][self.size] = value
+        self._columns["alive"][self.size] = True
+        self.positions[row_id] = self.size
+        self.size += 1
+
+    def set(self, row_id: str, name: str, value) -> bool:
+        pos = self.positions.get(row_id)
+        if pos is None:
+            return False
+        self._columns[name][pos] = value
+        return True
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name][:self.size]
+
+
+class _Panel:
+    """Columnar snapshot of one doctor's panel."""
+
+    def __init__(self, doctor_id: str):
+        self.doctor_id = doctor_id
+        self.loaded = False
+        # Held by the one request that builds the panel; others wait for it instead of building again
+        self.build_lock = threading.Lock()
+        self.lock = threading.Lock()
+        # Changes seen while building; replayed once the reads are in
+        self._pending: list[tuple[str, str, dict]] | None = None
+        self.dirty = True
+        self.result: dict | None = None
+        self.result_at = 0.0
+        # patients.user_id and patients.id both map to the patient's row index
+        self.patient_index: dict[str, int] = {}
+        self.risk = np.zeros(0, dtype=np.int8)
+        self.condition_names: list[str] = []
+        self.conditions = np.zeros((0, 0), dtype=bool)
+        self.symptom_codes: dict[str, int] = {}
+        self.symptom_names: list[str] = []
+        self.alerts = _Columns({"patient": np.int32, "created": np.float64, "critical": bool, "acknowledged": bool})
+        self.events = _Columns({"patient": np.int32, "created": np.float64, "symptom": np.int32})
+
+    def load_patients(self, patients: list[dict]) -> None:
+        condition_codes: dict[str, int] = {}
+        pairs = []
+        self.risk = np.zeros(len(patients), dtype=np.int8)
+        for i, p in enumerate(patients):
+            for key in (p.get("id"), p.get("user_id")):
+                if key:
+                    self.patient_index[key] = i
+            level = p.get("risk_level") or "low"
+            self.risk[i] = RISK_LEVELS.index(level) if level in RISK_LEVELS else 0
+            for condition in p.get("conditions") or []:
+                name = str(condition).strip().lower()
+                if name:
+                    pairs.append((i, condition_codes.setdefault(name, len(condition_codes))))
+        self.condition_names = list(condition_codes)
+        self.conditions = np.zeros((len(patients), len(condition_codes)), dtype=bool)
+        if pairs:
+            rows, cols = np.array(pairs, dtype=np.int64).T
+            self.conditions[rows, cols] = True
+
+    def add_alert(self, row: dict) -> None:
+        i = self.patient_index.get(row.get("patient_id"))
+        if i is None or not row.get("id"):
+            return
+        self.alerts.append(
+            row["id"],
+            patient=i,
+            created=_timestamp(row.get("created_at")),
+            critical=row.get("severity") == "critical",
+            acknowledged=bool(row.get("acknowledged")),
+        )
+        self.dirty = True
+
+    def add_event(self, row: dict) -> None:
+        i = self.patient_index.get(row.get("patient_id"))
+        if i is None or not row.get("id"):
+            return
+        symptom = -1
+        if row.get("type") == "symptom":
+            name = str(row.get("title") or "").strip().lower()
+            if name not in self.symptom_codes:
+                self.symptom_codes[name] = len(self.symptom_names)
+                self.symptom_names.append(name)
+            symptom = self.symptom_codes[name]
+        self.events.append(row["id"], patient=i, created=_timestamp(row.get("created_at")), symptom=symptom)
+        self.dirty = True
+
+    def _apply(self, table: str, op: str, row: dict) -> None:
+        if table == "alerts":
+            if op == "insert":
+                self.add_alert(row)
+            elif op == "update" and "acknowledged" in row:
+                if self.alerts.set(row.get("id"), "acknowledged", bool(row["acknowledged"])):
+                    self.dirty = True
+            elif op == "delete" and self.alerts.set(row.get("id"), "alive", False):
+                self.dirty = True
+        elif table == "timeline_events":
+            if op == "insert":
+                self.add_event(row)
+            elif op == "delete" and self.events.set(row.get("id"), "alive", False):
+                self.dirty = True
+        elif table == "patients":
+            i = self.patient_index.get(row.get("id"))
+            level = row.get("risk_level")
+            if op == "update" and i is not None and level in RISK_LEVELS:
+                self.risk[i] = RISK_LEVELS.index(level)
+                self.dirty = True
+
+    def apply(self, table: str, op: str, row: dict) -> None:
+        with self.lock:
+            if self._pending is not None:
+                self._pending.append((table, op, row))
+            elif self.loaded:
+                self._apply(table, op, row)
+
+    def load(self) -> None:
+        with self.lock:
+            self._pending = []
+        try:
+            patient_keys = list(patients_of(self.doctor_id))
+            patients = _fetch_in("patients", "id, user_id, risk_level, conditions", "user_id", patient_keys)
+            patient_ids = [p["id"] for p in patients]
+            # alerts.patient_id may hold either identifier depending on the writer
+            alert_keys = list(dict.fromkeys(patient_keys + patient_ids))
+            alerts = _fetch_in("alerts", "id, patient_id, severity, acknowledged, created_at", "patient_id", alert_keys)
+            events = _fetch_in("timeline_events", "id, patient_id, type, title, created_at", "patient_id", patient_ids)
+        except BaseException:
+            with self.lock:
+                self._pending = None
+            raise
+        with self.lock:
+            self.load_patients(patients)
+            for row in alerts:
+                self.add_alert(row)
+            for row in events:
+                self.add_event(row)
+            for table, op, row in self._pending:
+                self._apply(table, op, row)
+            self._pending = None
+            self.loaded = True
+        logger.info(
+            "Built analytics panel for doctor %s: %d patients, %d alerts, %d events",
+            self.doctor_id, len(patients), self.alerts.size, self.events.size,
+        )
+
+
+def _week_over_week(created: np.ndarray, now: float) -> dict:
+    current = int(np.count_nonzero(created >= now - WEEK_SECONDS))
+    previous = int(np.count_nonzero((created >= now - 2 * WEEK_SECONDS) & (created < now - WEEK_SECONDS)))
+    change = round((current - previous) / previous, 4) if previous else None
+    return {"current": current, "previous": previous, "change": change}
+
+
+def _compute(panel: _Panel, now: float) -> dict:
+    n = len(panel.risk)
+    risk_counts = np.bincount(panel.risk, minlength=len(RISK_LEVELS))
+
+    a_alive = panel.alerts["alive"]
+    a_patient = panel.alerts["patient"][a_alive]
+    a_created = panel.alerts["created"][a_alive]
+    a_unacknowledged = ~panel.alerts["acknowledged"][a_alive]
+    recent_alerts = a_created >= now - WEEK_SECONDS
+    patients_alerted_7d = int(np.unique(a_patient[recent_alerts]).size)
+
+    alive = panel.events["alive"]
+    symptom = panel.events["symptom"]
+    is_symptom = alive & (symptom >= 0)
+    s_codes = symptom[is_symptom]
+    s_patients = panel.events["patient"][is_symptom]
+    s_created = panel.events["created"][is_symptom]
+
+    # Condition x symptom counts: (conditions^T) @ (patient x symptom counts), over the top symptoms
+    condition_symptoms: dict[str, list[dict]] = {}
+    if s_codes.size and panel.condition_names:
+        totals = np.bincount(s_codes, minlength=len(panel.symptom_names))
+        top = np.argsort(-totals, kind="stable")[:TOP_SYMPTOMS]
+        top = top[totals[top] > 0]
+        lookup = np.full(len(panel.symptom_names), -1, dtype=np.int64)
+        lookup[top] = np.arange(top.size)
+        mapped = lookup[s_codes]
+        keep = mapped >= 0
+        k = top.size
+        per_patient = np.bincount(s_patients[keep].astype(np.int64) * k + mapped[keep], minlength=n * k).reshape(n, k)
+        matrix = panel.conditions.T.astype(np.int64) @ per_patient
+        for c, name in enumerate(panel.condition_names):
+            row = matrix[c]
+            order = np.argsort(-row, kind="stable")[:TOP_SYMPTOMS_PER_CONDITION]
+            condition_symptoms[name] = [
+                {"symptom": panel.symptom_names[top[j]], "count": int(row[j])} for j in order if row[j] > 0
+            ]
+
+    return {
+        "doctorId": panel.doctor_id,
+        "patients": n,
+        "riskDistribution": {level: int(risk_counts[i]) for i, level in enumerate(RISK_LEVELS)},
+        "alerts": {
+            "total": int(a_patient.size),
+            "unacknowledged": int(np.count_nonzero(a_unacknowledged)),
+            "critical": int(np.count_nonzero(panel.alerts["critical"][a_alive])),
+            "perPatient": round(a_patient.size / n, 4) if n else 0.0,
+            "patientsAlerted7d": patients_alerted_7d,
+            "patientAlertRate7d": round(patients_alerted_7d / n, 4) if n else 0.0,
+        },
+        "conditionSymptoms": condition_symptoms,
+        "weekOverWeek": {
+            "alerts": _week_over_week(a_created, now),
+            "symptoms": _week_over_week(s_created, now),
+        },
+        "generatedAt": datetime.fromtimestamp(now, tz=timezone.utc).isoformat(),
+    }
+
+
+# doctor_id -> panel; entries expire PANEL_REBUILD_SECONDS after they were built (then rebuilt on demand)
+_panels: TTLCache = TTLCache(maxsize=MAX_PANELS, ttl=PANEL_REBUILD_SECONDS)
+_panels_lock = threading.Lock()
+
+
+def _panels_for(patient_key) -> list[_Panel]:
+    """Panels the patient belongs to, plus any still building (they queue every change)."""
+    with _panels_lock:
+        panels = list(_panels.values())
+    return [p for p in panels if not p.loaded or patient_key in p.patient_index]
+
+
+def get_panel_analytics(doctor_id: str) -> dict:
+    """
+    Risk distribution, alert rates, per-condition symptom frequencies and week-over-week changes
+    across every patient linked to doctor_id (doctor user_id, as stored in patient_doctors).
+    """
+    try:
+        with _panels_lock:
+            panel = _panels.get(doctor_id)
+            if panel is None:
+                panel = _panels[doctor_id] = _Panel(doctor_id)
+        with panel.build_lock:
+            if not panel.loaded:
+                panel.load()
+        now = time.time()
+        with panel.lock:
+            if panel.dirty or panel.result is None or now - panel.result_at > RESULT_MAX_AGE_SECONDS:
+                panel.result = _compute(panel, now)
+                panel.result_at = now
+                panel.dirty = False
+            return panel.result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to compute panel analytics for doctor %s: %s", doctor_id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- incremental refresh from app.* writes ---
+
+
+def _on_alerts(op: str, rows: list[dict]) -> None:
+    for row in rows:
+        for panel in _panels_for(row.get("patient_id")):
+            panel.apply("alerts", op, row)
+
+
+def _on_timeline(op: str, rows: list[dict]) -> None:
+    for row in rows:
+        for panel in _panels_for(row.get("patient_id")):
+            panel.apply("timeline_events", op, row)
+
+
+def _on_patients(op: str, rows: list[dict]) -> None:
+    for row in rows:
+        if op != "update" or row.get("risk_level") not in RISK_LEVELS:
+            continue
+        for panel in _panels_for(row.get("id")):
+            panel.apply("patients", op, row)
+
+
+def _on_links(op: str, rows: list[dict]) -> None:
+    # Panel membership changed: drop the panel so the next request rebuilds it
+    with _panels_lock:
+        for row in rows:
+            _panels.pop(row.get("doctor_id"), None)
+
+
+def _on_resync() -> None:
+    with _panels_lock:
+        _panels.clear()
+
+
+subscribe("alerts", _on_alerts)
+subscribe("timeline_events", _on_timeline)
+subscribe("patients", _on_patients)
+subscribe("patient_doctors", _on_links)
+on_resync(_on_resync)
@@ -0,0 +1,103 @@
+"""
+Per-request bearer authentication with locally verified Supabase JWTs.
+Tokens signed with HS256 are checked against SUPABASE_JWT_SECRET; asymmetric ones (RS256/ES256)
+against the project's JWKS, fetched once and refreshed every JWKS_REFRESH_SECONDS (or when an
+unknown key id appears). No call to the auth server is made per request.
+"""
+
+import logging
+import os
+
+import jwt
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_REFRESH_SECONDS = int(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+# Clock skew tolerated on exp / iat
+JWT_LEEWAY_SECONDS = 30
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+_bearer = HTTPBearer(auto_error=False)
+_jwks_client: jwt.PyJWKClient | None = None
+
+
+class AuthUser:
+    """The verified caller. role is the app role from user_metadata ('patient' / 'doctor'), if set."""
+
+    def __init__(self, claims: dict):
+        self.claims = claims
+        self.id: str = claims["sub"]
+        self.email: str | None = claims.get("email")
+        self.role: str | None = (claims.get("user_metadata") or {}).get("role")
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "email": self.email, "role": self.role}
+
+
+def _get_jwks_client() -> jwt.PyJWKClient:
+    global _jwks_client
+    if _jwks_client is None:
+        if not SUPABASE_URL:
+            raise HTTPException(status_code=500, detail="SUPABASE_URL is required to verify asymmetric tokens")
+        _jwks_client = jwt.PyJWKClient(
+            f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json",
+            cache_keys=True,
+            lifespan=JWKS_REFRESH_SECONDS,
+            timeout=5,
+        )
+    return _jwks_client
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def verify_token(token: str) -> AuthUser:
+    """Verify signature, expiry and audience locally. Raises HTTPException 401 on any invalid token."""
+    try:
+        algorithm = jwt.get_unverified_header(token).get("alg")
+        if algorithm == "HS256":
+            if not SUPABASE_JWT_SECRET:
+                raise _unauthorized("HS256 tokens are not accepted (SUPABASE_JWT_SECRET is not set)")
+            key, algorithms = SUPABASE_JWT_SECRET, ["HS256"]
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key, algorithms = _get_jwks_client().get_signing_key_from_jwt(token).key, [algorithm]
+        else:
+            raise _unauthorized(f"Unsupported token algorithm: {algorithm}")
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience=JWT_AUDIENCE,
+            leeway=JWT_LEEWAY_SECONDS,
+            options={"require": ["sub", "exp"]},
+        )
+    except HTTPException:
+        raise
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized("Token expired")
+    except jwt.PyJWKClientError as e:
+        logger.error("Could not load JWKS signing key: %s", e)
+        raise _unauthorized("Unknown signing key")
+    except jwt.InvalidTokenError as e:
+        raise _unauthorized(f"Invalid token: {e}")
+    return AuthUser(claims)
+
+
+def optional_user(credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)) -> AuthUser | None:
+    """FastAPI dependency: the verified user, None without an Authorization header, 401 if the token is bad."""
+    if credentials is None:
+        return None
+    return verify_token(credentials.credentials)
+
+
+def require_user(user: AuthUser | None = Depends(optional_user)) -> AuthUser:
+    """FastAPI dependency: 401 unless the request carries a valid bearer token."""
+    if user is None:
+        raise _unauthorized("Missing bearer token")
+    return user
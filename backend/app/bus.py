@@ -0,0 +1,299 @@
+"""
+Cross-process change bus for multi-worker deployments.
+Every local app.changes write is published to the other workers, which replay it through
+app.changes.deliver_remote, so caches, indexes and ETag versions stay coherent on every worker.
+
+INVALIDATION_BUS selects the transport:
+- unix:///path/to/dir  each worker binds a datagram socket in dir and sends to every peer socket
+                       found there (no broker; one box). Default when main runs with WEB_CONCURRENCY > 1.
+- redis://host:port/db Redis pub/sub (pip install redis), for a local broker or several boxes.
+- empty                single-process mode, nothing is published.
+
+Writers only encode and enqueue; a sender thread publishes, so a slow peer or broker never holds up
+a request (beyond SEND_QUEUE_SIZE queued messages, new ones are dropped).
+Delivery is best effort, so losses are detected rather than assumed away: each message carries a
+per-worker sequence number, and a receiver that sees a gap (or a Redis bus that had to reconnect)
+calls app.changes.resync(), which bumps every ETag and has the in-memory caches and indexes reload
+from the database. A loss is noticed when the next message from that worker arrives; the periodic
+rebuilds (care graph, search index, alert counters) bound staleness if none does.
+"""
+
+import logging
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+import orjson
+
+from app.changes import add_forwarder, deliver_remote, resync
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UNIX_BUS = f"unix://{tempfile.gettempdir()}/carebridge-bus"
+# Larger batches are split across several datagrams
+MAX_MESSAGE_BYTES = 64 * 1024
+SEND_TIMEOUT_SECONDS = 0.5
+SEND_QUEUE_SIZE = 10000
+# The unix transport rescans its directory for peers at most this often
+PEER_REFRESH_SECONDS = 2.0
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+# Back-to-back gaps are coalesced into one resync per interval
+RESYNC_MIN_INTERVAL_SECONDS = 1.0
+REDIS_CHANNEL = "carebridge:changes"
+
+_instance_id = uuid.uuid4().hex
+_bus = None
+_send_queue: queue.Queue = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+_seq = 0
+_seq_lock = threading.Lock()
+# origin -> last sequence number received (only touched by the receive thread)
+_last_seq: dict[str, int] = {}
+_last_resync = 0.0
+_resync_timer: threading.Timer | None = None
+_resync_lock = threading.Lock()
+_stats = {"dropped": 0, "gaps": 0, "resyncs": 0}
+
+
+def _encode(table: str, op: str, rows: list[dict]) -> list[bytes]:
+    """One message body per batch of rows, halving the batch until each fits MAX_MESSAGE_BYTES."""
+    body = orjson.dumps({"table": table, "op": op, "rows": rows}, default=str)
+    if len(body) <= MAX_MESSAGE_BYTES or len(rows) <= 1:
+        return [body]
+    middle = len(rows) // 2
+    return _encode(table, op, rows[:middle]) + _encode(table, op, rows[middle:])
+
+
+def _resync_now() -> None:
+    global _last_resync, _resync_timer
+    with _resync_lock:
+        _last_resync = time.monotonic()
+        _resync_timer = None
+    _stats["resyncs"] += 1
+    logger.warning("Change bus lost messages; resyncing caches and indexes")
+    resync()
+
+
+def _request_resync() -> None:
+    """Resync now, or once RESYNC_MIN_INTERVAL_SECONDS after the last one if that was very recent."""
+    global _resync_timer
+    with _resync_lock:
+        if _resync_timer is not None:
+            return
+        wait = _last_resync + RESYNC_MIN_INTERVAL_SECONDS - time.monotonic()
+        if wait > 0:
+            _resync_timer = threading.Timer(wait, _resync_now)
+            _resync_timer.daemon = True
+            _resync_timer.start()
+            return
+    _resync_now()
+
+
+def _receive(message: bytes) -> None:
+    try:
+        change = orjson.loads(message)
+    except orjson.JSONDecodeError as e:
+        logger.error("Dropped malformed bus message: %s", e)
+        return
+    origin = change.get("origin")
+    if origin == _instance_id:
+        return
+    seq = change.get("seq")
+    last = _last_seq.get(origin)
+    if seq is not None:
+        _last_seq[origin] = seq
+    deliver_remote(change["table"], change["op"], change["rows"])
+    if seq is not None and last is not None and seq != last + 1:
+        _stats["gaps"] += 1
+        _request_resync()
+
+
+def _send_loop() -> None:
+    while True:
+        message = _send_queue.get()
+        try:
+            _bus.publish(message)
+        except Exception as e:
+            logger.error("Bus publish failed: %s", e)
+
+
+class UnixSocketBus:
+    """Peer-to-peer datagrams between workers sharing a directory of sockets."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{os.getpid()}-{_instance_id[:8]}.sock")
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send_sock.settimeout(SEND_TIMEOUT_SECONDS)
+        self._peer_paths: list[str] = []
+        self._peers_at = 0.0
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+
+    def _peers(self) -> list[str]:
+        """Peer sockets, rescanned at most every PEER_REFRESH_SECONDS. Only the sender thread calls this."""
+        now = time.monotonic()
+        if now - self._peers_at >= PEER_REFRESH_SECONDS:
+            self._peer_paths = [
+                entry.path
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".sock") and entry.path != self.path
+            ]
+            self._peers_at = now
+        return self._peer_paths
+
+    def publish(self, message: bytes) -> None:
+        for peer in list(self._peers()):
+            try:
+                self._send_sock.sendto(message, peer)
+                self.sent += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a worker that exited
+                self._peer_paths.remove(peer)
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except OSError as e:
+                # The peer notices the missing sequence number and resyncs
+                self.errors += 1
+                logger.error("Bus send to %s failed: %s", peer, e)
+
+    def run(self) -> None:
+        while True:
+            try:
+                message = self._sock.recv(MAX_MESSAGE_BYTES * 4)
+            except OSError:
+                return  # closed
+            self.received += 1
+            _receive(message)
+
+    def close(self) -> None:
+        self._sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {"transport": "unix", "path": self.path, "peers": len(self._peer_paths), "sent": self.sent, "received": self.received, "errors": self.errors}
+
+
+class RedisBus:
+    """
+    Redis pub/sub; messages from this worker are ignored on receipt. The subscriber reconnects with
+    exponential backoff, and resyncs afterwards since pub/sub does not replay what it missed.
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._closed = False
+        self._subscribe()
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.reconnects = 0
+
+    def _subscribe(self) -> None:
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(REDIS_CHANNEL)
+
+    def publish(self, message: bytes) -> None:
+        try:
+            self._client.publish(REDIS_CHANNEL, message)
+            self.sent += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error("Bus publish failed: %s", e)
+
+    def run(self) -> None:
+        backoff = RECONNECT_MIN_SECONDS
+        while not self._closed:
+            try:
+                if self._pubsub is None:
+                    self._subscribe()
+                    self.reconnects += 1
+                    logger.info("Reconnected to change bus")
+                    _last_seq.clear()
+                    _request_resync()
+                for item in self._pubsub.listen():
+                    backoff = RECONNECT_MIN_SECONDS
+                    self.received += 1
+                    _receive(item["data"])
+            except Exception as e:
+                if self._closed:
+                    return
+                self.errors += 1
+                logger.error("Change bus connection lost: %s; reconnecting in %gs", e, backoff)
+                try:
+                    self._pubsub.close()
+                except Exception:
+                    pass
+                self._pubsub = None
+                time.sleep(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+    def close(self) -> None:
+        self._closed = True
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+    def stats(self) -> dict:
+        return {"transport": "redis", "sent": self.sent, "received": self.received, "errors": self.errors, "reconnects": self.reconnects}
+
+
+def _forward(table: str, op: str, rows: list[dict]) -> None:
+    global _seq
+    origin = orjson.dumps(_instance_id)
+    for body in _encode(table, op, rows):
+        # Numbered and queued together, so the queue order matches the sequence receivers check
+        with _seq_lock:
+            _seq += 1
+            message = b'{"origin":' + origin + b',"seq":' + str(_seq).encode() + b"," + body[1:]
+            try:
+                _send_queue.put_nowait(message)
+            except queue.Full:
+                # Receivers see the skipped sequence number and resync
+                _stats["dropped"] += 1
+
+
+def start_bus(url: str | None = None) -> None:
+    """Join the bus named by url (default: INVALIDATION_BUS). No-op when unset or already started."""
+    global _bus
+    url = url if url is not None else os.getenv("INVALIDATION_BUS", "")
+    if not url or _bus is not None:
+        return
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        _bus = UnixSocketBus(parsed.path)
+    elif parsed.scheme in ("redis", "rediss"):
+        _bus = RedisBus(url)
+    else:
+        raise ValueError(f"Unknown INVALIDATION_BUS: {url} (expected unix:///dir or redis://host)")
+    threading.Thread(target=_bus.run, name="change-bus", daemon=True).start()
+    threading.Thread(target=_send_loop, name="change-bus-send", daemon=True).start()
+    add_forwarder(_forward)
+    logger.info("Joined change bus %s", url)
+
+
+def stop_bus() -> None:
+    if _bus is not None:
+        _bus.close()
+
+
+def get_bus_stats() -> dict | None:
+    if _bus is None:
+        return None
+    return {**_bus.stats(), "queued": _send_queue.qsize(), **_stats}
@@ -0,0 +1,102 @@
+"""
+In-process read-through caches.
+Thin wrapper over cachetools.TTLCache with a loader, bulk loads, invalidation and hit-rate stats.
+Every cache registers itself by name so admin routes can report on all of them.
+"""
+
+import threading
+from typing import Any, Callable, Hashable, Iterable
+
+from cachetools import TTLCache
+
+_registry: dict[str, "ReadThroughCache"] = {}
+
+
+class ReadThroughCache:
+    """
+    TTL cache that loads missing keys through a loader function.
+    Loader exceptions propagate and nothing is cached for that key.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300):
+        self.name = name
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        _registry[name] = self
+
+    def get(self, key: Hashable, loader: Callable[[Hashable], Any]) -> Any:
+        """Return the cached value for key, calling loader(key) and caching the result on a miss."""
+        with self._lock:
+            try:
+                value = self._cache[key]
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+        value = loader(key)
+        with self._lock:
+            self._cache[key] = value
+        return value
+
+    def get_many(
+        self,
+        keys: Iterable[Hashable],
+        bulk_loader: Callable[[list], dict],
+    ) -> dict:
+        """
+        Return {key: value} for keys. Misses are loaded with a single bulk_loader(missing_keys) call,
+        which returns {key: value}; keys it leaves out are treated as not found and not cached.
+        """
+        found: dict = {}
+        missing: list = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                try:
+                    found[key] = self._cache[key]
+                    self.hits += 1
+                except KeyError:
+                    missing.append(key)
+                    self.misses += 1
+        if missing:
+            loaded = bulk_loader(missing)
+            with self._lock:
+                for key, value in loaded.items():
+                    self._cache[key] = value
+            found.update(loaded)
+        return found
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def get_cache_stats() -> list[dict]:
+    """Stats for every registered cache."""
+    return [cache.stats() for cache in _registry.values()]
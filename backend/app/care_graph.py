@@ -0,0 +1,139 @@
+"""
+Care graph: which patients are linked to which doctors (public.patient_doctors), held in memory.
+Bidirectional adjacency sets are loaded at startup and kept current from the app.changes
+notifications that connect_patient_doctor / disconnect_patient_doctor send (app.bus replays them
+from other workers), so scoping and authorization checks never query patient_doctors.
+Both sides store user_ids, as patient_doctors does. A background reload every
+CARE_GRAPH_REBUILD_SECONDS catches links written outside app.*.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from app.changes import on_resync, subscribe
+from app.export import paged_links
+
+logger = logging.getLogger(__name__)
+
+CARE_GRAPH_REBUILD_SECONDS = int(os.getenv("CARE_GRAPH_REBUILD_SECONDS", "900"))
+
+_EMPTY: frozenset = frozenset()
+
+# Sets are replaced, never mutated, so readers can return them without copying or locking
+_patients_of: dict[str, frozenset] = {}
+_doctors_of: dict[str, frozenset] = {}
+_loaded_at: float | None = None
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+# Changes seen while a load is scanning; replayed onto the fresh graph before it is swapped in
+_pending: list[tuple[str, dict]] | None = None
+_reloading = False
+
+
+def _apply(patients_of: dict, doctors_of: dict, op: str, row: dict) -> None:
+    patient_id, doctor_id = row.get("patient_id"), row.get("doctor_id")
+    if not patient_id or not doctor_id:
+        return
+    if op == "delete":
+        patients_of[doctor_id] = patients_of.get(doctor_id, _EMPTY) - {patient_id}
+        doctors_of[patient_id] = doctors_of.get(patient_id, _EMPTY) - {doctor_id}
+    else:
+        patients_of[doctor_id] = patients_of.get(doctor_id, _EMPTY) | {patient_id}
+        doctors_of[patient_id] = doctors_of.get(patient_id, _EMPTY) | {doctor_id}
+
+
+def load() -> None:
+    """(Re)load every link from the database. Called at startup and by the periodic reload."""
+    global _patients_of, _doctors_of, _loaded_at, _pending
+    with _load_lock:
+        with _lock:
+            _pending = []
+        patients_of: dict[str, set] = {}
+        doctors_of: dict[str, set] = {}
+        links = 0
+        try:
+            for row in paged_links():
+                patients_of.setdefault(row["doctor_id"], set()).add(row["patient_id"])
+                doctors_of.setdefault(row["patient_id"], set()).add(row["doctor_id"])
+                links += 1
+        except BaseException:
+            with _lock:
+                _pending = None
+            raise
+        patients_of = {k: frozenset(v) for k, v in patients_of.items()}
+        doctors_of = {k: frozenset(v) for k, v in doctors_of.items()}
+        with _lock:
+            for op, row in _pending:
+                _apply(patients_of, doctors_of, op, row)
+            _pending = None
+            _patients_of, _doctors_of = patients_of, doctors_of
+            _loaded_at = time.monotonic()
+    logger.info("Loaded care graph: %d links, %d doctors, %d patients", links, len(patients_of), len(doctors_of))
+
+
+def _reload_in_background() -> None:
+    global _reloading
+    try:
+        load()
+    except Exception as e:
+        logger.error("Care graph reload failed: %s", e)
+    finally:
+        _reloading = False
+
+
+def _ensure_loaded() -> None:
+    global _reloading
+    if _loaded_at is None:
+        load()
+    elif time.monotonic() - _loaded_at > CARE_GRAPH_REBUILD_SECONDS and not _reloading:
+        # Stale: keep serving the current graph while a fresh one loads
+        _reloading = True
+        threading.Thread(target=_reload_in_background, name="care-graph-reload", daemon=True).start()
+
+
+def patients_of(doctor_id: str) -> frozenset:
+    """user_ids of the patients linked to doctor_id (empty if none)."""
+    _ensure_loaded()
+    return _patients_of.get(doctor_id, _EMPTY)
+
+
+def doctors_of(patient_id: str) -> frozenset:
+    """user_ids of the doctors linked to patient_id (empty if none)."""
+    _ensure_loaded()
+    return _doctors_of.get(patient_id, _EMPTY)
+
+
+def is_linked(patient_id: str, doctor_id: str) -> bool:
+    _ensure_loaded()
+    return patient_id in _patients_of.get(doctor_id, _EMPTY)
+
+
+def get_care_graph_stats() -> dict:
+    return {
+        "doctors": len(_patients_of),
+        "patients": len(_doctors_of),
+        "links": sum(len(p) for p in _patients_of.values()),
+        "loadedSecondsAgo": round(time.monotonic() - _loaded_at, 1) if _loaded_at is not None else None,
+    }
+
+
+def _on_links(op: str, rows: list[dict]) -> None:
+    with _lock:
+        for row in rows:
+            _apply(_patients_of, _doctors_of, op, row)
+            if _pending is not None:
+                _pending.append((op, row))
+
+
+def _on_resync() -> None:
+    # Keep serving the current graph while a fresh one loads
+    global _reloading
+    if _loaded_at is not None and not _reloading:
+        _reloading = True
+        threading.Thread(target=_reload_in_background, name="care-graph-reload", daemon=True).start()
+
+
+subscribe("patient_doctors", _on_links)
+on_resync(_on_resync)
@@ -0,0 +1,105 @@
+"""
+In-process change notifications for writes made through app.* modules.
+Write functions call notify(table, op, rows) after a successful write; derived state
+(analytics, indexes, caches) subscribes and updates incrementally instead of re-querying.
+Handlers run synchronously on the writer's thread, so they must be cheap; errors are logged, never raised.
+Every notify also bumps a per-table version counter, which read endpoints use as a cheap ETag.
+In multi-worker mode app.bus forwards each local change to the other workers, which replay it
+through deliver_remote; handlers with side effects (e.g. writes) check is_remote() and skip them.
+When the bus may have lost messages, resync() bumps every ETag and asks each on_resync handler
+to drop or reload its derived state.
+"""
+
+import logging
+import threading
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# op is "insert", "update" or "delete"; rows are the affected rows as returned by the database
+Handler = Callable[[str, list[dict]], None]
+Forwarder = Callable[[str, str, list[dict]], None]
+ResyncHandler = Callable[[], None]
+
+_subscribers: dict[str, list[Handler]] = {}
+_forwarders: list[Forwarder] = []
+_resync_handlers: list[ResyncHandler] = []
+_resyncs = 0
+_versions: dict[str, int] = {}
+_versions_lock = threading.Lock()
+_delivery = threading.local()
+
+
+def subscribe(table: str, handler: Handler) -> None:
+    """Call handler(op, rows) after every write to table, in this process or (via app.bus) another worker."""
+    _subscribers.setdefault(table, []).append(handler)
+
+
+def add_forwarder(forwarder: Forwarder) -> None:
+    """Call forwarder(table, op, rows) after every local write (used by app.bus)."""
+    _forwarders.append(forwarder)
+
+
+def on_resync(handler: ResyncHandler) -> None:
+    """Call handler() when this worker may have missed other workers' changes (see resync)."""
+    _resync_handlers.append(handler)
+
+
+def _deliver(table: str, op: str, rows: list[dict]) -> None:
+    with _versions_lock:
+        _versions[table] = _versions.get(table, 0) + 1
+    for handler in _subscribers.get(table, ()):
+        try:
+            handler(op, rows)
+        except Exception as e:
+            logger.error("Change handler %s failed for %s.%s: %s", getattr(handler, "__name__", handler), table, op, e, exc_info=True)
+
+
+def notify(table: str, op: str, rows: list[dict] | None) -> None:
+    """Report a completed write. rows may be empty when the database returned nothing."""
+    rows = rows or []
+    _deliver(table, op, rows)
+    for forward in _forwarders:
+        try:
+            forward(table, op, rows)
+        except Exception as e:
+            logger.error("Failed to forward %s.%s change: %s", table, op, e)
+
+
+def deliver_remote(table: str, op: str, rows: list[dict]) -> None:
+    """Replay a write made by another worker to this process's handlers."""
+    _delivery.remote = True
+    try:
+        _deliver(table, op, rows)
+    finally:
+        _delivery.remote = False
+
+
+def is_remote() -> bool:
+    """True while handlers are running for another worker's write."""
+    return getattr(_delivery, "remote", False)
+
+
+def version(table: str) -> int:
+    """Number of writes to table seen by this process (its own and, in multi-worker mode, its peers')."""
+    return _versions.get(table, 0)
+
+
+def generation() -> int:
+    """Number of resyncs in this process; part of every ETag, so a resync invalidates them all."""
+    return _resyncs
+
+
+def resync() -> None:
+    """
+    Recover from lost change notifications (app.bus detected a gap or reconnected): bump every
+    ETag and let derived state reload from the database. Handlers must not block on that reload.
+    """
+    global _resyncs
+    with _versions_lock:
+        _resyncs += 1
+    for handler in _resync_handlers:
+        try:
+            handler()
+        except Exception as e:
+            logger.error("Resync handler %s failed: %s", getattr(handler, "__name__", handler), e, exc_info=True)
@@ -0,0 +1,255 @@
+"""
+Server-side chat sessions.
+The client opens a session once and then sends only each new user message; the history lives here
+in a bounded in-memory store (LRU over sessions, capped messages per session, idle expiry).
+Messages are persisted to public.messages by a background writer in batched multi-row inserts.
+Each session also keeps a rolling summary: after every turn, a background update folds only the new
+messages into it (app.cohere_chat.update_summary), so ending the call does not wait on a full summary.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from app.changes import notify
+from app.cohere_chat import update_summary
+from app.supabase import supabase
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+MAX_SESSION_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "200"))
+SESSION_IDLE_SECONDS = int(os.getenv("CHAT_SESSION_IDLE_SECONDS", "3600"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("CHAT_MESSAGE_FLUSH_SECONDS", "1.0"))
+FLUSH_BATCH_SIZE = 100
+SUMMARY_WORKERS = int(os.getenv("CHAT_SUMMARY_WORKERS", "4"))
+# How long ending a call waits for a summary update that is still running
+SUMMARY_WAIT_SECONDS = float(os.getenv("CHAT_SUMMARY_WAIT_SECONDS", "3"))
+
+
+class ChatSession:
+    """One conversation: who it is with, the system prompt built at open time, and recent messages."""
+
+    def __init__(self, patient_id: str | None, resolved_patient_id: str | None, system_prompt: str):
+        self.id = str(uuid.uuid4())
+        self.patient_id = patient_id
+        self.resolved_patient_id = resolved_patient_id
+        self.system_prompt = system_prompt
+        self.messages: deque = deque(maxlen=MAX_SESSION_MESSAGES)
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+        # Messages ever appended; the deque drops the oldest past MAX_SESSION_MESSAGES
+        self.appended = 0
+        # Rolling summary of the first `summarized` messages; at most one update runs at a time
+        self.summary: str | None = None
+        self.summarized = 0
+        self.summarizing = False
+        self.summary_idle = threading.Condition(self.lock)
+
+    def history(self) -> list[dict]:
+        """Copy of the in-memory history as a list of {"role", "content"}."""
+        with self.lock:
+            return list(self.messages)
+
+    def _append(self, message: dict) -> None:
+        with self.lock:
+            self.messages.append(message)
+            self.appended += 1
+
+    def _unsummarized(self) -> list[dict]:
+        """Messages appended since the summary was last updated (caller holds lock)."""
+        missing = self.appended - self.summarized
+        return list(self.messages)[-missing:] if missing > 0 else []
+
+
+_sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+_sessions_lock = threading.Lock()
+
+_pending: queue.Queue = queue.Queue()
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+_timestamp_lock = threading.Lock()
+_last_timestamp = datetime.min.replace(tzinfo=timezone.utc)
+
+_summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="chat-summary")
+
+
+def open_session(
+    patient_id: str | None,
+    resolved_patient_id: str | None,
+    system_prompt: str,
+    initial_messages: list[dict] | None = None,
+    resume: bool = False,
+) -> ChatSession:
+    """
+    Create a session. initial_messages (e.g. the greeting already shown to the user) seed the history
+    and are persisted like any other message, unless resume is set: the client is re-opening a
+    conversation whose messages were already stored (expired session, or another worker's session).
+    Evicts the least recently used session when full.
+    """
+    session = ChatSession(patient_id, resolved_patient_id, system_prompt)
+    with _sessions_lock:
+        _sessions[session.id] = session
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    for message in initial_messages or []:
+        if resume:
+            session._append({"role": message["role"], "content": message["content"]})
+        else:
+            append_message(session, message["role"], message["content"])
+    return session
+
+
+def get_session(session_id: str) -> ChatSession | None:
+    """Return the session (marking it recently used) or None if unknown or idle for too long."""
+    now = time.monotonic()
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            return None
+        if now - session.last_active > SESSION_IDLE_SECONDS:
+            del _sessions[session_id]
+            return None
+        session.last_active = now
+        _sessions.move_to_end(session_id)
+        return session
+
+
+def close_session(session_id: str) -> None:
+    with _sessions_lock:
+        _sessions.pop(session_id, None)
+
+
+def _message_timestamp() -> str:
+    """
+    UTC append time with microsecond precision, strictly increasing across calls. The batched insert
+    would otherwise give every row in a batch the same now(), losing the order of the conversation.
+    """
+    global _last_timestamp
+    with _timestamp_lock:
+        stamp = max(datetime.now(timezone.utc), _last_timestamp + timedelta(microseconds=1))
+        _last_timestamp = stamp
+    return stamp.isoformat(timespec="microseconds")
+
+
+def append_message(session: ChatSession, role: str, content: str) -> None:
+    """Add a message to the session history and queue it for persistence."""
+    session._append({"role": role, "content": content})
+    session.last_active = time.monotonic()
+    if session.resolved_patient_id and role in ("user", "assistant") and content:
+        _ensure_writer()
+        _pending.put({
+            "patient_id": session.resolved_patient_id,
+            "role": role,
+            "content": content,
+            "created_at": _message_timestamp(),
+        })
+
+
+def schedule_summary(session: ChatSession) -> None:
+    """Fold the session's new messages into its rolling summary in the background."""
+    with session.lock:
+        if session.summarizing or session.summarized >= session.appended:
+            return
+        session.summarizing = True
+    _summary_executor.submit(_summarize, session)
+
+
+def _summarize(session: ChatSession) -> None:
+    # Loops until caught up, so turns that arrive during an update are folded in by the next one
+    while True:
+        with session.lock:
+            new_messages = session._unsummarized()
+            if not new_messages:
+                session.summarizing = False
+                session.summary_idle.notify_all()
+                return
+            previous, target = session.summary, session.appended
+        try:
+            summary = update_summary(previous, new_messages)
+        except Exception as e:
+            logger.warning("Rolling summary update failed for session %s: %s", session.id, e)
+            with session.lock:
+                session.summarizing = False
+                session.summary_idle.notify_all()
+            return
+        with session.lock:
+            session.summary, session.summarized = summary, target
+
+
+def final_summary(session: ChatSession, wait: float = SUMMARY_WAIT_SECONDS) -> str | None:
+    """
+    The session's summary for ending the call, covering every turn. Waits up to `wait` seconds for
+    an update still in flight; if the summary is still behind after that (slow or failed update),
+    the remaining turns are folded in here. None if that fails too, so the caller can summarize
+    the full transcript instead.
+    """
+    with session.lock:
+        session.summary_idle.wait_for(lambda: not session.summarizing, timeout=wait)
+        if session.summarized >= session.appended:
+            return session.summary
+        previous, target = session.summary, session.appended
+        new_messages = session._unsummarized()
+    try:
+        summary = update_summary(previous, new_messages)
+    except Exception as e:
+        logger.warning("Final summary catch-up failed for session %s: %s", session.id, e)
+        return None
+    with session.lock:
+        if target > session.summarized:
+            session.summary, session.summarized = summary, target
+    return summary
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="chat-message-writer", daemon=True)
+            _writer.start()
+
+
+def _drain(first: dict | None = None) -> list[dict]:
+    batch = [first] if first is not None else []
+    while len(batch) < FLUSH_BATCH_SIZE:
+        try:
+            batch.append(_pending.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write_batch(batch: list[dict]) -> None:
+    try:
+        res = supabase.table("messages").insert(batch).execute()
+        notify("messages", "insert", res.data)
+    except Exception as e:
+        logger.error("Failed to persist %d chat messages: %s", len(batch), e)
+
+
+def _writer_loop() -> None:
+    while True:
+        try:
+            first = _pending.get(timeout=FLUSH_INTERVAL_SECONDS)
+        except queue.Empty:
+            continue
+        # Let a short burst accumulate so one insert covers it
+        time.sleep(min(FLUSH_INTERVAL_SECONDS, 0.05))
+        _write_batch(_drain(first))
+
+
+def flush_messages() -> None:
+    """Synchronously write every queued message (used on shutdown)."""
+    while True:
+        batch = _drain()
+        if not batch:
+            return
+        _write_batch(batch)
@@ -1,15 +1,19 @@
 """
-Cohere chat and risk assessment.
-Client, system prompt, risk keywords, and streaming chat live here; main only wires routes.
+Cohere chat, summaries and event extraction.
+Client, system prompt, and streaming chat live here (risk keywords: app.risk_rules); main only wires routes.
 """
 
 import os
 import json
+import logging
 import re
 from datetime import datetime, timedelta
 import cohere
 from dotenv import load_dotenv
 
+from app.logs import phi, sample
+from app.resilience import StreamReservation, Upstream
+
 load_dotenv()
 
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
@@ -18,6 +22,22 @@ if not COHERE_API_KEY:
 
 _client: cohere.ClientV2 | None = None
 
+# Deadlines: whole call for summary/extraction; first token and gaps between tokens for chat streams
+COHERE_DEADLINE_SECONDS = float(os.getenv("COHERE_DEADLINE_SECONDS", "20"))
+COHERE_FIRST_TOKEN_SECONDS = float(os.getenv("COHERE_FIRST_TOKEN_SECONDS", "8"))
+COHERE_STREAM_IDLE_SECONDS = float(os.getenv("COHERE_STREAM_IDLE_SECONDS", "10"))
+_cohere = Upstream(
+    "cohere",
+    deadline=COHERE_DEADLINE_SECONDS,
+    max_concurrency=int(os.getenv("COHERE_MAX_CONCURRENCY", "32")),
+)
+
+# Served instead of a model reply when Cohere is down or too slow, so the chat UI never hangs
+FALLBACK_REPLY = (
+    "I'm having trouble connecting right now, but I've noted what you said. "
+    "If this is urgent, please contact your doctor or call emergency services."
+)
+
 
 def _get_client() -> cohere.ClientV2:
     global _client
@@ -35,145 +55,351 @@ When patients mention symptoms, appointments, or medications, confidently tell t
 ALWAYS respond with exactly 2 sentences: first acknowledge their concern briefly and take confident action (schedule appointment, add to timeline, etc.), then ask a specific follow-up question. For serious symptoms, recommend professional medical care. Be warm, concise, confident, and never diagnose or prescribe treatments. Act as if you have the authority to schedule appointments and create timeline events - be proactive and helpful."""
 
 
-HIGH_RISK_KEYWORDS = [
-    "chest pain", "chest tightness", "difficulty breathing", "can't breathe",
-    "severe pain", "unconscious", "fainted", "bleeding heavily", "suicidal",
-    "want to die", "heart attack", "stroke", "seizure", "numbness",
-]
-
-MEDIUM_RISK_KEYWORDS = [
-    "fever", "persistent", "worsening", "dizzy", "nausea", "vomiting",
-    "can't sleep", "insomnia", "anxiety", "anxious", "depressed",
-    "shortness of breath", "headache", "migraine", "palpitations",
-]
-
-
 def get_system_prompt() -> str:
     """Base system prompt for CareBridge chat."""
     return SYSTEM_PROMPT
 
 
-def assess_risk(message: str) -> str:
-    """Return 'high', 'medium', or 'low' based on keyword presence in message."""
-    lower = message.lower()
-    if any(kw in lower for kw in HIGH_RISK_KEYWORDS):
-        return "high"
-    if any(kw in lower for kw in MEDIUM_RISK_KEYWORDS):
-        return "medium"
-    return "low"
+def reserve_chat_stream() -> StreamReservation:
+    """
+    Admit a chat stream before its response starts. Raises UpstreamUnavailable (503 + Retry-After)
+    when Cohere is at capacity or its circuit is open.
+    """
+    return _cohere.reserve()
 
 
-def stream_chat(messages: list[dict], system_prompt: str):
+def stream_chat(messages: list[dict], system_prompt: str, reservation: StreamReservation | None = None):
     """
     Stream Cohere chat response. messages: list of {"role": str, "content": str}.
     system_prompt: full system message (base + optional patient context).
+    reservation: from reserve_chat_stream; without one the stream is admitted when it starts.
     Yields text chunks.
+    If Cohere fails or misses its first-token deadline, yields FALLBACK_REPLY instead.
     """
     co_messages = [{"role": "system", "content": system_prompt}] + messages
-    client = _get_client()
-    response = client.chat_stream(
-        model="command-r-plus-08-2024",
-        messages=co_messages,
-        max_tokens=100,  # Limit to exactly 2 sentences
-    )
-    for event in response:
-        if event.type == "content-delta":
-            text = event.delta.message.content.text
+
+    def open_stream():
+        response = _get_client().chat_stream(
+            model="command-r-plus-08-2024",
+            messages=co_messages,
+            max_tokens=100,  # Limit to exactly 2 sentences
+        )
+        for event in response:
+            if event.type == "content-delta":
+                yield event.delta.message.content.text
+
+    started = False
+    try:
+        for text in _cohere.stream(open_stream, COHERE_FIRST_TOKEN_SECONDS, COHERE_STREAM_IDLE_SECONDS, reservation):
+            started = True
             yield text
+    except Exception as e:
+        if started:
+            raise
+        logging.warning("Cohere chat unavailable, serving fallback reply: %s", e)
+        yield FALLBACK_REPLY
 
 
-def generate_summary(messages: list[dict]) -> str:
-    """
-    Generate a conversation summary using Cohere.
-    messages: list of {"role": str, "content": str} (excluding system message).
-    Returns a markdown-formatted summary.
-    """
-    client = _get_client()
-    
-    # Create a summary prompt
-    summary_prompt = """Create a concise medical conversation summary in markdown format. Include:
+SUMMARY_PROMPT = """Create a concise medical conversation summary in markdown format. Include:
 - **Main Symptoms**: What the patient reported
 - **Key Details**: Important information discussed
 - **Recommendations**: Any advice or next steps mentioned
 
 Format as markdown with clear sections."""
-    
-    # Format conversation for summary
-    conversation_text = "\n".join([
-        f"{msg['role'].capitalize()}: {msg['content']}" 
-        for msg in messages 
+
+UPDATE_SUMMARY_PROMPT = SUMMARY_PROMPT + """
+
+You are given the summary of the conversation so far and the messages exchanged since.
+Return the complete updated summary: keep what still applies, add what the new messages cover,
+and correct anything they contradict."""
+
+
+def _format_conversation(messages: list[dict]) -> str:
+    return "\n".join([
+        f"{msg['role'].capitalize()}: {msg['content']}"
+        for msg in messages
         if msg['role'] != 'system'
     ])
-    
-    summary_messages = [
-        {"role": "system", "content": summary_prompt},
-        {"role": "user", "content": f"Summarize this conversation:\n\n{conversation_text}"}
-    ]
-    
+
+
+def _collect_summary(summary_messages: list[dict]) -> str:
+    client = _get_client()
+
     # Use chat_stream but collect all chunks
-    response = client.chat_stream(
-        model="command-r-plus-08-2024",
-        messages=summary_messages,
-        max_tokens=500,
-    )
-    
-    summary_text = ""
-    for event in response:
-        if event.type == "content-delta":
-            summary_text += event.delta.message.content.text
-    
-    return summary_text
+    def collect():
+        response = client.chat_stream(
+            model="command-r-plus-08-2024",
+            messages=summary_messages,
+            max_tokens=500,
+        )
+        summary_text = ""
+        for event in response:
+            if event.type == "content-delta":
+                summary_text += event.delta.message.content.text
+        return summary_text
 
+    return _cohere.call(collect)
 
-def extract_timeline_events(message: str, conversation_context: list[dict] = None) -> list[dict]:
+
+def generate_summary(messages: list[dict]) -> str:
     """
-    Extract timeline events (symptoms or appointments) from a user message using Cohere.
-    Returns a list of event dictionaries with: type, title, details, date (ISO format YYYY-MM-DD).
+    Generate a conversation summary using Cohere.
+    messages: list of {"role": str, "content": str} (excluding system message).
+    Returns a markdown-formatted summary.
     """
-    client = _get_client()
-    
-    # Build context from recent conversation
-    context_text = ""
-    if conversation_context:
-        # Get last 3 messages for context
-        recent_messages = conversation_context[-3:] if len(conversation_context) > 3 else conversation_context
-        context_text = "\n".join([
-            f"{msg.get('role', 'user').capitalize()}: {msg.get('content', '')}"
-            for msg in recent_messages
-            if msg.get('role') != 'system'
-        ])
-    
-    extraction_prompt = """You are a medical data extraction assistant. Analyze the user's message and extract any symptoms, appointments, or medications mentioned.
+    return _collect_summary([
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Summarize this conversation:\n\n{_format_conversation(messages)}"}
+    ])
+
+
+def update_summary(previous_summary: str | None, new_messages: list[dict]) -> str:
+    """
+    Fold new_messages into a summary from generate_summary (or a previous update_summary), so a
+    running conversation is summarized turn by turn without resending the whole transcript.
+    """
+    if not previous_summary:
+        return generate_summary(new_messages)
+    return _collect_summary([
+        {"role": "system", "content": UPDATE_SUMMARY_PROMPT},
+        {"role": "user", "content": (
+            f"Summary so far:\n\n{previous_summary}\n\n"
+            f"New messages:\n\n{_format_conversation(new_messages)}"
+        )}
+    ])
+
 
-For each symptom, appointment, or medication found, extract:
+_EXTRACTION_FIELDS = """For each symptom, appointment, or medication found, extract:
 - type: must be exactly "symptom", "appointment", or "medication" (no other values)
 - title: A brief title (e.g., "Headache started", "Doctor appointment scheduled", "Started taking Aspirin")
 - details: When it started/occurred, severity, duration, medication dosage, or appointment details
-- date: The date mentioned in YYYY-MM-DD format (convert relative dates like "yesterday", "3 days ago" to actual dates, or use today's date if not specified)
+- date: The date mentioned in YYYY-MM-DD format (convert relative dates like "yesterday", "3 days ago" to actual dates, or use today's date if not specified)"""
+
+_EXTRACTION_EXAMPLES = """- "I had a headache yesterday" -> [{{"type": "symptom", "title": "Headache", "details": "Started yesterday", "date": "2024-01-15"}}]
+- "I have an appointment next Monday" -> [{{"type": "appointment", "title": "Doctor appointment", "details": "Scheduled for next Monday", "date": "2024-01-22"}}]
+- "I've been feeling dizzy for 3 days" -> [{{"type": "symptom", "title": "Dizziness", "details": "Started 3 days ago, ongoing", "date": "2024-01-13"}}]
+- "I started taking ibuprofen 2 days ago" -> [{{"type": "medication", "title": "Ibuprofen", "details": "Started taking 2 days ago", "date": "2024-01-14"}}]"""
+
+EXTRACTION_PROMPT = """You are a medical data extraction assistant. Analyze the user's message and extract any symptoms, appointments, or medications mentioned.
+
+""" + _EXTRACTION_FIELDS + """
 
 CRITICAL: Return ONLY a valid JSON array. No other text. If no symptoms, appointments, or medications are found, return exactly: []
 
 Valid format examples:
-- "I had a headache yesterday" -> [{{"type": "symptom", "title": "Headache", "details": "Started yesterday", "date": "2024-01-15"}}]
-- "I have an appointment next Monday" -> [{{"type": "appointment", "title": "Doctor appointment", "details": "Scheduled for next Monday", "date": "2024-01-22"}}]
-- "I've been feeling dizzy for 3 days" -> [{{"type": "symptom", "title": "Dizziness", "details": "Started 3 days ago, ongoing", "date": "2024-01-13"}}]
-- "I started taking ibuprofen 2 days ago" -> [{{"type": "medication", "title": "Ibuprofen", "details": "Started taking 2 days ago", "date": "2024-01-14"}}]
+""" + _EXTRACTION_EXAMPLES + """
 
 Today's date: {today_date}
 
 Remember: Return ONLY the JSON array, nothing else."""
 
-    today = datetime.now()
-    today_str = today.strftime("%Y-%m-%d")
-    
-    full_prompt = extraction_prompt.format(today_date=today_str)
+BATCH_EXTRACTION_PROMPT = """You are a medical data extraction assistant. You will receive several independent patient messages, each labelled with an id. Analyze each message on its own and extract any symptoms, appointments, or medications it mentions. Never carry information from one message to another.
+
+""" + _EXTRACTION_FIELDS + """
+
+CRITICAL: Return ONLY a valid JSON object with one key per message id, whose value is the JSON array of that message's events. Use [] for a message with no symptoms, appointments, or medications. No other text.
+
+Examples of one message's array:
+""" + _EXTRACTION_EXAMPLES + """
+
+Example of the full reply for ids 1 and 2: {{"1": [{{"type": "symptom", "title": "Headache", "details": "Started yesterday", "date": "2024-01-15"}}], "2": []}}
+
+Today's date: {today_date}
+
+Remember: Return ONLY the JSON object, nothing else."""
+
+# Reply budget per message in a batched extraction call
+BATCH_EXTRACTION_TOKENS_PER_ITEM = 300
+BATCH_EXTRACTION_MAX_TOKENS = 4000
+
+
+def _context_text(conversation_context: list[dict] | None) -> str:
+    if not conversation_context:
+        return ""
+    # Get last 3 messages for context
+    recent_messages = conversation_context[-3:] if len(conversation_context) > 3 else conversation_context
+    return "\n".join([
+        f"{msg.get('role', 'user').capitalize()}: {msg.get('content', '')}"
+        for msg in recent_messages
+        if msg.get('role') != 'system'
+    ])
+
+
+def build_extraction_prompt(message: str, conversation_context: list[dict] | None, today_str: str) -> str:
+    """System prompt for extract_timeline_events: instructions, the last 3 non-system messages, and the message."""
+    context_text = _context_text(conversation_context)
+    full_prompt = EXTRACTION_PROMPT.format(today_date=today_str)
     if context_text:
         full_prompt += f"\n\nRecent conversation context:\n{context_text}\n\nUser's current message: {message}"
     else:
         full_prompt += f"\n\nUser's message: {message}"
-    
-    import logging
-    logging.info(f"Calling Cohere to extract timeline events from message: {message[:100]}")
+    return full_prompt
+
+
+def build_batch_extraction_messages(items: list[tuple[str, list[dict] | None]], today_str: str) -> list[dict]:
+    """Chat messages for one extraction call over several (message, conversation_context) items, ids "1".."n"."""
+    sections = []
+    for i, (message, conversation_context) in enumerate(items, 1):
+        context_text = _context_text(conversation_context)
+        section = f"### Message id {i}"
+        if context_text:
+            section += f"\nRecent conversation context:\n{context_text}\n\nUser's current message: {message}"
+        else:
+            section += f"\nUser's message: {message}"
+        sections.append(section)
+    return [
+        {"role": "system", "content": BATCH_EXTRACTION_PROMPT.format(today_date=today_str)},
+        {"role": "user", "content": "Extract timeline events for each message. Return only the JSON object.\n\n" + "\n\n".join(sections)},
+    ]
+
+
+def parse_events_json(response_text: str) -> list:
+    """Recover the JSON array from a model reply that may wrap it in prose or a code block; [] if none."""
+    # Try multiple strategies to extract JSON
+    events = []
+
+    # Strategy 1: Try to find JSON array with balanced brackets
+    # Find the first [ and then find the matching ]
+    bracket_start = response_text.find('[')
+    if bracket_start != -1:
+        bracket_count = 0
+        bracket_end = bracket_start
+        for i in range(bracket_start, len(response_text)):
+            if response_text[i] == '[':
+                bracket_count += 1
+            elif response_text[i] == ']':
+                bracket_count -= 1
+                if bracket_count == 0:
+                    bracket_end = i + 1
+                    break
+        if bracket_count == 0:
+            try:
+                json_str = response_text[bracket_start:bracket_end].strip()
+                parsed = json.loads(json_str)
+                if isinstance(parsed, list):
+                    events = parsed
+            except (json.JSONDecodeError, ValueError) as e:
+                logging.debug("JSON parsing failed with bracket matching: %s", e)
+                pass
+
+    # Strategy 2: Try parsing the entire response as JSON
+    if not events:
+        try:
+            parsed = json.loads(response_text)
+            if isinstance(parsed, list):
+                events = parsed
+        except (json.JSONDecodeError, ValueError) as e:
+            logging.debug("JSON parsing failed on full response: %s", e)
+            pass
+
+    # Strategy 3: Try to find JSON code blocks
+    if not events:
+        code_block_match = re.search(r'```(?:json)?\s*(\[.*?\])\s*```', response_text, re.DOTALL)
+        if code_block_match:
+            try:
+                parsed = json.loads(code_block_match.group(1))
+                if isinstance(parsed, list):
+                    events = parsed
+            except (json.JSONDecodeError, ValueError) as e:
+                logging.debug("JSON parsing failed in code block: %s", e)
+                pass
+
+    return events
+
+
+def normalize_events(events: list, today_str: str) -> list[dict]:
+    """Keep well-formed symptom/appointment/medication events, defaulting bad dates to today_str."""
+    normalized_events = []
+    for idx, event in enumerate(events):
+        try:
+            # Ensure event is a dictionary
+            if not isinstance(event, dict):
+                logging.debug("Skipping event %d: not a dict, type: %s", idx, type(event).__name__)
+                continue
+
+            # Check if type is valid - use .get() to avoid KeyError
+            event_type = event.get("type")
+            if not event_type or event_type not in ["symptom", "appointment", "medication"]:
+                logging.debug("Skipping event %d: invalid type %r", idx, event_type)
+                continue
+
+            # Ensure date is in correct format
+            date_str = event.get("date", today_str)
+            if not isinstance(date_str, str):
+                date_str = today_str
+            # Validate date format
+            try:
+                datetime.strptime(date_str, "%Y-%m-%d")
+            except (ValueError, TypeError):
+                # Invalid date, use today
+                date_str = today_str
+
+            # Safely get title and details with defaults
+            title = event.get("title")
+            if not title:
+                title = "Untitled event"
+
+            details = event.get("details", "")
+            if details is None:
+                details = ""
+
+            normalized_events.append({
+                "type": str(event_type),
+                "title": str(title),
+                "details": str(details),
+                "date": date_str
+            })
+        except Exception as e:
+            logging.warning("Skipping invalid event %d: %s: %s", idx, type(e).__name__, e)
+            continue
+    return normalized_events
+
+
+def _response_text(response) -> str | None:
+    """Reply text of a client.chat() response, or None (logged) if it has no message content."""
+    # Cohere chat() returns a ChatResponse object
+    # The text is in response.message.content (list of content blocks)
+    if not hasattr(response, 'message'):
+        logging.error("Cohere response doesn't have 'message' attribute. Response type: %s", type(response).__name__)
+        return None
+
+    # Extract text from message content
+    # Based on Cohere SDK structure: response.message.content is a list of content blocks
+    message = response.message
+    if not hasattr(message, 'content'):
+        logging.error("Cohere message doesn't have 'content' attribute. Message type: %s", type(message).__name__)
+        return None
+
+    message_content = message.content
+
+    if isinstance(message_content, list) and len(message_content) > 0:
+        # Content is a list of content blocks, get text from first block
+        first_block = message_content[0]
+        if hasattr(first_block, 'text'):
+            response_text = first_block.text.strip()
+        else:
+            logging.warning("First block doesn't have 'text', using str() of %s", type(first_block).__name__)
+            response_text = str(first_block).strip()
+    elif hasattr(message_content, 'text'):
+        # Content has a text attribute directly
+        response_text = message_content.text.strip()
+    else:
+        # Fallback: try to get text from the message directly
+        logging.warning("Message content is not a list and doesn't have 'text', using str() of %s", type(message_content).__name__)
+        response_text = str(message_content).strip()
+    return response_text
+
+
+def extract_timeline_events(message: str, conversation_context: list[dict] = None) -> list[dict]:
+    """
+    Extract timeline events (symptoms or appointments) from a user message using Cohere.
+    Returns a list of event dictionaries with: type, title, details, date (ISO format YYYY-MM-DD).
+    """
+    client = _get_client()
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    full_prompt = build_extraction_prompt(message, conversation_context, today_str)
+
+    logging.info("Calling Cohere to extract timeline events from message: %s", phi(message[:100]), extra=sample(0.1))
     
     try:
         # Use Cohere to extract structured data with JSON mode if available
@@ -189,176 +415,96 @@ Remember: Return ONLY the JSON array, nothing else."""
         
         # Try to use JSON mode if available (Cohere may support response_format)
         # If not available, the prompt should be sufficient
-        response = client.chat(**chat_kwargs)
-        
-        # Extract JSON from response - Cohere chat() returns a ChatResponse object
-        # The text is in response.message.content (list of content blocks)
-        logging.info(f"Cohere response type: {type(response)}, has message: {hasattr(response, 'message')}")
-        
-        if not hasattr(response, 'message'):
-            logging.error(f"Cohere response doesn't have 'message' attribute. Response type: {type(response)}, available attrs: {[x for x in dir(response) if not x.startswith('_')]}")
-            return []
-        
-        # Extract text from message content
-        # Based on Cohere SDK structure: response.message.content is a list of content blocks
-        message = response.message
-        logging.info(f"Message type: {type(message)}, has content: {hasattr(message, 'content')}")
+        response = _cohere.call(client.chat, **chat_kwargs)
         
-        if not hasattr(message, 'content'):
-            logging.error(f"Cohere message doesn't have 'content' attribute. Message type: {type(message)}, available attrs: {[x for x in dir(message) if not x.startswith('_')]}")
+        response_text = _response_text(response)
+        if response_text is None:
             return []
+
+        logging.debug("Cohere extraction response (%d chars): %s", len(response_text), phi(response_text))
         
-        message_content = message.content
-        logging.info(f"Message content type: {type(message_content)}, is list: {isinstance(message_content, list)}")
-        
-        if isinstance(message_content, list) and len(message_content) > 0:
-            # Content is a list of content blocks, get text from first block
-            first_block = message_content[0]
-            logging.info(f"First block type: {type(first_block)}, has text: {hasattr(first_block, 'text')}")
-            if hasattr(first_block, 'text'):
-                response_text = first_block.text.strip()
-            else:
-                logging.warning(f"First block doesn't have 'text', using str(): {first_block}")
-                response_text = str(first_block).strip()
-        elif hasattr(message_content, 'text'):
-            # Content has a text attribute directly
-            response_text = message_content.text.strip()
-        else:
-            # Fallback: try to get text from the message directly
-            logging.warning(f"Message content is not a list and doesn't have 'text', using str(): {message_content}")
-            response_text = str(message_content).strip()
-        
-        logging.info(f"Cohere extraction response (full, {len(response_text)} chars): {response_text}")
-        
-        # Try multiple strategies to extract JSON
-        events = []
-        
-        # Strategy 1: Try to find JSON array with balanced brackets
-        # Find the first [ and then find the matching ]
-        bracket_start = response_text.find('[')
-        if bracket_start != -1:
-            bracket_count = 0
-            bracket_end = bracket_start
-            for i in range(bracket_start, len(response_text)):
-                if response_text[i] == '[':
-                    bracket_count += 1
-                elif response_text[i] == ']':
-                    bracket_count -= 1
-                    if bracket_count == 0:
-                        bracket_end = i + 1
-                        break
-            if bracket_count == 0:
-                try:
-                    json_str = response_text[bracket_start:bracket_end].strip()
-                    parsed = json.loads(json_str)
-                    if isinstance(parsed, list):
-                        events = parsed
-                except (json.JSONDecodeError, ValueError) as e:
-                    import logging
-                    logging.debug(f"JSON parsing failed with bracket matching: {e}, json_str: {json_str[:100] if 'json_str' in locals() else 'N/A'}")
-                    pass
-        
-        # Strategy 2: Try parsing the entire response as JSON
-        if not events:
-            try:
-                parsed = json.loads(response_text)
-                if isinstance(parsed, list):
-                    events = parsed
-            except (json.JSONDecodeError, ValueError) as e:
-                import logging
-                logging.debug(f"JSON parsing failed on full response: {e}")
-                pass
-        
-        # Strategy 3: Try to find JSON code blocks
-        if not events:
-            code_block_match = re.search(r'```(?:json)?\s*(\[.*?\])\s*```', response_text, re.DOTALL)
-            if code_block_match:
-                try:
-                    parsed = json.loads(code_block_match.group(1))
-                    if isinstance(parsed, list):
-                        events = parsed
-                except (json.JSONDecodeError, ValueError) as e:
-                    import logging
-                    logging.debug(f"JSON parsing failed in code block: {e}")
-                    pass
-        
+        events = parse_events_json(response_text)
+
         # Validate and normalize events
         if not isinstance(events, list):
-            logging.warning(f"Extracted events is not a list, type: {type(events)}, value: {events}")
+            logging.warning("Extracted events is not a list, type: %s", type(events).__name__)
             return []
         
-        logging.info(f"Successfully parsed {len(events)} events from Cohere response")
-        
-        normalized_events = []
-        for idx, event in enumerate(events):
-            try:
-                # Ensure event is a dictionary
-                if not isinstance(event, dict):
-                    import logging
-                    logging.debug(f"Skipping event {idx}: not a dict, type: {type(event)}")
-                    continue
-                
-                # Check if type is valid - use .get() to avoid KeyError
-                event_type = event.get("type")
-                if not event_type or event_type not in ["symptom", "appointment", "medication"]:
-                    import logging
-                    logging.debug(f"Skipping event {idx}: invalid type '{event_type}', event keys: {list(event.keys()) if isinstance(event, dict) else 'N/A'}")
-                    continue
-                
-                # Ensure date is in correct format
-                date_str = event.get("date", today_str)
-                if not isinstance(date_str, str):
-                    date_str = today_str
-                # Validate date format
-                try:
-                    datetime.strptime(date_str, "%Y-%m-%d")
-                except (ValueError, TypeError):
-                    # Invalid date, use today
-                    date_str = today_str
-                
-                # Safely get title and details with defaults
-                title = event.get("title")
-                if not title:
-                    title = "Untitled event"
-                
-                details = event.get("details", "")
-                if details is None:
-                    details = ""
-                
-                normalized_events.append({
-                    "type": str(event_type),
-                    "title": str(title),
-                    "details": str(details),
-                    "date": date_str
-                })
-            except Exception as e:
-                import logging
-                logging.warning(f"Skipping invalid event {idx}: {type(e).__name__}: {e}, event: {event}")
-                continue
+        logging.info("Successfully parsed %d events from Cohere response", len(events), extra=sample(0.1))
         
-        return normalized_events
+        return normalize_events(events, today_str)
             
     except KeyError as e:
-        import logging
-        logging.error(f"KeyError in extract_timeline_events: {e}. Response text: {response_text[:500] if 'response_text' in locals() else 'N/A'}")
+        logging.error("KeyError in extract_timeline_events: %s. Response text: %s", e, phi(locals().get("response_text")))
         return []
     except json.JSONDecodeError as e:
-        import logging
-        logging.error(f"JSON decode error in extract_timeline_events: {e.msg} at position {e.pos}. Response text: {response_text[:500] if 'response_text' in locals() else 'N/A'}")
+        logging.error("JSON decode error in extract_timeline_events: %s at position %d. Response text: %s", e.msg, e.pos, phi(locals().get("response_text")))
         return []
     except (ValueError, TypeError) as e:
-        import logging
-        logging.error(f"Value/Type error in extract_timeline_events: {e}. Response text: {response_text[:500] if 'response_text' in locals() else 'N/A'}")
+        logging.error("Value/Type error in extract_timeline_events: %s. Response text: %s", e, phi(locals().get("response_text")))
         return []
     except Exception as e:
-        import logging
-        error_msg = str(e)
-        error_type = type(e).__name__
-        logging.error(f"Failed to extract timeline events: {error_type}: {error_msg}", exc_info=True)
-        # Log the response text for debugging if available
-        try:
-            if 'response_text' in locals():
-                logging.error(f"Full Cohere response text: {response_text}")
-        except:
-            pass
+        logging.error("Failed to extract timeline events: %s: %s. Response text: %s", type(e).__name__, e, phi(locals().get("response_text")), exc_info=True)
         return []
+
+
+def parse_batch_events_json(response_text: str, count: int) -> list[list | None] | None:
+    """
+    Split a batched extraction reply ({"1": [...], "2": [...]}) into one event list per item.
+    Items missing from the reply (or not given a list) are None; None overall if no JSON object is found.
+    """
+    parsed = None
+    candidates = [response_text]
+    code_block_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', response_text, re.DOTALL)
+    if code_block_match:
+        candidates.append(code_block_match.group(1))
+    brace_start, brace_end = response_text.find('{'), response_text.rfind('}')
+    if brace_start != -1 and brace_end > brace_start:
+        candidates.append(response_text[brace_start:brace_end + 1])
+    for candidate in candidates:
+        try:
+            parsed = json.loads(candidate)
+        except (json.JSONDecodeError, ValueError):
+            continue
+        if isinstance(parsed, dict):
+            break
+        parsed = None
+    if parsed is None:
+        return None
+    results = []
+    for i in range(1, count + 1):
+        events = parsed.get(str(i))
+        results.append(events if isinstance(events, list) else None)
+    return results
+
+
+def extract_timeline_events_batch(items: list[tuple[str, list[dict] | None]]) -> list[list[dict] | None]:
+    """
+    Extract timeline events for several (message, conversation_context) items, possibly from different
+    patients, with one Cohere call. Returns one normalized event list per item, in order; an item is
+    None when the reply could not be parsed for it, so the caller can retry it with extract_timeline_events.
+    If the call itself fails every item gets [], as extract_timeline_events returns on failure.
+    """
+    client = _get_client()
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    logging.info("Calling Cohere to extract timeline events for %d messages in one request", len(items), extra=sample(0.1))
+    try:
+        response = _cohere.call(
+            client.chat,
+            model="command-r-plus-08-2024",
+            messages=build_batch_extraction_messages(items, today_str),
+            max_tokens=min(BATCH_EXTRACTION_TOKENS_PER_ITEM * len(items), BATCH_EXTRACTION_MAX_TOKENS),
+        )
+    except Exception as e:
+        logging.error("Batched timeline extraction failed: %s: %s", type(e).__name__, e)
+        return [[] for _ in items]
+
+    response_text = _response_text(response)
+    if response_text is None:
+        return [None] * len(items)
+    logging.debug("Cohere batched extraction response (%d chars): %s", len(response_text), phi(response_text))
+    per_item = parse_batch_events_json(response_text, len(items))
+    if per_item is None:
+        logging.warning("Could not parse batched extraction reply for %d messages", len(items))
+        return [None] * len(items)
+    return [normalize_events(events, today_str) if events is not None else None for events in per_item]
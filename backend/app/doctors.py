@@ -4,10 +4,19 @@ Schema: patients(user_id) and doctors(user_id) are PKs; patient_doctors stores u
 We use user_id everywhere; no resolution to internal id.
 """
 
+import os
 from fastapi import HTTPException
 
+from app.cache import ReadThroughCache
+from app.care_graph import doctors_of, patients_of
+from app.changes import notify, on_resync, subscribe
 from app.supabase import supabase
 
+# Merged doctor records (doctors row + profile name/email/address), keyed by user_id.
+# Doctor profiles rarely change; writes to doctors (from any worker) invalidate the entry.
+DOCTOR_CACHE_TTL_SECONDS = int(os.getenv("DOCTOR_CACHE_TTL_SECONDS", "600"))
+_doctor_cache = ReadThroughCache("doctors", maxsize=4096, ttl=DOCTOR_CACHE_TTL_SECONDS)
+
 
 def create_doctor(
     user_id: str,
@@ -45,6 +54,7 @@ def create_doctor(
                 raise insert_err
         if not res.data or len(res.data) == 0:
             raise HTTPException(status_code=500, detail="Failed to create doctor")
+        notify("doctors", "insert", res.data)
         return res.data[0]
     except HTTPException:
         raise
@@ -72,25 +82,60 @@ def get_profile_by_user_id(user_id: str) -> dict:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _merge_profile(doctor_row: dict, profile: dict | None) -> dict:
+    """Propagate name, email, address from profile if missing (like patients table)."""
+    doctor = dict(doctor_row)
+    if profile:
+        doctor["name"] = doctor.get("name") or profile.get("full_name") or profile.get("name")
+        doctor["email"] = doctor.get("email") or profile.get("email")
+        doctor["address"] = doctor.get("address") or profile.get("address")
+    return doctor
+
+
+def _load_doctor(user_id: str) -> dict:
+    res = supabase.table("doctors").select("*").eq("user_id", user_id).execute()
+    if not res.data or len(res.data) == 0:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    try:
+        profile = get_profile_by_user_id(user_id)
+    except HTTPException:
+        profile = None
+    return _merge_profile(res.data[0], profile)
+
+
+def _load_doctors(user_ids: list) -> dict:
+    """Bulk loader: one doctors query and one profiles query for all user_ids."""
+    res = supabase.table("doctors").select("*").in_("user_id", user_ids).execute()
+    rows = res.data or []
+    if not rows:
+        return {}
+    profiles_res = supabase.table("profiles").select("*").in_("id", [r["user_id"] for r in rows]).execute()
+    profiles = {p["id"]: p for p in (profiles_res.data or [])}
+    return {r["user_id"]: _merge_profile(r, profiles.get(r["user_id"])) for r in rows}
+
+
 def get_doctor_by_user_id(user_id: str) -> dict:
     """
     Get one doctor by Supabase user_id. Merges in name, email, address from profile
     when missing from doctors row (so patient page gets same shape as patients on provider page).
+    Served from the doctor cache; only misses query Supabase.
     """
     try:
-        res = supabase.table("doctors").select("*").eq("user_id", user_id).execute()
-        if not res.data or len(res.data) == 0:
-            raise HTTPException(status_code=404, detail="Doctor not found")
-        doctor = dict(res.data[0])
-        # Propagate name, email, address from profile if missing (like patients table)
-        try:
-            profile = get_profile_by_user_id(user_id)
-            doctor["name"] = doctor.get("name") or profile.get("full_name") or profile.get("name")
-            doctor["email"] = doctor.get("email") or profile.get("email")
-            doctor["address"] = doctor.get("address") or profile.get("address")
-        except HTTPException:
-            pass
-        return doctor
+        return dict(_doctor_cache.get(user_id, _load_doctor))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def get_doctors_by_user_ids(user_ids: list[str]) -> list[dict]:
+    """
+    Get many merged doctor records at once, in the order of user_ids.
+    Cache misses are loaded with one doctors query and one profiles query; unknown ids are skipped.
+    """
+    try:
+        found = _doctor_cache.get_many(user_ids, _load_doctors)
+        return [dict(found[uid]) for uid in dict.fromkeys(user_ids) if uid in found]
     except HTTPException:
         raise
     except Exception as e:
@@ -100,12 +145,12 @@ def get_doctor_by_user_id(user_id: str) -> dict:
 def get_my_patients(doctor_user_id: str) -> list:
     """
     List all patients connected to this doctor. patient_doctors.doctor_id and patient_id are user_ids.
+    The links come from the in-memory care graph (app.care_graph).
     """
     try:
-        links = supabase.table("patient_doctors").select("patient_id").eq("doctor_id", doctor_user_id).execute()
-        if not links.data:
+        patient_user_ids = list(patients_of(doctor_user_id))
+        if not patient_user_ids:
             return []
-        patient_user_ids = [r["patient_id"] for r in links.data]
         res = supabase.table("patients").select("*").in_("user_id", patient_user_ids).execute()
         return res.data or []
     except HTTPException:
@@ -117,24 +162,14 @@ def get_my_patients(doctor_user_id: str) -> list:
 def get_patient_doctors(patient_user_id: str) -> list:
     """
     List all doctors connected to this patient. patient_doctors stores user_ids.
-    Returns enriched doctor data using get_doctor_by_user_id for each.
+    Returns enriched doctor data from the doctor cache (see get_doctors_by_user_ids).
     """
     try:
-        links = supabase.table("patient_doctors").select("doctor_id").eq("patient_id", patient_user_id).execute()
-        if not links.data:
+        doctor_user_ids = list(doctors_of(patient_user_id))
+        if not doctor_user_ids:
             return []
-        doctor_user_ids = [r["doctor_id"] for r in links.data]
-        
-        # Get full doctor details for each
-        doctors = []
-        for doctor_id in doctor_user_ids:
-            try:
-                doctor = get_doctor_by_user_id(doctor_id)
-                doctors.append(doctor)
-            except HTTPException:
-                # Skip doctors that aren't found
-                continue
-        
+        # Full doctor details for each, from the doctor cache (doctors that aren't found are skipped)
+        doctors = get_doctors_by_user_ids(doctor_user_ids)
         return doctors
     except HTTPException:
         raise
@@ -151,6 +186,7 @@ def connect_patient_doctor(patient_user_id: str, doctor_user_id: str) -> dict:
             "patient_id": patient_user_id,
             "doctor_id": doctor_user_id,
         }).execute()
+        notify("patient_doctors", "insert", [{"patient_id": patient_user_id, "doctor_id": doctor_user_id}])
         return {"message": "Linked", "patient_user_id": patient_user_id, "doctor_user_id": doctor_user_id}
     except HTTPException:
         raise
@@ -168,9 +204,20 @@ def disconnect_patient_doctor(patient_user_id: str, doctor_user_id: str) -> dict
     try:
         res = supabase.table("patient_doctors").delete().eq("patient_id", patient_user_id).eq("doctor_id", doctor_user_id).execute()
         if res.data is not None and len(res.data) > 0:
+            notify("patient_doctors", "delete", res.data)
             return {"message": "Unlinked", "patient_user_id": patient_user_id, "doctor_user_id": doctor_user_id}
         raise HTTPException(status_code=404, detail="Link not found")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _on_doctors(op: str, rows: list[dict]) -> None:
+    for row in rows:
+        if row.get("user_id"):
+            _doctor_cache.invalidate(row["user_id"])
+
+
+subscribe("doctors", _on_doctors)
+on_resync(_doctor_cache.clear)
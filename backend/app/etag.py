@@ -0,0 +1,46 @@
+"""
+Conditional GET for read endpoints.
+The ETag is built from app.changes version counters for the tables a response depends on,
+so a request whose If-None-Match still matches gets 304 before any query or JSON encoding.
+The tag includes a per-process epoch: counters restart at zero with the process and only
+see writes made through app.* in this process (and, via app.bus, its peers). The resync
+generation is included too, so a worker that may have missed peer writes stops matching old tags.
+"""
+
+import uuid
+from typing import Any, Callable, Iterable
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.changes import generation, version
+from app.responses import FastJSONResponse
+
+_EPOCH = uuid.uuid4().hex[:8]
+
+
+def current_etag(tables: Iterable[str]) -> str:
+    return 'W/"' + "-".join([_EPOCH, str(generation())] + [str(version(t)) for t in tables]) + '"'
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" are equivalent
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def conditional_json(request: Request, tables: Iterable[str], loader: Callable[[], Any]) -> Response:
+    """
+    304 if the client's copy is current, otherwise loader()'s result with an ETag,
+    encoded directly by FastJSONResponse (no jsonable_encoder pass).
+    The tag is taken before loading, so a write racing the read makes the next request refetch.
+    """
+    etag = current_etag(tables)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={**headers, "Vary": "Accept, Accept-Encoding"})
+    return FastJSONResponse(loader(), headers=headers)
@@ -0,0 +1,149 @@
+"""
+Streaming NDJSON export of patient records, doctor panels, or the whole clinic.
+Records come from generators over keyset-paged database reads, one JSON object per line:
+{"type": "<table>", "data": {...row...}}. Memory stays flat regardless of export size.
+"""
+
+import json
+import zlib
+from typing import Iterable, Iterator
+
+from fastapi import HTTPException
+
+from app.patients import get_patient
+from app.supabase import supabase
+
+PAGE_SIZE = 1000
+IN_CHUNK_SIZE = 200
+# Compressed output is yielded in pieces of at least this size
+GZIP_FLUSH_BYTES = 64 * 1024
+
+
+def paged_rows(
+    table: str,
+    filters: Iterable[tuple[str, str, object]] = (),
+    columns: str = "*",
+) -> Iterator[dict]:
+    """
+    Yield every row of table matching filters, PAGE_SIZE rows per query.
+    Pages by id (keyset) so each query is an index range scan, not a growing OFFSET.
+    filters: (method, column, value), e.g. ("eq", "patient_id", pid) or ("in_", "patient_id", ids).
+    columns must include id.
+    """
+    filters = list(filters)
+    last_id = None
+    while True:
+        q = supabase.table(table).select(columns)
+        for method, column, value in filters:
+            q = getattr(q, method)(column, value)
+        if last_id is not None:
+            q = q.gt("id", last_id)
+        page = q.order("id").limit(PAGE_SIZE).execute().data or []
+        yield from page
+        if len(page) < PAGE_SIZE:
+            return
+        last_id = page[-1]["id"]
+
+
+def paged_links(filters: Iterable[tuple[str, str, object]] = ()) -> Iterator[dict]:
+    """patient_doctors has no id column, so page it by offset over its primary key order."""
+    filters = list(filters)
+    offset = 0
+    while True:
+        q = supabase.table("patient_doctors").select("*")
+        for method, column, value in filters:
+            q = getattr(q, method)(column, value)
+        page = q.order("patient_id").order("doctor_id").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+        yield from page
+        if len(page) < PAGE_SIZE:
+            return
+        offset += PAGE_SIZE
+
+
+def _record(kind: str, row: dict) -> dict:
+    return {"type": kind, "data": row}
+
+
+def _patients_records(patients: list[dict]) -> Iterator[dict]:
+    """A batch of patients followed by their timeline events, alerts and messages."""
+    for patient in patients:
+        yield _record("patient", patient)
+    patient_ids = [p["id"] for p in patients]
+    # alerts.patient_id may hold either identifier depending on the writer
+    alert_keys = list(dict.fromkeys(patient_ids + [p["user_id"] for p in patients if p.get("user_id")]))
+    for row in paged_rows("timeline_events", [("in_", "patient_id", patient_ids)]):
+        yield _record("timeline_event", row)
+    for row in paged_rows("alerts", [("in_", "patient_id", alert_keys)]):
+        yield _record("alert", row)
+    for row in paged_rows("messages", [("in_", "patient_id", patient_ids)]):
+        yield _record("message", row)
+
+
+def export_patient(identifier: str) -> Iterator[dict]:
+    """One patient's full record. Raises HTTPException 404 before streaming if the patient is unknown."""
+    patient = get_patient(identifier)
+
+    def records():
+        yield from _patients_records([patient])
+        for row in paged_links([("eq", "patient_id", patient.get("user_id") or patient["id"])]):
+            yield _record("patient_doctor", row)
+
+    return records()
+
+
+def export_doctor_panel(doctor_id: str) -> Iterator[dict]:
+    """The doctor row and every linked patient's full record, IN_CHUNK_SIZE patients per batch."""
+    res = supabase.table("doctors").select("*").eq("user_id", doctor_id).execute()
+    if not res.data:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    doctor = res.data[0]
+
+    def records():
+        yield _record("doctor", doctor)
+        batch: list[str] = []
+        for link in paged_links([("eq", "doctor_id", doctor_id)]):
+            yield _record("patient_doctor", link)
+            batch.append(link["patient_id"])
+            if len(batch) == IN_CHUNK_SIZE:
+                yield from _patients_records(list(paged_rows("patients", [("in_", "user_id", batch)])))
+                batch = []
+        if batch:
+            yield from _patients_records(list(paged_rows("patients", [("in_", "user_id", batch)])))
+
+    return records()
+
+
+def export_clinic() -> Iterator[dict]:
+    """Every row of every clinical table, table by table."""
+    for kind, table in (
+        ("patient", "patients"),
+        ("doctor", "doctors"),
+        ("timeline_event", "timeline_events"),
+        ("alert", "alerts"),
+        ("message", "messages"),
+    ):
+        for row in paged_rows(table):
+            yield _record(kind, row)
+    for row in paged_links():
+        yield _record("patient_doctor", row)
+
+
+def ndjson_stream(records: Iterable[dict], compress: bool = False) -> Iterator[bytes]:
+    """Encode records as NDJSON bytes, optionally as a streaming gzip file."""
+    if not compress:
+        for record in records:
+            yield (json.dumps(record, default=str) + "\n").encode()
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    pending = []
+    size = 0
+    for record in records:
+        chunk = compressor.compress((json.dumps(record, default=str) + "\n").encode())
+        if chunk:
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= GZIP_FLUSH_BYTES:
+                yield b"".join(pending)
+                pending, size = [], 0
+    pending.append(compressor.flush())
+    yield b"".join(pending)
@@ -0,0 +1,129 @@
+"""
+Micro-batching of timeline extraction across patients.
+Every chat turn needs one extraction (app.cohere_chat.extract_timeline_events); at peak that is
+hundreds of tiny Cohere requests a minute. Jobs submitted here wait up to
+EXTRACTION_BATCH_WINDOW_SECONDS (or until EXTRACTION_BATCH_SIZE are waiting) and are then sent as
+one multi-message request (extract_timeline_events_batch), whose reply is split back per job.
+Jobs the reply does not cover are retried with their own single call; a lone job is sent as a
+single call straight away.
+
+Extraction runs after the reply has streamed, so the window only delays background work; callers
+attach a done-callback to the returned future rather than blocking a thread on it.
+EXTRACTION_BATCH_SIZE=1 turns batching off.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.cohere_chat import extract_timeline_events, extract_timeline_events_batch
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_BATCH_WINDOW_SECONDS = float(os.getenv("EXTRACTION_BATCH_WINDOW_SECONDS", "0.5"))
+EXTRACTION_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "8"))
+# Batches (and single-call retries) in flight at once
+EXTRACTION_BATCH_WORKERS = int(os.getenv("EXTRACTION_BATCH_WORKERS", "4"))
+
+
+class _Job:
+    __slots__ = ("message", "context", "future")
+
+    def __init__(self, message: str, context: list[dict] | None):
+        self.message = message
+        self.context = context
+        self.future: Future = Future()
+
+
+class ExtractionBatcher:
+    def __init__(
+        self,
+        window: float = EXTRACTION_BATCH_WINDOW_SECONDS,
+        max_size: int = EXTRACTION_BATCH_SIZE,
+        workers: int = EXTRACTION_BATCH_WORKERS,
+    ):
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extraction-batch")
+        self._collector: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats = {"jobs": 0, "batches": 0, "singleCalls": 0, "fallbacks": 0}
+
+    def submit(self, message: str, context: list[dict] | None) -> Future:
+        """Queue one extraction; the future resolves to its normalized event list."""
+        job = _Job(message, context)
+        self._ensure_collector()
+        with self._lock:
+            self._stats["jobs"] += 1
+        self._jobs.put(job)
+        return job.future
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["upstreamCalls"] = stats["batches"] + stats["singleCalls"]
+        stats["waiting"] = self._jobs.qsize()
+        return stats
+
+    def _ensure_collector(self) -> None:
+        if self._collector is not None and self._collector.is_alive():
+            return
+        with self._lock:
+            if self._collector is None or not self._collector.is_alive():
+                self._collector = threading.Thread(target=self._collect, name="extraction-batcher", daemon=True)
+                self._collector.start()
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._jobs.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _single(self, job: _Job) -> None:
+        with self._lock:
+            self._stats["singleCalls"] += 1
+        try:
+            job.future.set_result(extract_timeline_events(job.message, job.context))
+        except Exception as e:
+            job.future.set_exception(e)
+
+    def _dispatch(self, batch: list[_Job]) -> None:
+        if len(batch) == 1:
+            self._single(batch[0])
+            return
+        with self._lock:
+            self._stats["batches"] += 1
+        try:
+            results = extract_timeline_events_batch([(job.message, job.context) for job in batch])
+        except Exception as e:
+            logger.error("Batched extraction of %d jobs failed: %s", len(batch), e, exc_info=True)
+            results = [None] * len(batch)
+        retries = [job for job, events in zip(batch, results) if events is None]
+        for job, events in zip(batch, results):
+            if events is not None:
+                job.future.set_result(events)
+        if retries:
+            with self._lock:
+                self._stats["fallbacks"] += len(retries)
+            logger.warning("Retrying %d of %d batched extractions as single calls", len(retries), len(batch))
+            for job in retries:
+                self._executor.submit(self._single, job)
+
+
+extraction_batcher = ExtractionBatcher()
+
+
+def get_extraction_batching_stats() -> dict:
+    return extraction_batcher.stats()
@@ -0,0 +1,184 @@
+"""
+Logging pipeline. Request threads only filter and enqueue records; one background listener thread
+redacts, formats and writes them, so log I/O and formatting stay off the request path.
+
+- Lazy formatting: log with %-style arguments (logger.info("x=%s", x)), not f-strings. Records are
+  formatted on the writer thread, and records dropped below are never formatted at all.
+- Per-call-site limits: each logging call site (file:line) below WARNING may emit LOG_SITE_RATE records
+  per second (bursts up to LOG_SITE_BURST). Dropped records are counted, and the site's next record
+  carries "suppressed": n. extra=sample(p) additionally keeps only a fraction p of a site's records.
+  Log volume therefore stops growing with traffic. Warnings and errors are never dropped.
+- PHI: wrap patient-provided values in phi(value). They render as "[redacted: N chars]" unless
+  LOG_PHI=1 (local debugging only). Every message is also scrubbed of emails, phone numbers and SSNs.
+- LOG_FORMAT=json (default) writes one JSON object per line; LOG_FORMAT=text writes plain lines.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SITE_RATE = float(os.getenv("LOG_SITE_RATE", "5"))
+LOG_SITE_BURST = float(os.getenv("LOG_SITE_BURST", "20"))
+SHOW_PHI = os.getenv("LOG_PHI", "").lower() in ("1", "true", "yes")
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_REDACTIONS = (
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "[email]"),
+    (re.compile(r"\b\d{3}-\d{2}-\d{4}\b"), "[ssn]"),
+    (re.compile(r"(?:\+\d{1,3}[\s.-]?)?\(?\b\d{3}\)?[\s.-]\d{3}[\s.-]\d{4}\b"), "[phone]"),
+)
+# LogRecord attributes that are not user-supplied extras
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample_rate", "suppressed"}
+
+_listener: QueueListener | None = None
+_limiter: "CallSiteLimiter | None" = None
+
+
+class Phi:
+    """A patient-provided value that must not reach the logs; str() is redacted unless LOG_PHI=1."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self) -> str:
+        if SHOW_PHI:
+            return str(self.value)
+        return f"[redacted: {len(str(self.value))} chars]"
+
+    __repr__ = __str__
+
+
+def phi(value) -> Phi:
+    return Phi(value)
+
+
+def sample(rate: float) -> dict:
+    """extra= for a call site that should keep only `rate` (0-1) of its records."""
+    return {"sample_rate": rate}
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class CallSiteLimiter(logging.Filter):
+    """Token bucket (and optional sampling) per call site for records below WARNING."""
+
+    def __init__(self, rate: float = LOG_SITE_RATE, burst: float = LOG_SITE_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._sites: dict[tuple[str, int], list] = {}  # site -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [self.burst, now, 0]
+            site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            rate = getattr(record, "sample_rate", None)
+            if site[0] < 1 or (rate is not None and random.random() >= rate):
+                site[2] += 1
+                self.suppressed += 1
+                return False
+            site[0] -= 1
+            if site[2]:
+                record.suppressed = site[2]
+                site[2] = 0
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sites": len(self._sites), "suppressed": self.suppressed}
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueues the record as-is; the stock QueueHandler formats on the caller's thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RedactingFilter(logging.Filter):
+    """Runs on the writer thread: renders the message once and scrubs identifiers from it."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(record.getMessage())
+        record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "site": f"{record.module}:{record.lineno}",
+            "thread": record.threadName,
+        }
+        if getattr(record, "suppressed", None):
+            entry["suppressed"] = record.suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value if isinstance(value, (int, float, bool)) or value is None else redact(str(value))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        return f"{text} (+{suppressed} suppressed)" if suppressed else text
+
+
+def configure_logging(level: str = LOG_LEVEL) -> None:
+    """Route the root logger through the queue, limiter and background writer. Safe to call twice."""
+    global _listener, _limiter
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter(TEXT_FORMAT))
+    output.addFilter(RedactingFilter())
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(records)
+    _limiter = CallSiteLimiter()
+    handler.addFilter(_limiter)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logging_stats() -> dict:
+    return _limiter.stats() if _limiter is not None else {}
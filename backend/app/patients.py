@@ -4,10 +4,41 @@ Same pattern as app.doctors: one module for public.patients.
 """
 
 import logging
+import os
+import threading
+import time
 from fastapi import HTTPException
 
+from app.changes import notify, on_resync, subscribe
+from app.logs import phi
 from app.supabase import supabase
 
+# Last known risk_level per patient identifier (user_id, plus patients.id when known), with the
+# monotonic time it expires. Lets set_patient_risk skip writes that would not change anything.
+# Writes from other workers arrive via app.changes; the TTL bounds staleness from writes that
+# bypass the backend (SQL editor, other services).
+RISK_LEVEL_CACHE_SECONDS = int(os.getenv("RISK_LEVEL_CACHE_SECONDS", "300"))
+_risk_levels: dict[str, tuple[str, float]] = {}
+_risk_levels_lock = threading.Lock()
+
+
+def _remember_risk(row: dict) -> None:
+    """Record a patient row's current risk_level under both of its identifiers."""
+    level = row.get("risk_level")
+    if not level:
+        return
+    expires_at = time.monotonic() + RISK_LEVEL_CACHE_SECONDS
+    with _risk_levels_lock:
+        for key in (row.get("id"), row.get("user_id")):
+            if key:
+                _risk_levels[key] = (level, expires_at)
+
+
+def _forget_risk(row: dict) -> None:
+    with _risk_levels_lock:
+        for key in (row.get("id"), row.get("user_id")):
+            _risk_levels.pop(key, None)
+
 
 def get_patients() -> list:
     """
@@ -35,6 +66,7 @@ def get_patient_by_id(patient_id: str) -> dict:
         res = supabase.table("patients").select("*").eq("id", patient_id).execute()
         if not res.data or len(res.data) == 0:
             raise HTTPException(status_code=404, detail="Patient not found")
+        _remember_risk(res.data[0])
         return res.data[0]
     except HTTPException:
         raise
@@ -51,6 +83,7 @@ def get_patient_by_user_id(user_id: str) -> dict:
         res = supabase.table("patients").select("*").eq("user_id", user_id).execute()
         if not res.data or len(res.data) == 0:
             raise HTTPException(status_code=404, detail="Patient not found")
+        _remember_risk(res.data[0])
         return res.data[0]
     except HTTPException:
         raise
@@ -80,29 +113,27 @@ def resolve_patient_id(identifier: str) -> str | None:
         logger.warning("resolve_patient_id called with empty identifier")
         return None
     
-    logger.info(f"Resolving patient_id for identifier: {identifier}")
-    
     try:
         res = supabase.table("patients").select("id").eq("id", identifier).execute()
         if res.data and len(res.data) > 0:
             patient_id = res.data[0].get("id")
-            logger.info(f"Found patient by id: {patient_id}")
+            logger.debug("Found patient by id: %s", phi(patient_id))
             return patient_id
     except Exception as e:
-        logger.warning(f"Failed to resolve patient id by patients.id: {e}")
+        logger.warning("Failed to resolve patient id by patients.id: %s", e)
 
     try:
         res = supabase.table("patients").select("id").eq("user_id", identifier).execute()
         if res.data and len(res.data) > 0:
             patient_id = res.data[0].get("id")
-            logger.info(f"Found patient by user_id: {patient_id}")
+            logger.debug("Found patient by user_id: %s", phi(patient_id))
             return patient_id
         else:
-            logger.warning(f"No patient found for user_id: {identifier}. Available patients: {supabase.table('patients').select('id, user_id, name').execute().data if True else 'N/A'}")
+            logger.warning("No patient found for user_id: %s", phi(identifier))
     except Exception as e:
-        logger.error(f"Failed to resolve patient id by patients.user_id: {e}", exc_info=True)
+        logger.error("Failed to resolve patient id by patients.user_id: %s", e, exc_info=True)
 
-    logger.error(f"Could not resolve patient_id for identifier: {identifier}")
+    logger.error("Could not resolve patient_id for identifier: %s", phi(identifier))
     return None
 
 
@@ -154,6 +185,8 @@ def create_patient(
         res = supabase.table("patients").insert(payload).execute()
         if not res.data or len(res.data) == 0:
             raise HTTPException(status_code=500, detail="Failed to create patient")
+        notify("patients", "insert", res.data)
+        _remember_risk(res.data[0])
         return res.data[0]
     except HTTPException:
         raise
@@ -180,8 +213,77 @@ def update_patient_risk(user_id: str, risk_level: str) -> dict:
         )
         if not res.data or len(res.data) == 0:
             raise HTTPException(status_code=404, detail="Patient not found")
+        notify("patients", "update", res.data)
+        _remember_risk(res.data[0])
         return res.data[0]
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def get_cached_risk_level(identifier: str) -> str | None:
+    """Last risk_level seen for a patient (by patients.id or user_id) without querying, or None once it expires."""
+    with _risk_levels_lock:
+        cached = _risk_levels.get(identifier)
+        if cached is None:
+            return None
+        if cached[1] <= time.monotonic():
+            del _risk_levels[identifier]
+            return None
+        return cached[0]
+
+
+def set_patient_risk(user_id: str, risk_level: str) -> dict | None:
+    """
+    Like update_patient_risk, but skips the write when the cached risk_level already matches.
+    Returns the updated row, or None when the write was suppressed.
+    """
+    if get_cached_risk_level(user_id) == risk_level:
+        logger.debug("Risk level for %s already %s; skipping update", phi(user_id), risk_level)
+        return None
+    return update_patient_risk(user_id, risk_level)
+
+
+def bulk_update_risk(levels: dict[str, str]) -> int:
+    """
+    Write many risk levels at once. levels maps patients.id -> 'low' | 'medium' | 'high'.
+    Issues one UPDATE ... WHERE id IN (...) per distinct level. Returns the number of rows updated.
+    """
+    by_level: dict[str, list[str]] = {}
+    for patient_id, risk_level in levels.items():
+        if risk_level not in ("low", "medium", "high"):
+            raise HTTPException(status_code=400, detail="risk_level must be low, medium, or high")
+        by_level.setdefault(risk_level, []).append(patient_id)
+    updated = 0
+    try:
+        for risk_level, patient_ids in by_level.items():
+            res = supabase.table("patients").update({"risk_level": risk_level}).in_("id", patient_ids).execute()
+            rows = res.data or []
+            notify("patients", "update", rows)
+            for row in rows:
+                _remember_risk(row)
+            updated += len(rows)
+        return updated
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _on_patients(op: str, rows: list[dict]) -> None:
+    # Keeps risk levels current for writes made by other workers (app.bus)
+    for row in rows:
+        if op == "delete":
+            _forget_risk(row)
+        else:
+            _remember_risk(row)
+
+
+def _on_resync() -> None:
+    with _risk_levels_lock:
+        _risk_levels.clear()
+
+
+subscribe("patients", _on_patients)
+on_resync(_on_resync)
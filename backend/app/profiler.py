@@ -0,0 +1,334 @@
+"""
+On-demand sampling profiler (admin only).
+A capture samples every thread's Python stack with sys._current_frames() from a background thread,
+either for a fixed number of seconds or while the next N requests to one route are in flight.
+Wall-clock samples show where a slow request actually waits: Cohere or Supabase I/O on
+upstream threads, parsing in app.cohere_chat, logging, and so on.
+Results are collapsed stacks (flamegraph.pl / speedscope) or speedscope's JSON format.
+
+Nothing runs between captures: the sampler thread exists only during a capture, and
+ProfilerMiddleware costs one attribute check per request. By default only threads that are inside
+this backend's code are kept, so idle pool workers and the idle event loop do not drown the profile.
+
+With several workers, a capture samples only the worker that received the start call (its pid is in
+the status), and a route capture sees only the requests that worker serves. The status and, once
+done, the stacks are written to PROFILE_DIR under the capture id, so any worker can answer
+GET /api/admin/profile/{id}.
+"""
+
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HZ = 50
+MAX_HZ = 250
+MAX_SECONDS = 60
+MAX_REQUESTS = 100
+# A route capture ends after this long even if fewer requests arrived
+ROUTE_CAPTURE_TIMEOUT_SECONDS = 300
+# Route captures keep sampling this long after each request, to catch work it left in the background
+# (e.g. /api/chat's timeline extraction, which runs after the reply has streamed)
+DEFAULT_TAIL_SECONDS = 2.0
+MAX_TAIL_SECONDS = 30.0
+# Distinct stacks kept per capture; further new stacks are counted as dropped
+MAX_STACKS = 20000
+# Shared by the workers on one box; only the newest PROFILE_KEEP captures are kept
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "carebridge-profiles")
+PROFILE_KEEP = 20
+_CAPTURE_ID = re.compile(r"^[0-9a-f]{12}$")
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SELF_FILE = os.path.abspath(__file__)
+_STDLIB_DIR = os.path.dirname(os.__file__)
+
+_labels: dict = {}
+_capture: "_Capture | None" = None
+_last: "_Capture | None" = None
+_lock = threading.Lock()
+
+
+def _label(code) -> str:
+    """'qualname (file:line)' for a code object; cached, since the same functions recur in every sample."""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_BACKEND_DIR):
+            filename = os.path.relpath(filename, _BACKEND_DIR)
+        elif "site-packages" in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[-1]
+        elif filename.startswith(_STDLIB_DIR):
+            filename = os.path.relpath(filename, _STDLIB_DIR)
+        label = f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+class _Capture:
+    def __init__(self, hz: int, seconds: float | None, route: str | None, requests: int, tail: float, all_threads: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.interval = 1.0 / hz
+        self.hz = hz
+        self.route = route
+        self.remaining = requests if route else 0
+        self.requests = 0
+        self.in_flight = 0
+        self.tail = tail
+        self.tail_until = 0.0
+        self.all_threads = all_threads
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + (seconds if route is None else ROUTE_CAPTURE_TIMEOUT_SECONDS)
+        self.sampled_seconds = 0.0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.pid = os.getpid()
+        self.done = threading.Event()
+
+    @classmethod
+    def restore(cls, data: dict) -> "_Capture":
+        """A capture saved by (possibly) another worker, for status and output only."""
+        status = data["status"]
+        capture = cls.__new__(cls)
+        capture.id = status["id"]
+        capture.hz = status["hz"]
+        capture.interval = 1.0 / capture.hz
+        capture.route = status["route"]
+        capture.requests = status["requestsProfiled"]
+        capture.samples = status["samples"]
+        capture.dropped = status["droppedSamples"]
+        capture.sampled_seconds = status["sampledSeconds"]
+        capture.started_at = datetime.fromisoformat(status["startedAt"]).timestamp()
+        capture.pid = status["pid"]
+        capture.stacks = Counter({tuple(stack): count for stack, count in data.get("stacks", ())})
+        capture.done = threading.Event()
+        if status["state"] == "done":
+            capture.done.set()
+        return capture
+
+    # --- route mode (called from ProfilerMiddleware on the event loop) ---
+
+    def admit(self, path: str) -> bool:
+        if path != self.route or self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        self.requests += 1
+        self.in_flight += 1
+        return True
+
+    def finish_request(self) -> None:
+        self.in_flight -= 1
+        self.tail_until = time.monotonic() + self.tail
+
+    # --- sampling ---
+
+    def _active(self) -> bool:
+        return self.route is None or self.in_flight > 0 or time.monotonic() < self.tail_until
+
+    def _finished(self) -> bool:
+        if time.monotonic() >= self.deadline:
+            return True
+        return self.route is not None and self.remaining <= 0 and not self._active()
+
+    def _sample(self, own_thread: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            in_backend = self.all_threads
+            while frame is not None:
+                code = frame.f_code
+                if not in_backend and code.co_filename.startswith(_BACKEND_DIR) and code.co_filename != _SELF_FILE:
+                    in_backend = "site-packages" not in code.co_filename
+                stack.append(_label(code))
+                frame = frame.f_back
+            if not in_backend:
+                continue
+            stack.append(f"thread {names.get(thread_id, thread_id)}")
+            key = tuple(reversed(stack))
+            if key in self.stacks or len(self.stacks) < MAX_STACKS:
+                self.stacks[key] += 1
+            else:
+                self.dropped += 1
+            self.samples += 1
+
+    def run(self) -> None:
+        own_thread = threading.get_ident()
+        try:
+            while not self._finished():
+                start = time.monotonic()
+                if self._active():
+                    self._sample(own_thread)
+                    self.sampled_seconds += self.interval
+                time.sleep(max(self.interval - (time.monotonic() - start), 0))
+        except Exception as e:
+            logger.error("Profiler capture %s failed: %s", self.id, e, exc_info=True)
+        finally:
+            self.done.set()
+            _finish(self)
+
+    # --- output ---
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "state": "done" if self.done.is_set() else "running",
+            "mode": "route" if self.route else "duration",
+            "route": self.route,
+            "pid": self.pid,
+            "requestsProfiled": self.requests,
+            "hz": self.hz,
+            "samples": self.samples,
+            "distinctStacks": len(self.stacks),
+            "droppedSamples": self.dropped,
+            "sampledSeconds": round(self.sampled_seconds, 2),
+            "startedAt": datetime.fromtimestamp(self.started_at, tz=timezone.utc).isoformat(),
+        }
+
+    def save(self) -> None:
+        """Write the status (and, once done, the stacks) to PROFILE_DIR/<id>.json for the other workers."""
+        data = {"status": self.status()}
+        if self.done.is_set():
+            data["stacks"] = [[list(stack), count] for stack, count in self.stacks.items()]
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{self.id}.json")
+            with open(f"{path}.{self.pid}.tmp", "wb") as f:
+                f.write(orjson.dumps(data))
+            os.replace(f"{path}.{self.pid}.tmp", path)
+        except OSError as e:
+            logger.error("Failed to save profiler capture %s: %s", self.id, e)
+
+    def collapsed(self) -> str:
+        """One 'frame;frame;frame count' line per distinct stack, root first (flamegraph.pl / speedscope)."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def speedscope(self) -> dict:
+        frame_index: dict[str, int] = {}
+        frames: list[dict] = []
+        samples: list[list[int]] = []
+        weights: list[float] = []
+        for stack, count in self.stacks.items():
+            indexes = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indexes.append(frame_index[label])
+            samples.append(indexes)
+            weights.append(count * self.interval)
+        name = f"{self.route or 'all requests'} ({self.id})"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "carebridge-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+def _prune_saved() -> None:
+    try:
+        entries = sorted(
+            (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True,
+        )
+        for entry in entries[PROFILE_KEEP:]:
+            os.unlink(entry.path)
+    except OSError as e:
+        logger.warning("Failed to prune saved profiler captures: %s", e)
+
+
+def _finish(capture: _Capture) -> None:
+    global _capture, _last
+    with _lock:
+        if _capture is capture:
+            _capture = None
+        _last = capture
+    capture.save()
+    _prune_saved()
+    logger.info("Profiler capture %s finished: %d samples, %d requests", capture.id, capture.samples, capture.requests)
+
+
+def start_capture(
+    seconds: float | None = None,
+    route: str | None = None,
+    requests: int = 1,
+    hz: int = DEFAULT_HZ,
+    tail_seconds: float = DEFAULT_TAIL_SECONDS,
+    all_threads: bool = False,
+) -> dict | None:
+    """
+    Start sampling for `seconds`, or (with route) while the next `requests` requests to that exact
+    path are in flight and for tail_seconds after each. Returns the capture's status, or None if
+    another capture is running.
+    """
+    global _capture
+    hz = max(1, min(hz, MAX_HZ))
+    tail_seconds = max(0.0, min(tail_seconds, MAX_TAIL_SECONDS))
+    if route is None:
+        seconds = max(0.1, min(seconds or 10, MAX_SECONDS))
+    requests = max(1, min(requests, MAX_REQUESTS))
+    with _lock:
+        if _capture is not None:
+            return None
+        capture = _Capture(hz, seconds, route, requests, tail_seconds, all_threads)
+        _capture = capture
+    capture.save()
+    threading.Thread(target=capture.run, name="profiler", daemon=True).start()
+    logger.info("Profiler capture %s started (%s, %s Hz)", capture.id, route or f"{seconds}s", hz)
+    return capture.status()
+
+
+def get_capture(capture_id: str) -> "_Capture | None":
+    """This worker's current or last capture, or one any worker saved to PROFILE_DIR."""
+    with _lock:
+        for capture in (_capture, _last):
+            if capture is not None and capture.id == capture_id:
+                return capture
+    if not _CAPTURE_ID.match(capture_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{capture_id}.json"), "rb") as f:
+            return _Capture.restore(orjson.loads(f.read()))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.error("Failed to load profiler capture %s: %s", capture_id, e)
+        return None
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware marking when requests to a route capture's path are in flight."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        capture = _capture
+        if capture is None or scope["type"] != "http" or not capture.admit(scope["path"]):
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            capture.finish_request()
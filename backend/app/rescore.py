@@ -0,0 +1,192 @@
+"""
+Bulk re-scoring of every patient's risk_level.
+Run after changing the keywords or rules in app.risk_rules.
+Patients are streamed in id order in chunks; each chunk's recent user messages and symptom events are
+fetched in bulk, scored across a process pool, and raised levels are written back with
+app.patients.bulk_update_risk. A checkpoint file records the last fully written patient id so a
+stopped job can resume.
+Pool workers are spawned, not forked from the (threaded) server, and only run app.risk_rules.
+Levels are only raised: a stored level may come from a chat keyword or a doctor, and only the trend
+scorer (app.risk_scoring) knows which levels it set and may lower.
+
+CLI:  python -m app.rescore [--resume] [--workers N] [--chunk-size N] [--dry-run]
+API:  POST /api/admin/rescore (start), GET /api/admin/rescore (progress)
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.export import paged_rows
+from app.patients import bulk_update_risk
+from app.risk_rules import RISK_ORDER, WINDOW_DAYS, parse_timestamp, score_chunk
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.getenv("RESCORE_CHECKPOINT", "rescore_checkpoint.json")
+DEFAULT_CHUNK_SIZE = 500
+# Chunks scored concurrently while the next ones are being fetched
+MAX_IN_FLIGHT = 4
+
+_status: dict = {"state": "idle"}
+_status_lock = threading.Lock()
+_job_thread: threading.Thread | None = None
+
+
+def _set_status(**values) -> None:
+    with _status_lock:
+        _status.update(values)
+
+
+def get_status() -> dict:
+    with _status_lock:
+        return dict(_status)
+
+
+def _read_checkpoint() -> dict:
+    try:
+        with open(CHECKPOINT_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_checkpoint(checkpoint: dict) -> None:
+    tmp = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, CHECKPOINT_PATH)
+
+
+def _load_chunk(patients: list[dict], since: str) -> list[tuple[str, list[str], list[tuple[float, str, object]]]]:
+    """Recent user messages and symptom events for a chunk of patients, with two bulk reads."""
+    ids = [p["id"] for p in patients]
+    messages: dict[str, list[str]] = {pid: [] for pid in ids}
+    events: dict[str, list[tuple[float, str, object]]] = {pid: [] for pid in ids}
+    for row in paged_rows(
+        "messages",
+        [("in_", "patient_id", ids), ("eq", "role", "user"), ("gte", "created_at", since)],
+        columns="id, patient_id, content",
+    ):
+        messages[row["patient_id"]].append(row.get("content") or "")
+    for row in paged_rows(
+        "timeline_events",
+        [("in_", "patient_id", ids), ("eq", "type", "symptom"), ("gte", "created_at", since)],
+        columns="id, patient_id, title, details, created_at",
+    ):
+        ts = parse_timestamp(row.get("created_at"))
+        if ts is not None:
+            events[row["patient_id"]].append((ts, row.get("title"), row.get("details")))
+    return [(pid, messages[pid], events[pid]) for pid in ids]
+
+
+def _chunks(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_rescore(
+    resume: bool = False,
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Re-score every patient. Returns the final status.
+    With resume, continues after the checkpoint's last_id and keeps its counters.
+    """
+    checkpoint = _read_checkpoint() if resume else {}
+    last_id = checkpoint.get("last_id")
+    processed = checkpoint.get("processed", 0)
+    changed = checkpoint.get("changed", 0)
+    now = time.time()
+    since = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now - WINDOW_DAYS * 86400))
+    started = time.monotonic()
+    with _status_lock:
+        _status.clear()
+    _set_status(state="running", processed=processed, changed=changed, last_id=last_id, dry_run=dry_run, error=None)
+    logger.info("Rescore started (resume=%s, after id=%s, workers=%s, dry_run=%s)", resume, last_id, workers or os.cpu_count(), dry_run)
+
+    filters = [("gt", "id", last_id)] if last_id else []
+    patients = paged_rows("patients", filters, columns="id, risk_level")
+    in_flight: deque = deque()
+
+    def finish_oldest():
+        nonlocal processed, changed
+        chunk, future = in_flight.popleft()
+        current = {p["id"]: p.get("risk_level") or "low" for p in chunk}
+        updates = {pid: level for pid, level in future.result() if RISK_ORDER[level] > RISK_ORDER.get(current[pid], 0)}
+        if updates and not dry_run:
+            bulk_update_risk(updates)
+        processed += len(chunk)
+        changed += len(updates)
+        # Chunks finish in id order, so everything up to this chunk is written
+        if not dry_run:
+            _write_checkpoint({"last_id": chunk[-1]["id"], "processed": processed, "changed": changed})
+        rate = (processed - checkpoint.get("processed", 0)) / max(time.monotonic() - started, 1e-6)
+        _set_status(processed=processed, changed=changed, last_id=chunk[-1]["id"], rate_per_second=round(rate, 1))
+        logger.info("Rescore progress: %d patients, %d changed (%.0f/s)", processed, changed, rate)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for chunk in _chunks(patients, chunk_size):
+                items = _load_chunk(chunk, since)
+                in_flight.append((chunk, pool.submit(score_chunk, items, now)))
+                if len(in_flight) >= MAX_IN_FLIGHT:
+                    finish_oldest()
+            while in_flight:
+                finish_oldest()
+    except Exception as e:
+        logger.error("Rescore failed after %d patients: %s", processed, e, exc_info=True)
+        _set_status(state="failed", error=str(e))
+        raise
+    _set_status(state="done", finished_in_seconds=round(time.monotonic() - started, 1))
+    logger.info("Rescore finished: %d patients, %d changed", processed, changed)
+    return get_status()
+
+
+def start_rescore_job(**options) -> dict:
+    """Run run_rescore in a background thread. started is False when a job is already running."""
+    global _job_thread
+    with _status_lock:
+        if _job_thread is not None and _job_thread.is_alive():
+            return {"started": False, **_status}
+        _status["state"] = "starting"
+
+        def target():
+            try:
+                run_rescore(**options)
+            except Exception:
+                pass  # already logged and recorded in status
+
+        _job_thread = threading.Thread(target=target, name="rescore", daemon=True)
+        _job_thread.start()
+    return {"started": True, **get_status()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-score every patient's risk_level.")
+    parser.add_argument("--resume", action="store_true", help=f"continue from {CHECKPOINT_PATH}")
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="score and report without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    status = run_rescore(resume=args.resume, workers=args.workers, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    print(json.dumps(status, indent=2))
+
+
+if __name__ == "__main__":
+    main()
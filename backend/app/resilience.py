@@ -0,0 +1,345 @@
+"""
+Resilience for upstream providers (Supabase, Cohere, ElevenLabs).
+Each Upstream has a circuit breaker (closed -> open after consecutive failures -> half-open probe),
+a per-call deadline, and recent-latency stats. Idempotent reads can be hedged: if the first attempt
+has not answered by the upstream's p95 latency, a duplicate is sent and whichever answers first wins.
+Calls that cannot be served raise UpstreamUnavailable, an HTTPException(503), so app.* modules'
+`except HTTPException: raise` passes it straight through to the client with Retry-After.
+An upstream can also cap its concurrent calls (max_concurrency): callers wait up to
+UPSTREAM_QUEUE_WAIT_SECONDS for a slot and are then turned away with the same 503.
+A stream can be admitted ahead of time (Upstream.reserve), so a route can answer 503 before its
+streaming response has started instead of failing inside a 200.
+Sync client calls cannot be cancelled: a call that misses its deadline keeps its worker thread
+until the provider answers, but the request (and its concurrency slot) is released immediately.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+RESET_TIMEOUT_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+MAX_WORKERS = int(os.getenv("UPSTREAM_MAX_WORKERS", "32"))
+# Hedging starts once this many latencies are known, and never earlier than HEDGE_MIN_DELAY_SECONDS
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_SECONDS = 0.05
+LATENCY_SAMPLES = 200
+UPSTREAM_QUEUE_WAIT_SECONDS = float(os.getenv("UPSTREAM_QUEUE_WAIT_SECONDS", "1"))
+
+_registry: dict[str, "Upstream"] = {}
+
+
+class UpstreamUnavailable(HTTPException):
+    """The upstream is failing fast (circuit open) or did not answer within its deadline."""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{upstream} is unavailable ({reason})",
+            headers={"Retry-After": str(max(int(retry_after), 1))},
+        )
+        self.upstream = upstream
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker. While open, calls are rejected; after reset_timeout one probe is let through."""
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 1.0)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self) -> None:
+        """Give up a half-open probe without an outcome (e.g. the caller went away)."""
+        with self._lock:
+            self._probing = False
+
+
+class StreamReservation:
+    """An admitted stream's concurrency slot and half-open probe, from Upstream.reserve. release() is idempotent."""
+
+    def __init__(self, upstream: "Upstream"):
+        self._upstream = upstream
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self, settled: bool = False) -> None:
+        """Give the slot back; settled means the breaker already recorded the stream's outcome."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._upstream._leave()
+        if not settled:
+            self._upstream.breaker.release()
+
+
+class Upstream:
+    """
+    One provider: breaker, deadline, latency stats and a worker pool for its blocking calls.
+    is_failure decides which exceptions count against the breaker (e.g. not a 4xx from a healthy API).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deadline: float,
+        is_failure: Callable[[BaseException], bool] | None = None,
+        max_concurrency: int | None = None,
+    ):
+        self.name = name
+        self.deadline = deadline
+        self.is_failure = is_failure or (lambda e: True)
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix=f"upstream-{name}")
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saturated = 0
+        _registry[name] = self
+
+    def p95(self) -> float | None:
+        samples = list(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        samples.sort()
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def _admit(self) -> None:
+        """Take a concurrency slot and pass the breaker; the caller must _leave() afterwards."""
+        self.calls += 1
+        if self._slots is not None and not self._slots.acquire(timeout=UPSTREAM_QUEUE_WAIT_SECONDS):
+            self.saturated += 1
+            raise UpstreamUnavailable(self.name, "at capacity", 1)
+        if not self.breaker.allow():
+            self._leave()
+            self.rejected += 1
+            raise UpstreamUnavailable(self.name, "circuit open", self.breaker.retry_after())
+
+    def _leave(self) -> None:
+        if self._slots is not None:
+            self._slots.release()
+
+    def _succeeded(self, elapsed: float) -> None:
+        self._latencies.append(elapsed)
+        self.breaker.record_success()
+
+    def _failed(self, error: BaseException) -> None:
+        if self.is_failure(error):
+            logger.warning("%s call failed: %s: %s", self.name, type(error).__name__, error)
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _timed_out(self, deadline: float) -> UpstreamUnavailable:
+        self.timeouts += 1
+        self.breaker.record_failure()
+        logger.warning("%s call exceeded its %.1fs deadline", self.name, deadline)
+        return UpstreamUnavailable(self.name, f"no response within {deadline:.1f}s", self.breaker.retry_after())
+
+    def call(self, fn: Callable[..., Any], *args, deadline: float | None = None, hedge: bool = False, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) within the deadline. With hedge (idempotent calls only), send one
+        duplicate after the p95 latency and return whichever attempt succeeds first.
+        """
+        self._admit()
+        try:
+            return self._call(fn, args, kwargs, self.deadline if deadline is None else deadline, hedge)
+        finally:
+            self._leave()
+
+    def _call(self, fn: Callable[..., Any], args: tuple, kwargs: dict, deadline: float, hedge: bool) -> Any:
+        start = time.monotonic()
+        end = start + deadline
+        hedge_delay = self.p95() if hedge and self.breaker.state == "closed" else None
+        hedge_at = start + max(hedge_delay, HEDGE_MIN_DELAY_SECONDS) if hedge_delay is not None else None
+        first = self._executor.submit(fn, *args, **kwargs)
+        pending = {first}
+        error: BaseException | None = None
+        while pending:
+            wait_until = min(end, hedge_at) if hedge_at is not None else end
+            done, pending = wait(pending, timeout=max(wait_until - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self.hedge_wins += 1
+                    self._succeeded(time.monotonic() - start)
+                    return future.result()
+                error = future.exception()
+            if done:
+                continue
+            if hedge_at is not None and time.monotonic() < end:
+                self.hedges += 1
+                hedge_at = None
+                pending.add(self._executor.submit(fn, *args, **kwargs))
+                continue
+            raise self._timed_out(deadline)
+        self._failed(error)
+        raise error
+
+    def reserve(self) -> StreamReservation:
+        """Admit a stream now (slot and breaker) and hand it to stream() later. Raises UpstreamUnavailable."""
+        self._admit()
+        return StreamReservation(self)
+
+    def stream(
+        self,
+        open_stream: Callable[[], Iterator],
+        first_item_deadline: float,
+        idle_deadline: float,
+        reservation: StreamReservation | None = None,
+    ) -> Iterator:
+        """
+        Iterate open_stream() on a worker thread, failing if the first item takes longer than
+        first_item_deadline or any later gap exceeds idle_deadline.
+        Admits the stream on first iteration unless a reservation from reserve() is passed in.
+        """
+        if reservation is None:
+            reservation = self.reserve()
+        items: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def pump():
+            try:
+                for item in open_stream():
+                    if stop.is_set():
+                        return
+                    items.put((True, item))
+                items.put((True, done))
+            except BaseException as e:
+                items.put((False, e))
+
+        start = time.monotonic()
+        outcome = False
+        self._executor.submit(pump)
+        try:
+            timeout = first_item_deadline
+            while True:
+                try:
+                    ok, item = items.get(timeout=timeout)
+                except queue.Empty:
+                    outcome = True
+                    raise self._timed_out(timeout)
+                if not ok:
+                    outcome = True
+                    self._failed(item)
+                    raise item
+                if not outcome:
+                    outcome = True
+                    self._succeeded(time.monotonic() - start)
+                if item is done:
+                    return
+                timeout = idle_deadline
+                yield item
+        finally:
+            stop.set()
+            reservation.release(settled=outcome)
+
+    def stats(self) -> dict:
+        p95 = self.p95()
+        return {
+            "state": self.breaker.state,
+            "consecutiveFailures": self.breaker.failures,
+            "deadlineSeconds": self.deadline,
+            "p95Ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedgeWins": self.hedge_wins,
+            "maxConcurrency": self.max_concurrency,
+            "saturated": self.saturated,
+        }
+
+
+def get_upstream_stats() -> dict:
+    return {name: upstream.stats() for name, upstream in _registry.items()}
+
+
+class _GuardedQuery:
+    """Wraps a query builder; chained calls stay wrapped and execute() goes through the upstream."""
+
+    _WRITES = ("insert", "update", "upsert", "delete")
+
+    def __init__(self, upstream: Upstream, builder: Any, read: bool = False):
+        self._upstream = upstream
+        self._builder = builder
+        self._read = read
+
+    def execute(self):
+        # Only reads are hedged: a duplicated write could apply twice
+        return self._upstream.call(self._builder.execute, hedge=self._read)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+        read = True if name == "select" else False if name in self._WRITES else self._read
+
+        def method(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _GuardedQuery(self._upstream, result, read) if hasattr(result, "execute") else result
+
+        return method
+
+
+class GuardedClient:
+    """Proxy for a Supabase-style client: table(...) queries run through the upstream; anything else passes through."""
+
+    def __init__(self, client: Any, upstream: Upstream):
+        self._client = client
+        self._upstream = upstream
+
+    def table(self, name: str) -> _GuardedQuery:
+        return _GuardedQuery(self._upstream, self._client.table(name))
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
@@ -0,0 +1,135 @@
+"""
+Fast JSON responses with negotiated encoding.
+FastJSONResponse serializes with orjson and, depending on the request's Accept / Accept-Encoding
+headers, returns MessagePack instead of JSON and compresses bodies above COMPRESS_MIN_BYTES
+with brotli or gzip. NegotiationMiddleware records those headers for the response class.
+brotli and msgpack are optional: without them only gzip and JSON are offered.
+"""
+
+import contextvars
+import os
+import zlib
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+# Brotli's fast end: most of its ratio advantage at gzip-like speed
+BROTLI_QUALITY = 4
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# (Accept, Accept-Encoding) of the current request
+_negotiation: contextvars.ContextVar[tuple[str, str]] = contextvars.ContextVar("negotiation", default=("", ""))
+
+
+def _accepted(header: str) -> dict[str, float]:
+    """Parse an Accept-style header into {token: q}."""
+    accepted = {}
+    for part in header.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token.strip()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Preferred content coding we support: 'br', 'gzip' or None."""
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def wants_msgpack(accept: str) -> bool:
+    if msgpack is None:
+        return False
+    accepted = _accepted(accept)
+    return any(accepted.get(media_type, 0.0) > 0 for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    return compressor.compress(body) + compressor.flush()
+
+
+def _msgpack_default(obj: Any) -> Any:
+    # numpy scalars/arrays have tolist(); anything else (datetime, UUID) goes as text
+    return obj.tolist() if hasattr(obj, "tolist") else str(obj)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, negotiated to MessagePack and/or compressed."""
+
+    content_encoding: str | None = None
+
+    def render(self, content: Any) -> bytes:
+        accept, accept_encoding = _negotiation.get()
+        if wants_msgpack(accept):
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+            body = msgpack.packb(content, default=_msgpack_default)
+        else:
+            body = orjson.dumps(
+                content,
+                default=str,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            )
+        coding = choose_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+        if coding:
+            body = compress(body, coding)
+            self.content_encoding = coding
+        return body
+
+    def init_headers(self, headers=None) -> None:
+        # render() runs before the headers exist, so its choices are applied here
+        super().init_headers(headers)
+        if self.content_encoding:
+            self.raw_headers.append((b"content-encoding", self.content_encoding.encode("latin-1")))
+        self.raw_headers.append((b"vary", b"Accept, Accept-Encoding"))
+
+
+class NegotiationMiddleware:
+    """Pure ASGI middleware exposing Accept / Accept-Encoding to FastJSONResponse via a contextvar."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        token = _negotiation.set((
+            headers.get(b"accept", b"").decode("latin-1"),
+            headers.get(b"accept-encoding", b"").decode("latin-1"),
+        ))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _negotiation.reset(token)
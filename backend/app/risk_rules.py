@@ -0,0 +1,103 @@
+"""
+Risk rules: chat risk keywords and the trend score over symptom events.
+Pure functions over plain values with no I/O and nothing started at import, so bulk re-scoring
+(app.rescore) can run them in spawned worker processes. app.cohere_chat and app.risk_scoring use them.
+"""
+
+import math
+from datetime import datetime, timezone
+
+HIGH_RISK_KEYWORDS = [
+    "chest pain", "chest tightness", "difficulty breathing", "can't breathe",
+    "severe pain", "unconscious", "fainted", "bleeding heavily", "suicidal",
+    "want to die", "heart attack", "stroke", "seizure", "numbness",
+]
+
+MEDIUM_RISK_KEYWORDS = [
+    "fever", "persistent", "worsening", "dizzy", "nausea", "vomiting",
+    "can't sleep", "insomnia", "anxiety", "anxious", "depressed",
+    "shortness of breath", "headache", "migraine", "palpitations",
+]
+
+WINDOW_DAYS = 14
+HALF_LIFE_DAYS = 7
+SEVERITY_WEIGHTS = {"high": 6.0, "medium": 2.0, "low": 1.0}
+# score >= threshold -> level. A mild symptom every day reaches "medium" in about ten days;
+# two or three high-severity symptoms within a few days reach "high".
+LEVEL_THRESHOLDS = (("high", 12.0), ("medium", 5.0))
+RISK_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+WINDOW_SECONDS = WINDOW_DAYS * 86400
+_HALF_LIFE_SECONDS = HALF_LIFE_DAYS * 86400
+
+
+def match_risk_keyword(message: str) -> tuple[str, str | None]:
+    """
+    Return (risk_level, matched_keyword) for a message.
+    risk_level is 'high', 'medium', or 'low'; matched_keyword is None for 'low'.
+    """
+    lower = message.lower()
+    for kw in HIGH_RISK_KEYWORDS:
+        if kw in lower:
+            return "high", kw
+    for kw in MEDIUM_RISK_KEYWORDS:
+        if kw in lower:
+            return "medium", kw
+    return "low", None
+
+
+def assess_risk(message: str) -> str:
+    """Return 'high', 'medium', or 'low' based on keyword presence in message."""
+    return match_risk_keyword(message)[0]
+
+
+def parse_timestamp(value) -> float | None:
+    """ISO timestamp (or YYYY-MM-DD) -> epoch seconds, naive values as UTC. None when unparseable."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def symptom_weight(title: str, details) -> float:
+    """Severity weight of one symptom event, from the same keywords as chat risk assessment."""
+    text = details.get("text", "") if isinstance(details, dict) else (details or "")
+    level, _ = match_risk_keyword(f"{title or ''} {text}")
+    return SEVERITY_WEIGHTS[level]
+
+
+def decay(age_seconds: float) -> float:
+    return math.pow(2.0, -max(age_seconds, 0.0) / _HALF_LIFE_SECONDS)
+
+
+def score_events(events: list[tuple[float, float]], now: float) -> float:
+    """Score of (timestamp, weight) events as of now, counting only the sliding window."""
+    return sum(w * decay(now - ts) for ts, w in events if now - ts <= WINDOW_SECONDS)
+
+
+def level_for_score(score: float) -> str:
+    for level, threshold in LEVEL_THRESHOLDS:
+        if score >= threshold:
+            return level
+    return "low"
+
+
+def score_patient(messages: list[str], events: list[tuple[float, str, object]], now: float) -> str:
+    """
+    Full risk rule for one patient, as used by bulk re-scoring:
+    'high' if any recent user message has a high-risk keyword (as in the chat pipeline),
+    otherwise the trend level over (timestamp, title, details) symptom events.
+    """
+    if any(assess_risk(text) == "high" for text in messages):
+        return "high"
+    return level_for_score(score_events([(ts, symptom_weight(title, details)) for ts, title, details in events], now))
+
+
+def score_chunk(items: list[tuple[str, list[str], list[tuple[float, str, object]]]], now: float) -> list[tuple[str, str]]:
+    """Process-pool worker: [(patient_id, messages, events)] -> [(patient_id, level)]."""
+    return [(patient_id, score_patient(messages, events, now)) for patient_id, messages, events in items]
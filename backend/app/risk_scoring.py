@@ -0,0 +1,245 @@
+"""
+Trend-based risk scoring over timeline symptom events.
+Each symptom contributes a severity weight (from the chat risk keywords in app.risk_rules) that decays with age;
+the score is the decayed sum over a sliding window, so frequency, recency and severity all count.
+Per-patient state is updated in O(1) from timeline_events writes (app.changes) and warm-loaded
+lazily with one query per patient. risk_level is written only when the level crosses a threshold.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from app.changes import is_remote, on_resync, subscribe
+from app.logs import phi
+from app.patients import (
+    get_cached_risk_level,
+    get_patient_by_id,
+    get_patient_by_user_id,
+    resolve_patient_id,
+    set_patient_risk,
+)
+from app.risk_rules import (
+    RISK_ORDER,
+    WINDOW_DAYS,
+    WINDOW_SECONDS as _WINDOW_SECONDS,
+    decay,
+    level_for_score,
+    parse_timestamp,
+    symptom_weight,
+)
+from app.supabase import supabase
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACKED_PATIENTS = 10000
+
+
+class _PatientTrend:
+    """Sliding window of one patient's symptom events with a running decayed score."""
+
+    def __init__(self, user_id: str | None):
+        self.user_id = user_id
+        self.events: dict[str, tuple[float, float]] = {}  # event id -> (timestamp, weight)
+        self.order: deque = deque()  # event ids in arrival order, for window eviction
+        self.score = 0.0
+        self.as_of = time.time()
+        self.level = "low"
+        # risk_level this trend last wrote, while it is still the stored level's source. A trend only
+        # lowers a level it set itself; None after a restart or once a keyword sets the level.
+        self.written: str | None = None
+
+    def _advance(self, now: float) -> None:
+        self.score *= decay(now - self.as_of)
+        self.as_of = now
+        while self.order:
+            event_id = self.order[0]
+            entry = self.events.get(event_id)
+            if entry is not None and now - entry[0] <= _WINDOW_SECONDS:
+                break
+            self.order.popleft()
+            if entry is not None:
+                self._remove(event_id)
+
+    def _remove(self, event_id: str) -> None:
+        ts, w = self.events.pop(event_id)
+        self.score = max(self.score - w * decay(self.as_of - ts), 0.0)
+
+    def add(self, event_id: str, ts: float, weight: float, now: float) -> None:
+        self._advance(now)
+        ts = min(ts, now)
+        if event_id in self.events or now - ts > _WINDOW_SECONDS:
+            return
+        self.events[event_id] = (ts, weight)
+        self.order.append(event_id)
+        self.score += weight * decay(now - ts)
+
+    def discard(self, event_id: str, now: float) -> None:
+        self._advance(now)
+        if event_id in self.events:
+            self._remove(event_id)
+
+
+_trends: "OrderedDict[str, _PatientTrend]" = OrderedDict()
+_trends_lock = threading.Lock()
+# One worker keeps updates off the request path and serializes them per process
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="risk-scoring")
+
+
+def _load_trend(patient_id: str) -> _PatientTrend:
+    """Warm-load one patient's window from timeline_events (one query) and set its baseline level."""
+    try:
+        user_id = get_patient_by_id(patient_id).get("user_id")
+    except HTTPException:
+        user_id = None
+    trend = _PatientTrend(user_id)
+    now = time.time()
+    since = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now - _WINDOW_SECONDS))
+    res = (
+        supabase.table("timeline_events")
+        .select("id, title, details, created_at")
+        .eq("patient_id", patient_id)
+        .eq("type", "symptom")
+        .gte("created_at", since)
+        .order("created_at")
+        .execute()
+    )
+    for row in res.data or []:
+        ts = parse_timestamp(row.get("created_at"))
+        if ts is not None:
+            trend.add(row["id"], ts, symptom_weight(row.get("title"), row.get("details")), now)
+    trend.level = level_for_score(trend.score)
+    return trend
+
+
+def _get_trend(patient_id: str) -> _PatientTrend:
+    with _trends_lock:
+        trend = _trends.get(patient_id)
+        if trend is not None:
+            _trends.move_to_end(patient_id)
+            return trend
+    trend = _load_trend(patient_id)
+    with _trends_lock:
+        _trends[patient_id] = trend
+        while len(_trends) > MAX_TRACKED_PATIENTS:
+            _trends.popitem(last=False)
+    return trend
+
+
+def _current_level(user_id: str) -> str | None:
+    level = get_cached_risk_level(user_id)
+    if level is None:
+        try:
+            level = get_patient_by_user_id(user_id).get("risk_level")
+        except HTTPException:
+            return None
+    return level
+
+
+def _apply_level(patient_id: str, trend: _PatientTrend) -> None:
+    level = level_for_score(trend.score)
+    if level == trend.level:
+        return
+    previous, trend.level = trend.level, level
+    if not trend.user_id:
+        return
+    current = _current_level(trend.user_id)
+    if RISK_ORDER[level] > RISK_ORDER[previous]:
+        # A rising trend never lowers a level set elsewhere (e.g. an acute high-risk chat message)
+        if RISK_ORDER.get(current, -1) >= RISK_ORDER[level]:
+            return
+    elif trend.written is None or current != trend.written:
+        # A falling trend only takes back a level it set; keyword (or manual) levels stay put
+        return
+    logger.info("Trend risk for patient %s crossed %s -> %s (score %.2f)", phi(patient_id), previous, level, trend.score)
+    try:
+        set_patient_risk(trend.user_id, level)
+        trend.written = level
+    except HTTPException as he:
+        logger.error("Failed to update trend risk for patient %s: %s", phi(patient_id), he.detail)
+
+
+def _disown(patient_id: str) -> None:
+    with _trends_lock:
+        trend = _trends.get(patient_id)
+    if trend is not None:
+        trend.written = None
+
+
+def record_keyword_risk(patient_id: str) -> None:
+    """
+    Note that a keyword (not the trend) just set this patient's risk_level (patients.id), so a later
+    falling trend leaves it alone. Queued behind pending trend updates, like them.
+    """
+    _executor.submit(_disown, patient_id).add_done_callback(_log_failure)
+
+
+def _process(op: str, rows: list[dict], apply_level: bool = True) -> None:
+    now = time.time()
+    for row in rows:
+        patient_id = row.get("patient_id")
+        if not patient_id or row.get("type") != "symptom" or not row.get("id"):
+            continue
+        trend = _get_trend(patient_id)
+        if op == "insert":
+            # No-op when a fresh warm-load already picked this row up
+            ts = parse_timestamp(row.get("created_at")) or now
+            trend.add(row["id"], ts, symptom_weight(row.get("title"), row.get("details")), now)
+        elif op == "update" and "title" in row:
+            # A merged duplicate (app.timeline_dedup) may carry a more specific title or details: re-weight it
+            ts = parse_timestamp(row.get("created_at")) or now
+            trend.discard(row["id"], now)
+            trend.add(row["id"], ts, symptom_weight(row.get("title"), row.get("details")), now)
+        elif op == "delete":
+            trend.discard(row["id"], now)
+        if apply_level:
+            _apply_level(patient_id, trend)
+        else:
+            # Another worker made this write and applies the level; just keep our baseline in step
+            trend.level = level_for_score(trend.score)
+
+
+def _on_timeline(op: str, rows: list[dict]) -> None:
+    _executor.submit(_process, op, rows, not is_remote()).add_done_callback(_log_failure)
+
+
+def _log_failure(future) -> None:
+    if future.exception() is not None:
+        logger.error("Trend risk update failed: %s", future.exception())
+
+
+def get_risk_trend(identifier: str) -> dict:
+    """Current trend score and level for a patient (patients.id or user_id)."""
+    patient_id = resolve_patient_id(identifier)
+    if not patient_id:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    try:
+        trend = _executor.submit(_get_trend, patient_id).result()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    score = trend.score * decay(time.time() - trend.as_of)
+    return {
+        "patientId": patient_id,
+        "score": round(score, 3),
+        "level": level_for_score(score),
+        "events": len(trend.events),
+        "windowDays": WINDOW_DAYS,
+    }
+
+
+def _clear_trends() -> None:
+    with _trends_lock:
+        _trends.clear()
+
+
+def _on_resync() -> None:
+    # Trends warm-load again per patient; queued behind pending updates
+    _executor.submit(_clear_trends).add_done_callback(_log_failure)
+
+
+subscribe("timeline_events", _on_timeline)
+on_resync(_on_resync)
@@ -0,0 +1,439 @@
+"""
+Embedded SQLite storage backend.
+Implements the subset of the Supabase/PostgREST query builder that app.* modules use
+(table().select/insert/update/upsert/delete, eq/neq/gt/gte/lt/lte/in_/is_/filter/or_, order, limit, range, execute),
+so every module keeps importing `supabase` from app.supabase and runs unchanged on either backend.
+Schema mirrors DATABASE.md plus the extra columns the backend writes (address, bio, email, occurrences, dedup_key).
+Select with STORAGE_BACKEND=sqlite and SQLITE_PATH=<file> (":memory:" for a throwaway database).
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any
+
+SCHEMA = """
+create table if not exists profiles (
+  id text primary key,
+  full_name text,
+  role text not null check (role in ('patient', 'doctor')),
+  email text,
+  address text,
+  avatar_url text,
+  created_at text not null,
+  updated_at text
+);
+
+create table if not exists patients (
+  id text primary key,
+  user_id text unique,
+  name text not null,
+  age integer not null,
+  conditions text default '[]',
+  address text,
+  risk_level text default 'low' check (risk_level in ('low', 'medium', 'high')),
+  created_at text not null,
+  updated_at text
+);
+create index if not exists patients_name on patients(name);
+
+create table if not exists doctors (
+  id text primary key,
+  user_id text unique,
+  specialty text,
+  bio text,
+  name text,
+  email text,
+  address text,
+  created_at text not null
+);
+
+create table if not exists patient_doctors (
+  patient_id text not null,
+  doctor_id text not null,
+  primary key (patient_id, doctor_id)
+);
+create index if not exists patient_doctors_doctor_id on patient_doctors(doctor_id);
+
+create table if not exists messages (
+  id text primary key,
+  patient_id text not null,
+  role text not null check (role in ('user', 'assistant')),
+  content text not null,
+  created_at text not null
+);
+create index if not exists messages_patient_id on messages(patient_id, created_at);
+
+create table if not exists timeline_events (
+  id text primary key,
+  patient_id text not null,
+  type text not null check (type in ('symptom', 'appointment', 'medication', 'alert', 'chat')),
+  title text not null,
+  details text,
+  created_at text not null
+);
+create index if not exists timeline_events_patient_id on timeline_events(patient_id, created_at);
+
+create table if not exists alerts (
+  id text primary key,
+  patient_id text not null,
+  severity text not null check (severity in ('warning', 'critical')),
+  message text not null,
+  reasoning text,
+  acknowledged integer not null default 0,
+  occurrences integer not null default 1,
+  dedup_key text,
+  created_at text not null
+);
+create index if not exists alerts_patient_id on alerts(patient_id, created_at);
+create index if not exists alerts_inbox on alerts(patient_id, created_at, id);
+"""
+
+# Applied after SCHEMA, once any columns added since a database file was created exist.
+POST_MIGRATION_SCHEMA = """
+create unique index if not exists alerts_open_dedup on alerts(patient_id, dedup_key)
+  where not acknowledged and dedup_key is not null;
+"""
+# Columns added after the first release: table -> [(column, definition)], added to older files on open.
+ADDED_COLUMNS = {
+    "alerts": [("dedup_key", "text")],
+}
+
+# Columns stored as JSON text (jsonb / text[] in Postgres) and as 0/1 (boolean in Postgres).
+JSON_COLUMNS = {
+    "patients": {"conditions"},
+    "timeline_events": {"details"},
+}
+BOOL_COLUMNS = {
+    "alerts": {"acknowledged"},
+}
+# Tables whose rows get a generated uuid id / created_at when the insert omits them.
+GENERATED_ID_TABLES = {"patients", "doctors", "messages", "timeline_events", "alerts"}
+TIMESTAMP_TABLES = {"profiles", "patients", "doctors", "messages", "timeline_events", "alerts"}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "like": "LIKE", "ilike": "LIKE"}
+
+
+def _ident(name: str) -> str:
+    name = name.strip()
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name!r}")
+    return f'"{name}"'
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split_terms(filters: str) -> list[str]:
+    """Split a logic tree on its top-level commas (not inside parentheses or double quotes)."""
+    terms, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(filters):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            terms.append(filters[start:i])
+            start = i + 1
+    terms.append(filters[start:])
+    return [t.strip() for t in terms if t.strip()]
+
+
+class SQLiteResponse:
+    """Same shape as postgrest's APIResponse: rows in .data, optional .count."""
+
+    def __init__(self, data: list[dict], count: int | None = None):
+        self.data = data
+        self.count = count
+
+
+class SQLiteQuery:
+    """One query against one table; chain filters and finish with execute()."""
+
+    def __init__(self, client: "SQLiteClient", table: str):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns = "*"
+        self._count = None
+        self._payload: Any = None
+        self._on_conflict: str | None = None
+        self._where: list[str] = []
+        self._params: list = []
+        self._order: list[str] = []
+        self._limit: int | None = None
+        self._offset: int | None = None
+
+    # --- actions ---
+
+    def select(self, columns: str = "*", count: str | None = None) -> "SQLiteQuery":
+        self._action = "select"
+        self._columns = columns
+        self._count = count
+        return self
+
+    def insert(self, payload: dict | list[dict]) -> "SQLiteQuery":
+        self._action = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload: dict | list[dict], on_conflict: str | None = None) -> "SQLiteQuery":
+        self._action = "upsert"
+        self._payload = payload
+        self._on_conflict = on_conflict
+        return self
+
+    def update(self, values: dict) -> "SQLiteQuery":
+        self._action = "update"
+        self._payload = values
+        return self
+
+    def delete(self) -> "SQLiteQuery":
+        self._action = "delete"
+        return self
+
+    # --- filters ---
+
+    def _add(self, column: str, op: str, value: Any) -> "SQLiteQuery":
+        self._where.append(f"{_ident(column)} {op} ?")
+        self._params.append(self._client.encode(self._table, column, value))
+        return self
+
+    def eq(self, column: str, value: Any) -> "SQLiteQuery":
+        return self._add(column, "=", value)
+
+    def neq(self, column: str, value: Any) -> "SQLiteQuery":
+        return self._add(column, "!=", value)
+
+    def gt(self, column: str, value: Any) -> "SQLiteQuery":
+        return self._add(column, ">", value)
+
+    def gte(self, column: str, value: Any) -> "SQLiteQuery":
+        return self._add(column, ">=", value)
+
+    def lt(self, column: str, value: Any) -> "SQLiteQuery":
+        return self._add(column, "<", value)
+
+    def lte(self, column: str, value: Any) -> "SQLiteQuery":
+        return self._add(column, "<=", value)
+
+    def like(self, column: str, pattern: str) -> "SQLiteQuery":
+        return self._add(column, "LIKE", pattern)
+
+    def ilike(self, column: str, pattern: str) -> "SQLiteQuery":
+        # SQLite LIKE is case-insensitive for ASCII
+        return self._add(column, "LIKE", pattern)
+
+    def is_(self, column: str, value: Any) -> "SQLiteQuery":
+        if value is None or value == "null":
+            self._where.append(f"{_ident(column)} IS NULL")
+            return self
+        return self.eq(column, value)
+
+    def in_(self, column: str, values: list) -> "SQLiteQuery":
+        values = list(values)
+        if not values:
+            self._where.append("0")
+            return self
+        self._where.append(f"{_ident(column)} IN ({', '.join('?' for _ in values)})")
+        self._params.extend(self._client.encode(self._table, column, v) for v in values)
+        return self
+
+    def filter(self, column: str, operator: str, value: Any) -> "SQLiteQuery":
+        if operator == "in":
+            items = value.strip("()").split(",") if isinstance(value, str) else value
+            return self.in_(column, [v.strip() if isinstance(v, str) else v for v in items])
+        if operator == "is":
+            return self.is_(column, value)
+        if operator not in _OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        return self._add(column, _OPERATORS[operator], value)
+
+    def or_(self, filters: str) -> "SQLiteQuery":
+        """PostgREST logic tree, e.g. 'created_at.lt."X",and(created_at.eq."X",id.lt.Y)'."""
+        sql, params = self._logic(filters, "OR")
+        self._where.append(sql)
+        self._params.extend(params)
+        return self
+
+    def _logic(self, filters: str, joiner: str) -> tuple[str, list]:
+        parts: list[str] = []
+        params: list = []
+        for term in _split_terms(filters):
+            for prefix, nested in (("and(", "AND"), ("or(", "OR")):
+                if term.startswith(prefix) and term.endswith(")"):
+                    sql, nested_params = self._logic(term[len(prefix):-1], nested)
+                    break
+            else:
+                column, operator, value = term.split(".", 2)
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator in or_: {operator}")
+                if len(value) >= 2 and value[0] == value[-1] == '"':
+                    value = value[1:-1]
+                sql, nested_params = f"{_ident(column)} {_OPERATORS[operator]} ?", [self._client.encode(self._table, column, value)]
+            parts.append(sql)
+            params.extend(nested_params)
+        return f"({f' {joiner} '.join(parts)})", params
+
+    # --- modifiers ---
+
+    def order(self, column: str, desc: bool = False) -> "SQLiteQuery":
+        self._order.append(f"{_ident(column)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, size: int) -> "SQLiteQuery":
+        self._limit = int(size)
+        return self
+
+    def range(self, start: int, end: int) -> "SQLiteQuery":
+        self._offset = int(start)
+        self._limit = int(end) - int(start) + 1
+        return self
+
+    # --- execution ---
+
+    def _where_sql(self) -> str:
+        return f" WHERE {' AND '.join(self._where)}" if self._where else ""
+
+    def _column_list(self) -> str:
+        if self._columns.strip() == "*":
+            return "*"
+        return ", ".join(_ident(c) for c in self._columns.split(","))
+
+    def execute(self) -> SQLiteResponse:
+        if self._action == "select":
+            sql = f'SELECT {self._column_list()} FROM "{self._table}"{self._where_sql()}'
+            if self._order:
+                sql += f" ORDER BY {', '.join(self._order)}"
+            if self._limit is not None:
+                sql += f" LIMIT {self._limit}"
+                if self._offset:
+                    sql += f" OFFSET {self._offset}"
+            rows = self._client.run(self._table, sql, self._params)
+            count = None
+            if self._count:
+                count_sql = f'SELECT COUNT(*) AS n FROM "{self._table}"{self._where_sql()}'
+                count = self._client.run(self._table, count_sql, self._params)[0]["n"]
+            return SQLiteResponse(rows, count)
+
+        if self._action in ("insert", "upsert"):
+            rows = self._payload if isinstance(self._payload, list) else [self._payload]
+            return SQLiteResponse(self._client.insert_rows(self._table, rows, upsert=self._action == "upsert", on_conflict=self._on_conflict))
+
+        if self._action == "update":
+            if not self._payload:
+                return SQLiteResponse([])
+            assignments = ", ".join(f"{_ident(c)} = ?" for c in self._payload)
+            params = [self._client.encode(self._table, c, v) for c, v in self._payload.items()] + self._params
+            sql = f'UPDATE "{self._table}" SET {assignments}{self._where_sql()} RETURNING *'
+            return SQLiteResponse(self._client.run(self._table, sql, params, write=True))
+
+        if self._action == "delete":
+            sql = f'DELETE FROM "{self._table}"{self._where_sql()} RETURNING *'
+            return SQLiteResponse(self._client.run(self._table, sql, self._params, write=True))
+
+        raise ValueError(f"Unsupported action: {self._action}")
+
+
+class SQLiteClient:
+    """Drop-in for the Supabase client's table() API, backed by one SQLite database file."""
+
+    def __init__(self, path: str = "carebridge.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {r["name"] for r in self._conn.execute(f'PRAGMA table_info("{table}")')}
+                for column, definition in columns:
+                    if column not in existing:
+                        self._conn.execute(f'ALTER TABLE "{table}" ADD COLUMN {_ident(column)} {definition}')
+            self._conn.executescript(POST_MIGRATION_SCHEMA)
+
+    def table(self, name: str) -> SQLiteQuery:
+        if not _IDENTIFIER.match(name):
+            raise ValueError(f"Invalid table name: {name!r}")
+        return SQLiteQuery(self, name)
+
+    @property
+    def auth(self):
+        raise RuntimeError("Authentication requires the Supabase backend (STORAGE_BACKEND=supabase)")
+
+    def encode(self, table: str, column: str, value: Any) -> Any:
+        """Python value -> SQLite value for a column."""
+        if column in JSON_COLUMNS.get(table, ()):
+            return json.dumps(value) if value is not None else None
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return value
+
+    def decode(self, table: str, row: sqlite3.Row) -> dict:
+        """SQLite row -> dict shaped like a PostgREST row."""
+        data = dict(row)
+        for column in JSON_COLUMNS.get(table, ()):
+            if data.get(column) is not None:
+                data[column] = json.loads(data[column])
+        for column in BOOL_COLUMNS.get(table, ()):
+            if column in data and data[column] is not None:
+                data[column] = bool(data[column])
+        return data
+
+    def run(self, table: str, sql: str, params: list, write: bool = False) -> list[dict]:
+        with self._lock:
+            if write:
+                self._conn.execute("BEGIN")
+                try:
+                    rows = self._conn.execute(sql, params).fetchall()
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            else:
+                rows = self._conn.execute(sql, params).fetchall()
+        return [self.decode(table, r) for r in rows]
+
+    def insert_rows(self, table: str, rows: list[dict], upsert: bool = False, on_conflict: str | None = None) -> list[dict]:
+        """Insert rows in one transaction (all or nothing). Returns the stored rows in input order."""
+        if not rows:
+            return []
+        inserted = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    row = dict(row)
+                    if table in GENERATED_ID_TABLES and not row.get("id"):
+                        row["id"] = str(uuid.uuid4())
+                    if table in TIMESTAMP_TABLES and not row.get("created_at"):
+                        row["created_at"] = _now()
+                    columns = list(row)
+                    sql = (
+                        f'INSERT INTO "{table}" ({", ".join(_ident(c) for c in columns)}) '
+                        f'VALUES ({", ".join("?" for _ in columns)})'
+                    )
+                    if upsert:
+                        conflict = ", ".join(_ident(c) for c in (on_conflict or "id").split(","))
+                        updates = ", ".join(f"{_ident(c)} = excluded.{_ident(c)}" for c in columns)
+                        sql += f" ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+                    sql += " RETURNING *"
+                    params = [self.encode(table, c, row[c]) for c in columns]
+                    inserted.extend(self._conn.execute(sql, params).fetchall())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self.decode(table, r) for r in inserted]
@@ -1,20 +1,42 @@
 
 import os
-from supabase import create_client, Client
 from dotenv import load_dotenv
 from fastapi.responses import JSONResponse
 
 # Load environment variables
 load_dotenv()
 
+# Storage backend: "supabase" (default, remote project) or "sqlite" (embedded, see app.sqlite_store).
+# Every app.* module talks to `supabase` through the same table() query-builder API on either backend.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+
 # Initialize Supabase client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Please set SUPABASE_URL and SUPABASE_KEY in your .env file")
+if STORAGE_BACKEND == "sqlite":
+    from app.sqlite_store import SQLiteClient
+
+    supabase = SQLiteClient(os.getenv("SQLITE_PATH", "carebridge.db"))
+elif STORAGE_BACKEND == "supabase":
+    from postgrest.exceptions import APIError
+    from supabase import create_client
+
+    from app.resilience import GuardedClient, Upstream
+
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("Please set SUPABASE_URL and SUPABASE_KEY in your .env file")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    # Queries get a deadline, a circuit breaker and (for selects) hedging; an APIError means
+    # PostgREST answered, so it does not count against the breaker.
+    supabase_upstream = Upstream(
+        "supabase",
+        deadline=float(os.getenv("SUPABASE_DEADLINE_SECONDS", "10")),
+        is_failure=lambda e: not isinstance(e, APIError),
+    )
+    supabase = GuardedClient(create_client(SUPABASE_URL, SUPABASE_KEY), supabase_upstream)
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND} (expected 'supabase' or 'sqlite')")
 
 
 def sign_up(email: str, password: str, full_name: str, role: str) -> dict:
@@ -70,7 +92,8 @@ def sign_in(email: str, password: str, role: str) -> dict:
         password: User's password
         
     Returns:
-        dict: Authentication response with user data and session
+        dict: {"id", "accessToken", "refreshToken", "expiresAt"}; send accessToken as a
+        bearer token (see app.auth)
     """
     response = supabase.auth.sign_in_with_password({
         "email": email,
@@ -88,7 +111,12 @@ def sign_in(email: str, password: str, role: str) -> dict:
                 }
             )
 
-        return response.user.id
+        return {
+            "id": response.user.id,
+            "accessToken": response.session.access_token,
+            "refreshToken": response.session.refresh_token,
+            "expiresAt": response.session.expires_at,
+        }
     else:
         raise Exception()
         
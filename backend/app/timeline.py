@@ -5,10 +5,14 @@ Schema: timeline_events.patient_id references patients(user_id). We use user_id
 
 import logging
 import re
+from datetime import datetime, timezone
 from fastapi import HTTPException
 
+from app.changes import notify
+from app.logs import phi
 from app.supabase import supabase
 from app.patients import resolve_patient_id, create_patient
+from app.timeline_dedup import DEDUP_TYPES, event_date, merge_details, more_specific, patient_index, record_merge, title_words, titles_match
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +24,12 @@ def is_valid_uuid(uuid_string: str) -> bool:
     return bool(UUID_PATTERN.match(uuid_string))
 
 
+def sort_timeline(rows: list) -> list:
+    """Sort rows in place by created_at descending (newest first); missing created_at sorts last."""
+    rows.sort(key=lambda r: r.get("created_at") or "1970-01-01T00:00:00", reverse=True)
+    return rows
+
+
 def get_timeline(patient_id: str | None = None) -> list:
     """
     List timeline events. If patient_id is set, filter by that patient.
@@ -27,14 +37,14 @@ def get_timeline(patient_id: str | None = None) -> list:
     """
     # Validate patient_id is a valid UUID if provided
     if patient_id and not is_valid_uuid(patient_id):
-        logger.warning(f"Invalid UUID format for patient_id: {patient_id}. Returning empty list.")
+        logger.warning("Invalid UUID format for patient_id: %s. Returning empty list.", phi(patient_id))
         return []
 
     resolved_patient_id = None
     if patient_id:
         resolved_patient_id = resolve_patient_id(patient_id)
         if not resolved_patient_id:
-            logger.warning(f"No patient found for identifier: {patient_id}. Returning empty list.")
+            logger.warning("No patient found for identifier: %s. Returning empty list.", phi(patient_id))
             return []
     
     try:
@@ -43,24 +53,110 @@ def get_timeline(patient_id: str | None = None) -> list:
             q = q.eq("patient_id", resolved_patient_id)
         res = q.execute()
         data = res.data or []
-        # Sort by created_at descending (newest first)
-        # Handle None or missing created_at gracefully
-        if data:
-            data.sort(key=lambda r: r.get("created_at") or "1970-01-01T00:00:00", reverse=True)
-        return data
+        return sort_timeline(data)
     except HTTPException as he:
         # Re-raise HTTP exceptions (like 404, 403)
         raise
     except Exception as e:
-        import traceback
-        error_msg = str(e)
-        error_trace = traceback.format_exc()
-        logger.error(f"Error fetching timeline events for patient_id={patient_id}: {error_msg}\n{error_trace}")
+        logger.error("Error fetching timeline events for patient_id=%s: %s", phi(patient_id), e, exc_info=True)
         # For now, return empty list instead of crashing - allows UI to load
         # TODO: Check if table exists and provide better error message
         return []
 
 
+VALID_EVENT_TYPES = ("symptom", "appointment", "medication", "alert", "chat")
+
+
+def _resolve_or_create_patient(patient_id: str) -> str:
+    """
+    Resolve patient_id (patients.id or patients.user_id) to patients.id.
+    If no patient row exists but the identifier is a patient profile, auto-create the patient record.
+    Raises HTTPException 403/404 when the identifier cannot be resolved.
+    """
+    resolved_patient_id = resolve_patient_id(patient_id)
+    if not resolved_patient_id:
+        # Try to auto-create patient record if it doesn't exist
+        # This handles cases where user signed up but patient record wasn't created
+        logger.warning("No patient found for identifier: %s. Attempting to auto-create patient record.", phi(patient_id))
+        try:
+            # Try to get user info from Supabase auth to create patient record
+            # Check if this is a valid user_id by trying to get user from profiles
+            profile_res = supabase.table("profiles").select("*").eq("id", patient_id).execute()
+            if profile_res.data and len(profile_res.data) > 0:
+                profile = profile_res.data[0]
+                if profile.get("role") == "patient":
+                    # Create patient record with minimal info
+                    patient_record = create_patient(
+                        name=profile.get("full_name", "Patient"),
+                        age=0,  # Default age, user can update later
+                        address="",
+                        user_id=patient_id,
+                        conditions=[]
+                    )
+                    resolved_patient_id = patient_record.get("id")
+                    logger.info("Auto-created patient record with id: %s", phi(resolved_patient_id))
+                else:
+                    logger.error("User %s is not a patient (role: %s)", phi(patient_id), profile.get("role"))
+                    raise HTTPException(status_code=403, detail="User is not a patient")
+            else:
+                logger.error("User %s not found in profiles table", phi(patient_id))
+                raise HTTPException(status_code=404, detail="User not found")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Failed to auto-create patient record: %s", e, exc_info=True)
+            raise HTTPException(status_code=404, detail=f"Patient not found for timeline event and could not auto-create: {str(e)}")
+
+    if not resolved_patient_id:
+        logger.error("Cannot create timeline event. No patient found for identifier: %s", phi(patient_id))
+        raise HTTPException(status_code=404, detail="Patient not found for timeline event")
+    return resolved_patient_id
+
+
+def _build_event_payload(
+    resolved_patient_id: str,
+    type: str,
+    title: str,
+    details: str | dict | None = None,
+    created_at: str | None = None,
+) -> dict:
+    """Build the timeline_events insert payload for an already-resolved patients.id."""
+    payload = {
+        "patient_id": resolved_patient_id,
+        "type": type,
+        "title": title,
+    }
+    if details is not None:
+        payload["details"] = details if isinstance(details, dict) else {"text": str(details)}
+    if created_at is not None:
+        # Convert YYYY-MM-DD to ISO datetime string for PostgreSQL timestamptz
+        # Add time component (00:00:00) if not present
+        if len(created_at) == 10:  # YYYY-MM-DD format
+            payload["created_at"] = f"{created_at}T00:00:00"
+        else:
+            payload["created_at"] = created_at
+    return payload
+
+
+def _merge_duplicate(row: dict, payload: dict) -> dict:
+    """
+    Fold a duplicate event's details (and its title, when more specific) into its existing row;
+    returns the (possibly updated) row.
+    """
+    record_merge()
+    changes = {}
+    details = merge_details(row.get("details"), payload.get("details"))
+    if details is not None:
+        changes["details"] = details
+    if more_specific(payload["title"], row.get("title") or ""):
+        changes["title"] = payload["title"]
+    if not changes:
+        return row
+    res = supabase.table("timeline_events").update(changes).eq("id", row["id"]).execute()
+    notify("timeline_events", "update", res.data)
+    return res.data[0] if res.data else {**row, **changes}
+
+
 def add_event(
     patient_id: str,
     type: str,
@@ -73,68 +169,105 @@ def add_event(
     type must be one of: symptom, appointment, medication, alert, chat.
     details can be a string (stored as {"text": details}) or a dict for jsonb.
     created_at is optional ISO date string (YYYY-MM-DD). If not provided, uses database default.
-    Returns the created row.
+    Returns the created row. A symptom/appointment/medication that duplicates an existing event
+    (see app.timeline_dedup) is merged into that row instead, and the existing row is returned.
     """
     try:
-        resolved_patient_id = resolve_patient_id(patient_id)
-        if not resolved_patient_id:
-            # Try to auto-create patient record if it doesn't exist
-            # This handles cases where user signed up but patient record wasn't created
-            logger.warning(f"No patient found for identifier: {patient_id}. Attempting to auto-create patient record.")
-            try:
-                # Try to get user info from Supabase auth to create patient record
-                # Check if this is a valid user_id by trying to get user from profiles
-                profile_res = supabase.table("profiles").select("*").eq("id", patient_id).execute()
-                if profile_res.data and len(profile_res.data) > 0:
-                    profile = profile_res.data[0]
-                    if profile.get("role") == "patient":
-                        # Create patient record with minimal info
-                        patient_record = create_patient(
-                            name=profile.get("full_name", "Patient"),
-                            age=0,  # Default age, user can update later
-                            address="",
-                            user_id=patient_id,
-                            conditions=[]
-                        )
-                        resolved_patient_id = patient_record.get("id")
-                        logger.info(f"Auto-created patient record with id: {resolved_patient_id}")
-                    else:
-                        logger.error(f"User {patient_id} is not a patient (role: {profile.get('role')})")
-                        raise HTTPException(status_code=403, detail="User is not a patient")
-                else:
-                    logger.error(f"User {patient_id} not found in profiles table")
-                    raise HTTPException(status_code=404, detail="User not found")
-            except HTTPException:
-                raise
-            except Exception as e:
-                logger.error(f"Failed to auto-create patient record: {e}", exc_info=True)
-                raise HTTPException(status_code=404, detail=f"Patient not found for timeline event and could not auto-create: {str(e)}")
-        
-        if not resolved_patient_id:
-            logger.error(f"Cannot create timeline event. No patient found for identifier: {patient_id}")
-            raise HTTPException(status_code=404, detail="Patient not found for timeline event")
-        payload = {
-            "patient_id": resolved_patient_id,
-            "type": type,
-            "title": title,
-        }
-        if details is not None:
-            payload["details"] = details if isinstance(details, dict) else {"text": str(details)}
-        if created_at is not None:
-            # Convert YYYY-MM-DD to ISO datetime string for PostgreSQL timestamptz
-            # Add time component (00:00:00) if not present
-            if len(created_at) == 10:  # YYYY-MM-DD format
-                payload["created_at"] = f"{created_at}T00:00:00"
-            else:
-                payload["created_at"] = created_at
-        res = supabase.table("timeline_events").insert(payload).execute()
-        if not res.data or len(res.data) == 0:
-            raise HTTPException(status_code=500, detail="Failed to create timeline event")
+        resolved_patient_id = _resolve_or_create_patient(patient_id)
+        payload = _build_event_payload(resolved_patient_id, type, title, details, created_at)
+        with patient_index(resolved_patient_id) as index:
+            duplicate = index.find(type, title, payload.get("created_at")) if index else None
+            if duplicate is not None:
+                return _merge_duplicate(duplicate, payload)
+            res = supabase.table("timeline_events").insert(payload).execute()
+            if not res.data or len(res.data) == 0:
+                raise HTTPException(status_code=500, detail="Failed to create timeline event")
+            notify("timeline_events", "insert", res.data)
         return res.data[0]
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creating timeline event: {e}", exc_info=True)
+        logger.error("Error creating timeline event: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def add_events(patient_id: str, events: list[dict]) -> list[dict]:
+    """
+    Insert many timeline events for one patient with a single multi-row insert.
+    Each event is a dict with type, title and optional details / created_at (or date).
+    The patient is resolved once for the whole batch.
+
+    Returns one result per input event, in input order:
+    {"index": i, "success": True, "event": row} or {"index": i, "success": False, "error": str}.
+    Duplicates of existing events, or of earlier events in the batch, are merged (see add_event)
+    and reported with "merged": True and the row they were merged into.
+    Invalid events are reported per row and do not block the rest of the batch.
+    Raises HTTPException if the patient cannot be resolved or the insert itself fails.
+    """
+    if not events:
+        return []
+    try:
+        resolved_patient_id = _resolve_or_create_patient(patient_id)
+
+        results: list[dict] = [{"index": i} for i in range(len(events))]
+        payloads = []
+        # Result indexes per payload: duplicates within the batch share their first occurrence's row
+        payload_indexes: list[list[int]] = []
+        batch_keys: list[tuple[str, str, frozenset]] = []
+        with patient_index(resolved_patient_id) as index:
+            for i, event in enumerate(events):
+                event_type = event.get("type")
+                title = event.get("title")
+                if event_type not in VALID_EVENT_TYPES:
+                    results[i].update(success=False, error=f"Invalid event type: {event_type}")
+                    continue
+                if not title:
+                    results[i].update(success=False, error="Missing title")
+                    continue
+                # Every payload carries the same keys: a multi-row insert sends the union of keys and
+                # stores a missing one as NULL instead of the column default.
+                created_at = event.get("created_at") or event.get("date") or datetime.now(timezone.utc).isoformat()
+                payload = _build_event_payload(resolved_patient_id, event_type, title, event.get("details", ""), created_at)
+                payload.setdefault("details", None)
+                duplicate = index.find(event_type, title, payload.get("created_at")) if index else None
+                if duplicate is not None:
+                    results[i].update(success=True, event=_merge_duplicate(duplicate, payload), merged=True)
+                    continue
+                key = (event_type, event_date(payload.get("created_at")), title_words(title))
+                earlier = next(
+                    (j for j, (t, d, words) in enumerate(batch_keys) if (t, d) == key[:2] and titles_match(key[2], words)),
+                    None,
+                ) if event_type in DEDUP_TYPES else None
+                if earlier is not None:
+                    details = merge_details(payloads[earlier].get("details"), payload.get("details"))
+                    if details is not None:
+                        payloads[earlier]["details"] = details
+                    if more_specific(title, payloads[earlier]["title"]):
+                        payloads[earlier]["title"] = title
+                        batch_keys[earlier] = key
+                    payload_indexes[earlier].append(i)
+                    record_merge()
+                    continue
+                payloads.append(payload)
+                payload_indexes.append([i])
+                batch_keys.append(key)
+
+            if payloads:
+                res = supabase.table("timeline_events").insert(payloads).execute()
+                rows = res.data or []
+                if len(rows) != len(payloads):
+                    raise HTTPException(status_code=500, detail="Failed to create timeline events")
+                notify("timeline_events", "insert", rows)
+                # PostgREST returns inserted rows in payload order
+                for indexes, row in zip(payload_indexes, rows):
+                    results[indexes[0]].update(success=True, event=row)
+                    for i in indexes[1:]:
+                        results[i].update(success=True, event=row, merged=True)
+        return results
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error creating timeline events: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -145,6 +278,7 @@ def delete_event(event_id: str) -> dict:
     """
     try:
         res = supabase.table("timeline_events").delete().eq("id", event_id).execute()
+        notify("timeline_events", "delete", res.data)
         return {"success": True, "message": "Timeline event deleted successfully"}
     except HTTPException:
         raise
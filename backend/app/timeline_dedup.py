@@ -0,0 +1,236 @@
+"""
+Per-patient de-duplication index for timeline events.
+extract_timeline_events reads the last few messages every turn, so the same symptom, appointment or
+medication ("Headache", same day) comes back turn after turn. app.timeline consults this index before
+inserting and merges a duplicate into the existing row instead.
+
+Events are duplicates when they share type and date (YYYY-MM-DD of created_at) and their titles
+match fuzzily: after lowercasing, dropping filler words and plural s, the new title adds no words to
+the existing one ("Severe headaches" then "Headache"), or the words are at least
+TIMELINE_DEDUP_SIMILARITY alike (typos, word order). A title that adds words ("Pain" then
+"Chest pain") is a new event, and titles that differ in negation or stop words ("Fever" / "No fever",
+"Ibuprofen" / "Stopped ibuprofen") never match. When a fuzzy match has more words than the existing
+title, the merge keeps the new, more specific title. Only symptom, appointment and medication
+events are de-duplicated.
+
+A patient's index is loaded on first use and then kept current from app.changes notifications
+(including other workers' writes via app.bus); the TIMELINE_DEDUP_MAX_PATIENTS most recently used
+patients are kept.
+"""
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+
+from app.changes import on_resync, subscribe
+from app.logs import phi
+from app.supabase import supabase
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_DEDUP_MAX_PATIENTS = int(os.getenv("TIMELINE_DEDUP_MAX_PATIENTS", "2000"))
+TIMELINE_DEDUP_SIMILARITY = float(os.getenv("TIMELINE_DEDUP_SIMILARITY", "0.85"))
+DEDUP_TYPES = ("symptom", "appointment", "medication")
+# Merged details text stops growing past this
+MAX_MERGED_DETAILS_CHARS = 1000
+
+_WORD = re.compile(r"[a-z0-9]+")
+_FILLER = frozenset({
+    "a", "an", "the", "my", "of", "and", "with", "on", "in", "at", "for", "to",
+    "started", "starting", "start", "began", "new", "some", "feeling", "having", "taking",
+})
+
+
+# Words that change what an event means; titles must agree on these to match
+_POLARITY = frozenset({
+    "no", "not", "none", "without", "denie", "deny", "denied", "negative", "never",
+    "stop", "stopped", "stopping", "quit", "ended", "discontinued", "off", "resolved", "gone",
+})
+
+
+def title_words(title: str) -> frozenset:
+    words = set()
+    for word in _WORD.findall(title.lower()):
+        if word in _FILLER:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return frozenset(words)
+
+
+def titles_match(new: frozenset, existing: frozenset) -> bool:
+    """Whether a new event's title (title_words() set) duplicates an existing one's."""
+    if not new or not existing:
+        return new == existing
+    if new & _POLARITY != existing & _POLARITY:
+        return False
+    if new <= existing:
+        return True
+    return SequenceMatcher(None, " ".join(sorted(new)), " ".join(sorted(existing))).ratio() >= TIMELINE_DEDUP_SIMILARITY
+
+
+def more_specific(new_title: str, existing_title: str) -> bool:
+    """Whether a matched new title says more than the existing row's (so the merge should keep it)."""
+    return len(title_words(new_title)) > len(title_words(existing_title))
+
+
+def event_date(created_at: str | None) -> str:
+    """YYYY-MM-DD of a created_at value; events without one get the database default (now)."""
+    if created_at:
+        return created_at[:10]
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def merge_details(existing, new) -> dict | None:
+    """
+    details for a merged row, or None when new adds nothing. Texts are combined: a text that
+    already contains the other wins, otherwise they are joined with "; " (up to MAX_MERGED_DETAILS_CHARS).
+    """
+    if not new:
+        return None
+    if not isinstance(existing, dict):
+        return new
+    merged = {**existing, **{k: v for k, v in new.items() if k != "text"}}
+    old_text, new_text = str(existing.get("text") or ""), str(new.get("text") or "")
+    if new_text and new_text.lower() not in old_text.lower():
+        if old_text.lower() in new_text.lower():
+            merged["text"] = new_text
+        elif len(old_text) + len(new_text) + 2 <= MAX_MERGED_DETAILS_CHARS:
+            merged["text"] = f"{old_text}; {new_text}"
+    return None if merged == existing else merged
+
+
+class PatientIndex:
+    """One patient's events grouped by (type, date). Rows are replaced, never mutated."""
+
+    def __init__(self):
+        self.loaded = False
+        # Held by the loader and by app.timeline across check-then-write, so a patient's writes are serial
+        self.guard = threading.RLock()
+        self._lock = threading.Lock()
+        self._groups: dict[tuple[str, str], list[tuple[frozenset, dict]]] = {}
+        # Changes seen while loading; replayed once the scan is in
+        self._pending: list[tuple[str, dict]] | None = None
+
+    def find(self, type: str, title: str, created_at: str | None) -> dict | None:
+        """The existing row this event duplicates, or None."""
+        if type not in DEDUP_TYPES:
+            return None
+        words = title_words(title)
+        with self._lock:
+            for other, row in self._groups.get((type, event_date(created_at)), ()):
+                if titles_match(words, other):
+                    return row
+        return None
+
+    def _apply(self, op: str, row: dict) -> None:
+        if row.get("type") not in DEDUP_TYPES or not row.get("id"):
+            return
+        key = (row["type"], event_date(row.get("created_at")))
+        group = [entry for entry in self._groups.get(key, ()) if entry[1].get("id") != row["id"]]
+        if op != "delete":
+            group.append((title_words(row.get("title") or ""), row))
+        if group:
+            self._groups[key] = group
+        else:
+            self._groups.pop(key, None)
+
+    def apply(self, op: str, row: dict) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((op, row))
+            elif self.loaded:
+                self._apply(op, row)
+
+    def load(self, patient_id: str) -> None:
+        with self._lock:
+            self._pending = []
+        try:
+            res = (
+                supabase.table("timeline_events")
+                .select("*")
+                .eq("patient_id", patient_id)
+                .in_("type", list(DEDUP_TYPES))
+                .execute()
+            )
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for row in res.data or []:
+                self._apply("insert", row)
+            for op, row in self._pending:
+                self._apply(op, row)
+            self._pending = None
+            self.loaded = True
+
+    def size(self) -> int:
+        return sum(len(group) for group in self._groups.values())
+
+
+_indexes: "OrderedDict[str, PatientIndex]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"loads": 0, "merged": 0}
+
+
+def _get(patient_id: str) -> PatientIndex:
+    with _lock:
+        index = _indexes.get(patient_id)
+        if index is None:
+            index = _indexes[patient_id] = PatientIndex()
+            while len(_indexes) > TIMELINE_DEDUP_MAX_PATIENTS:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(patient_id)
+        return index
+
+
+@contextmanager
+def patient_index(patient_id: str):
+    """
+    Yield patient_id's loaded index (patients.id) while holding its write guard, or None if it
+    could not be loaded; callers then insert without de-duplication.
+    """
+    index = _get(patient_id)
+    with index.guard:
+        if not index.loaded:
+            try:
+                index.load(patient_id)
+                _stats["loads"] += 1
+            except Exception as e:
+                logger.warning("Timeline dedup index load failed for patient %s: %s", phi(patient_id), e)
+        yield index if index.loaded else None
+
+
+def record_merge() -> None:
+    _stats["merged"] += 1
+
+
+def get_timeline_dedup_stats() -> dict:
+    with _lock:
+        indexes = list(_indexes.values())
+    return {"patients": len(indexes), "events": sum(i.size() for i in indexes), **_stats}
+
+
+def _on_timeline(op: str, rows: list[dict]) -> None:
+    for row in rows:
+        index = _indexes.get(row.get("patient_id"))
+        if index is not None:
+            index.apply(op, row)
+
+
+def _on_resync() -> None:
+    # Indexes reload per patient on next use
+    with _lock:
+        _indexes.clear()
+
+
+subscribe("timeline_events", _on_timeline)
+on_resync(_on_resync)
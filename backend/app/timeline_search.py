@@ -0,0 +1,342 @@
+"""
+Full-text search over timeline events ("when did the ibuprofen start?").
+An in-memory inverted index over timeline_events.title and details.text, loaded at startup and kept
+current from app.changes notifications (other workers' writes arrive via app.bus), so searches never
+scan timeline_events in the database.
+
+- Text is lowercased, split on non-alphanumerics, stripped of stopwords and stemmed (a light
+  Porter-style stemmer: "headaches" / "headache", "started" / "starting").
+- Results are ranked by BM25 (k1=1.2, b=0.75), with document frequencies over the live index.
+- Filters (patient, type, date range) are applied to each term's postings before scoring.
+
+Postings and per-event metadata are flat arrays scored with numpy: about 300 bytes per event, and a
+query touches only the postings of its terms (a few ms for one patient out of a million events). Deleted and updated events
+are tombstoned; the periodic rebuild (TIMELINE_SEARCH_REBUILD_SECONDS) compacts them away.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from app.changes import on_resync, subscribe
+from app.export import paged_rows
+from app.supabase import supabase
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_SEARCH_REBUILD_SECONDS = int(os.getenv("TIMELINE_SEARCH_REBUILD_SECONDS", "3600"))
+MAX_RESULTS = 100
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Same order as app.timeline.VALID_EVENT_TYPES; codes are stored per event
+EVENT_TYPES = ("symptom", "appointment", "medication", "alert", "chat")
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "did", "do", "for", "from", "had", "has",
+    "have", "he", "her", "his", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "she",
+    "so", "that", "the", "their", "them", "they", "this", "to", "was", "we", "were", "what", "when",
+    "where", "which", "who", "will", "with", "you", "your",
+})
+_VOWEL = re.compile(r"[aeiouy]")
+_DERIVATIONAL = (
+    ("ational", "ate"), ("ization", "ize"), ("fulness", "ful"), ("ousness", "ous"), ("iveness", "ive"),
+    ("ation", "ate"), ("ness", ""), ("ment", ""), ("ful", ""), ("ly", ""),
+)
+
+
+def stem(word: str) -> str:
+    """Light Porter-style stemmer: plurals, -ed/-ing, y->i, common derivational suffixes, final e."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("ies"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and _VOWEL.search(word[:-len(suffix)]) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            break
+    if len(word) > 3 and word.endswith("y") and word[-2] not in "aeiou":
+        word = word[:-1] + "i"
+    for suffix, replacement in _DERIVATIONAL:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)] + replacement
+            break
+    if len(word) > 4 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    return [stem(word) for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def _event_text(row: dict) -> str:
+    details = row.get("details")
+    if isinstance(details, dict):
+        details = details.get("text")
+    return f"{row.get('title') or ''} {details or ''}"
+
+
+def _day(created_at: str | None) -> int:
+    """Ordinal of created_at's date; events without one get the database default (now)."""
+    if created_at:
+        try:
+            return date.fromisoformat(created_at[:10]).toordinal()
+        except ValueError:
+            pass
+    return datetime.now(timezone.utc).date().toordinal()
+
+
+class _Index:
+    """One generation of the index. Callers hold _lock for every method."""
+
+    def __init__(self):
+        self.ids: list[str] = []
+        self.slots: dict[str, int] = {}
+        self.patient_codes: dict[str, int] = {}
+        self.patient = array("I")
+        self.type = array("B")
+        self.day = array("i")
+        self.length = array("H")
+        self.alive = bytearray()
+        self.live = 0
+        self.total_length = 0
+        # term -> (event slots, term frequencies), appended in slot order
+        self.postings: dict[str, tuple[array, array]] = {}
+
+    def add(self, row: dict) -> None:
+        event_id, patient_id = row.get("id"), row.get("patient_id")
+        if not event_id or not patient_id or row.get("type") not in EVENT_TYPES:
+            return
+        self.remove(event_id)
+        terms = Counter(tokenize(_event_text(row)))
+        slot = len(self.ids)
+        self.ids.append(event_id)
+        self.slots[event_id] = slot
+        self.patient.append(self.patient_codes.setdefault(patient_id, len(self.patient_codes)))
+        self.type.append(EVENT_TYPES.index(row["type"]))
+        self.day.append(_day(row.get("created_at")))
+        length = min(sum(terms.values()), 0xFFFF)
+        self.length.append(length)
+        self.alive.append(1)
+        self.live += 1
+        self.total_length += length
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = (array("I"), array("H"))
+            postings[0].append(slot)
+            postings[1].append(min(tf, 0xFFFF))
+
+    def remove(self, event_id: str) -> None:
+        slot = self.slots.pop(event_id, None)
+        if slot is None:
+            return
+        self.alive[slot] = 0
+        self.live -= 1
+        self.total_length -= self.length[slot]
+
+    def search(
+        self,
+        terms: list[str],
+        patient_id: str | None,
+        type: str | None,
+        day_from: int | None,
+        day_to: int | None,
+        limit: int,
+    ) -> tuple[list[tuple[str, float]], int]:
+        """Top `limit` (event id, score) pairs and the number of matching events."""
+        if not self.live:
+            return [], 0
+        patient_code = None
+        if patient_id is not None:
+            patient_code = self.patient_codes.get(patient_id)
+            if patient_code is None:
+                return [], 0
+        alive = np.frombuffer(self.alive, dtype=np.uint8)
+        patients = np.frombuffer(self.patient, dtype=np.uint32)
+        types = np.frombuffer(self.type, dtype=np.uint8)
+        days = np.frombuffer(self.day, dtype=np.int32)
+        lengths = np.frombuffer(self.length, dtype=np.uint16)
+        avg_length = max(self.total_length / self.live, 1.0)
+
+        matched_slots, matched_scores = [], []
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            slots = np.frombuffer(postings[0], dtype=np.uint32)
+            keep = alive[slots].astype(bool)
+            df = int(keep.sum())
+            if not df:
+                continue
+            if patient_code is not None:
+                keep &= patients[slots] == patient_code
+            if type is not None:
+                keep &= types[slots] == EVENT_TYPES.index(type)
+            if day_from is not None:
+                keep &= days[slots] >= day_from
+            if day_to is not None:
+                keep &= days[slots] <= day_to
+            slots = slots[keep]
+            if not slots.size:
+                continue
+            tf = np.frombuffer(postings[1], dtype=np.uint16)[keep].astype(np.float64)
+            idf = math.log(1 + (self.live - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[slots] / avg_length)
+            matched_slots.append(slots)
+            matched_scores.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        if not matched_slots:
+            return [], 0
+
+        slots, inverse = np.unique(np.concatenate(matched_slots), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores))
+        top = np.argpartition(-scores, limit - 1)[:limit] if scores.size > limit else np.arange(scores.size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[slots[i]], round(float(scores[i]), 4)) for i in top], int(slots.size)
+
+
+_index = _Index()
+_loaded_at: float | None = None
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+# Changes seen while a load is scanning; replayed onto the fresh index before it is swapped in
+_pending: list[tuple[str, dict]] | None = None
+_reloading = False
+
+
+def _apply(index: _Index, op: str, row: dict) -> None:
+    if op == "delete":
+        if row.get("id"):
+            index.remove(row["id"])
+    else:
+        index.add(row)
+
+
+def load() -> None:
+    """(Re)build the index from every timeline event. Called at startup and by the periodic rebuild."""
+    global _index, _loaded_at, _pending
+    with _load_lock:
+        with _lock:
+            _pending = []
+        index = _Index()
+        try:
+            for row in paged_rows("timeline_events", columns="id,patient_id,type,title,details,created_at"):
+                index.add(row)
+        except BaseException:
+            with _lock:
+                _pending = None
+            raise
+        with _lock:
+            for op, row in _pending:
+                _apply(index, op, row)
+            _pending = None
+            _index = index
+            _loaded_at = time.monotonic()
+    logger.info("Loaded timeline search index: %d events, %d terms", index.live, len(index.postings))
+
+
+def _reload_in_background() -> None:
+    global _reloading
+    try:
+        load()
+    except Exception as e:
+        logger.error("Timeline search index rebuild failed: %s", e)
+    finally:
+        _reloading = False
+
+
+def _ensure_loaded() -> None:
+    global _reloading
+    if _loaded_at is None:
+        # Wait out a load already in progress (the startup warm-up) rather than starting another
+        with _load_lock:
+            pass
+        if _loaded_at is None:
+            load()
+    elif time.monotonic() - _loaded_at > TIMELINE_SEARCH_REBUILD_SECONDS and not _reloading:
+        # Stale: keep serving the current index while a compacted one loads
+        _reloading = True
+        threading.Thread(target=_reload_in_background, name="timeline-search-rebuild", daemon=True).start()
+
+
+def search_timeline(
+    query: str,
+    patient_id: str | None = None,
+    type: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    limit: int = 20,
+) -> dict:
+    """
+    BM25-ranked timeline events matching query. patient_id is a patients.id (timeline_events.patient_id);
+    type and the inclusive date range filter on the event's type and created_at date.
+    Returns {"results": [row + "score"], "total": matching events}; rows are read back by id.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return {"results": [], "total": 0}
+    _ensure_loaded()
+    limit = max(1, min(limit, MAX_RESULTS))
+    with _lock:
+        hits, total = _index.search(
+            terms,
+            patient_id,
+            type,
+            date_from.toordinal() if date_from else None,
+            date_to.toordinal() if date_to else None,
+            limit,
+        )
+    if not hits:
+        return {"results": [], "total": total}
+    res = supabase.table("timeline_events").select("*").in_("id", [event_id for event_id, _ in hits]).execute()
+    rows = {row["id"]: row for row in res.data or []}
+    results = [{**rows[event_id], "score": score} for event_id, score in hits if event_id in rows]
+    return {"results": results, "total": total}
+
+
+def get_timeline_search_stats() -> dict:
+    with _lock:
+        index = _index
+        return {
+            "events": index.live,
+            "tombstones": len(index.ids) - index.live,
+            "terms": len(index.postings),
+            "patients": len(index.patient_codes),
+            "loadedSecondsAgo": round(time.monotonic() - _loaded_at, 1) if _loaded_at is not None else None,
+        }
+
+
+def _on_timeline(op: str, rows: list[dict]) -> None:
+    with _lock:
+        for row in rows:
+            if _loaded_at is not None:
+                _apply(_index, op, row)
+            if _pending is not None:
+                _pending.append((op, row))
+
+
+def _on_resync() -> None:
+    # Keep serving the current index while a fresh one loads
+    global _reloading
+    if _loaded_at is not None and not _reloading:
+        _reloading = True
+        threading.Thread(target=_reload_in_background, name="timeline-search-rebuild", daemon=True).start()
+
+
+subscribe("timeline_events", _on_timeline)
+on_resync(_on_resync)
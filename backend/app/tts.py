@@ -1,9 +1,22 @@
+import io
 import os
 import logging
+import struct
+import wave
+
+import numpy as np
 from fastapi.responses import Response
 from elevenlabs.client import ElevenLabs
 from dotenv import load_dotenv
 
+from app.cache import ReadThroughCache
+from app.resilience import Upstream, UpstreamUnavailable
+
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -19,16 +32,55 @@ DEFAULT_VOICE_ID = "TX3LPaxmHKxFdv7VOQHJ"  # Custom doctor voice
 # Alternative: "21m00Tcm4TlvDq8ikWAM" (Rachel - professional female voice)
 # Alternative: "pNInz6obpgDQGcFmaJgB" (Adam - professional male voice)
 
-def text_to_speech(text: str, voice_id: str = None) -> bytes:
+# Deadline for a whole synthesis; past it (or while ElevenLabs is failing) /api/tts answers 503 at once
+# and the frontend falls back to showing the text.
+_elevenlabs = Upstream(
+    "elevenlabs",
+    deadline=float(os.getenv("ELEVENLABS_DEADLINE_SECONDS", "15")),
+    max_concurrency=int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", "8")),
+)
+
+MP3_FORMAT = "mp3_44100_128"
+# Lip-sync requests fetch raw 16-bit mono PCM so the envelope can be computed without an MP3 decoder.
+# The audio is then re-encoded as MP3 when lameenc is installed (pip install lameenc; about a sixth
+# of the PCM size at LIPSYNC_MP3_KBPS), otherwise sent as WAV (256 kbps, about twice the plain
+# /api/tts MP3).
+PCM_SAMPLE_RATE = 16000
+PCM_FORMAT = f"pcm_{PCM_SAMPLE_RATE}"
+LIPSYNC_MP3_KBPS = 40
+# Envelope frames per second (one byte each); the avatar samples it at audio.currentTime
+ENVELOPE_FPS = 50
+# Same shaping the client-side analyser used: (rms + peak) / 2, amplified, then a soft curve
+ENVELOPE_GAIN = 12.0
+ENVELOPE_CURVE = 0.3
+
+# Binary lip-sync response: MAGIC, then frames of [type u8][length u32 LE][payload].
+# Envelope frame payload: [fps u16 LE][one u8 amplitude (0-255) per frame]; audio frame payload: a WAV
+# file (FRAME_AUDIO) or an MP3 file (FRAME_AUDIO_MP3).
+LIPSYNC_MEDIA_TYPE = "application/vnd.carebridge.lipsync"
+LIPSYNC_MAGIC = b"CBLS\x01"
+FRAME_ENVELOPE = 1
+FRAME_AUDIO = 2
+FRAME_AUDIO_MP3 = 3
+
+# Greetings and closings repeat, so synthesized audio (and its envelope) is kept per (voice, text, format)
+_speech_cache = ReadThroughCache(
+    "tts",
+    maxsize=int(os.getenv("TTS_CACHE_SIZE", "128")),
+    ttl=int(os.getenv("TTS_CACHE_TTL_SECONDS", "3600")),
+)
+
+def text_to_speech(text: str, voice_id: str = None, output_format: str = MP3_FORMAT) -> bytes:
     """
     Convert text to speech using ElevenLabs TTS
     
     Args:
         text: The text to convert to speech
         voice_id: ElevenLabs voice ID (default: professional female voice)
+        output_format: ElevenLabs output format (MP3_FORMAT, or PCM_FORMAT for raw 16-bit mono samples)
         
     Returns:
-        bytes: Audio data in MP3 format
+        bytes: Audio data in the requested format
         
     Raises:
         ValueError: If API key is not set or text is invalid
@@ -45,7 +97,7 @@ def text_to_speech(text: str, voice_id: str = None) -> bytes:
     if not voice_id:
         voice_id = DEFAULT_VOICE_ID
     
-    logger.info(f"Starting TTS generation - text length: {len(text)}, voice_id: {voice_id}")
+    logger.info("Starting TTS generation - text length: %d, voice_id: %s", len(text), voice_id)
     
     try:
         # Initialize ElevenLabs client
@@ -56,38 +108,102 @@ def text_to_speech(text: str, voice_id: str = None) -> bytes:
         # Using eleven_turbo_v2 for faster generation (lower latency)
         # Alternative: "eleven_flash_v2" for even faster but lower quality
         # "eleven_multilingual_v2" for best quality but slower
-        logger.debug(f"Calling ElevenLabs API with model: eleven_turbo_v2")
-        audio = client.text_to_speech.convert(
-            voice_id=voice_id,
-            text=text,
-            model_id="eleven_turbo_v2"  # Faster model for lower latency
-        )
-        
-        # Read audio bytes
-        logger.debug("Reading audio chunks")
-        audio_bytes = b""
-        chunk_count = 0
-        for chunk in audio:
-            audio_bytes += chunk
-            chunk_count += 1
+        logger.debug("Calling ElevenLabs API with model: eleven_turbo_v2")
+
+        def synthesize() -> tuple[bytes, int]:
+            audio = client.text_to_speech.convert(
+                voice_id=voice_id,
+                text=text,
+                model_id="eleven_turbo_v2",  # Faster model for lower latency
+                output_format=output_format,
+            )
+            # Read audio bytes (the deadline covers the whole download)
+            logger.debug("Reading audio chunks")
+            chunks = list(audio)
+            return b"".join(chunks), len(chunks)
+
+        audio_bytes, chunk_count = _elevenlabs.call(synthesize)
         
-        logger.info(f"TTS generation successful - audio size: {len(audio_bytes)} bytes, chunks: {chunk_count}")
+        logger.info("TTS generation successful - audio size: %d bytes, chunks: %d", len(audio_bytes), chunk_count)
         return audio_bytes
         
+    except UpstreamUnavailable:
+        raise
     except ValueError as e:
-        logger.error(f"TTS ValueError: {str(e)}")
+        logger.error("TTS ValueError: %s", e)
         raise
     except Exception as e:
         error_msg = f"Failed to generate speech: {str(e)}"
-        logger.error(f"TTS Exception: {error_msg}")
-        logger.error(f"Exception type: {type(e).__name__}")
+        logger.error("TTS Exception: %s (%s)", error_msg, type(e).__name__)
         raise Exception(error_msg) from e
 
 
-def handle_tts_request(text: str, voice_id: str | None = None) -> Response:
+def compute_envelope(pcm: bytes, sample_rate: int = PCM_SAMPLE_RATE, fps: int = ENVELOPE_FPS) -> np.ndarray:
+    """
+    Mouth-opening envelope for 16-bit mono PCM: one uint8 (0-255) per 1/fps seconds.
+    Each frame's RMS and peak are computed in one vectorized pass over a (frames, hop) view.
+    """
+    samples = np.frombuffer(pcm[: len(pcm) - len(pcm) % 2], dtype="<i2")
+    hop = sample_rate // fps
+    count = -(-len(samples) // hop)
+    if count == 0:
+        return np.zeros(0, dtype=np.uint8)
+    frames = np.zeros(count * hop, dtype=np.float32)
+    frames[: len(samples)] = samples
+    frames = frames.reshape(count, hop) / 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    peak = np.max(np.abs(frames), axis=1)
+    amplitude = np.minimum((rms + peak) / 2 * ENVELOPE_GAIN, 1.0) ** ENVELOPE_CURVE
+    return np.rint(amplitude * 255).astype(np.uint8)
+
+
+def _pcm_to_wav(pcm: bytes, sample_rate: int = PCM_SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def _pcm_to_mp3(pcm: bytes, sample_rate: int = PCM_SAMPLE_RATE) -> bytes:
+    encoder = lameenc.Encoder()
+    encoder.set_in_sample_rate(sample_rate)
+    encoder.set_channels(1)
+    encoder.set_bit_rate(LIPSYNC_MP3_KBPS)
+    encoder.set_quality(2)
+    return bytes(encoder.encode(pcm) + encoder.flush())
+
+
+def _frame(frame_type: int, payload: bytes) -> bytes:
+    return struct.pack("<BI", frame_type, len(payload)) + payload
+
+
+def encode_lipsync(audio: bytes, envelope: np.ndarray, fps: int = ENVELOPE_FPS, audio_frame: int = FRAME_AUDIO) -> bytes:
+    """LIPSYNC_MEDIA_TYPE body: the envelope frame first (so clients can set up the track), then the audio."""
+    return b"".join((
+        LIPSYNC_MAGIC,
+        _frame(FRAME_ENVELOPE, struct.pack("<H", fps) + envelope.tobytes()),
+        _frame(audio_frame, audio),
+    ))
+
+
+def _synthesize(key: tuple) -> bytes:
+    voice_id, text, lipsync = key
+    if not lipsync:
+        return text_to_speech(text, voice_id)
+    pcm = text_to_speech(text, voice_id, output_format=PCM_FORMAT)
+    if lameenc is not None:
+        return encode_lipsync(_pcm_to_mp3(pcm), compute_envelope(pcm), audio_frame=FRAME_AUDIO_MP3)
+    return encode_lipsync(_pcm_to_wav(pcm), compute_envelope(pcm))
+
+
+def handle_tts_request(text: str, voice_id: str | None = None, lipsync: bool = False) -> Response:
     """
-    Generate speech from text and return a FastAPI Response (audio/mpeg).
+    Generate speech from text and return a FastAPI Response: audio/mpeg, or with lipsync
+    a LIPSYNC_MEDIA_TYPE body carrying MP3 (with lameenc) or WAV audio plus its amplitude envelope.
     Use this from the API route so main has no ElevenLabs-specific logic.
     """
-    audio_bytes = text_to_speech(text, voice_id)
-    return Response(content=audio_bytes, media_type="audio/mpeg")
+    content = _speech_cache.get((voice_id or DEFAULT_VOICE_ID, text, lipsync), _synthesize)
+    return Response(content=content, media_type=LIPSYNC_MEDIA_TYPE if lipsync else "audio/mpeg")
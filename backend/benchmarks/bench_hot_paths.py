@@ -0,0 +1,191 @@
+"""
+Microbenchmarks for the backend's CPU-bound hot paths, with regression thresholds.
+Covers risk keyword matching, extraction prompt construction, JSON recovery and normalization of
+recorded Cohere extraction replies, timeline and alert sorting, UUID validation, and Pydantic
+parsing of large ChatRequest bodies. Inputs come from benchmarks/fixtures/ plus seeded synthetic
+rows; nothing calls Cohere or the database.
+
+Each benchmark reports the best-of-N time per operation. With --check, any benchmark slower than
+its limit in benchmarks/thresholds.json fails the run (exit 1), so it can gate a deploy.
+Limits are generous (3x the run that wrote them) so that only real regressions trip them;
+--update rewrites them from the current run.
+A fixed pure-Python calibration loop is timed first. thresholds.json records its time on the machine
+that wrote the limits, and each run scales its measurements by that ratio, so the same limits hold
+on a faster or slower machine (or a busy CI runner).
+
+Run from backend/:  python -m benchmarks.bench_hot_paths [--repeat N] [--only NAME] [--check] [--update]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# The app modules read these at import; benchmarks never reach either service
+os.environ.setdefault("COHERE_API_KEY", "benchmark")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+
+from app.alerts import sort_alerts
+from app.cohere_chat import build_extraction_prompt, normalize_events, parse_events_json
+from app.risk_rules import assess_risk
+from app.timeline import is_valid_uuid, sort_timeline
+
+FIXTURES = Path(__file__).parent / "fixtures"
+THRESHOLDS = Path(__file__).parent / "thresholds.json"
+# Limits written by --update, as a multiple of the measured time
+UPDATE_HEADROOM = 3.0
+CALIBRATION_WORDS = [f"word{i:05d}" for i in range(20000)]
+TODAY = "2026-10-19"
+
+
+def _load(name: str):
+    return json.loads((FIXTURES / name).read_text())
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _calibrate(repeat: int) -> float:
+    """Best-of-N microseconds for a fixed mix of the string, dict and sort work the hot paths do."""
+    words = list(CALIBRATION_WORDS)
+    random.Random(1).shuffle(words)
+
+    def reference():
+        counts: dict[str, int] = {}
+        for word in words:
+            counts[word[-2:]] = counts.get(word[-2:], 0) + 1
+        sorted(words)
+        " ".join(words).upper().split()
+
+    reference()
+    return _time(reference, max(repeat, 30)) * 1e6
+
+
+def _timeline_rows(n: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "type": rng.choice(["symptom", "appointment", "medication", "alert", "chat"]),
+            # Some rows predate created_at defaults
+            "created_at": None if rng.random() < 0.02 else
+            f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+00:00",
+        }
+        for _ in range(n)
+    ]
+
+
+def _alert_rows(n: int, rng: random.Random) -> list[dict]:
+    rows = _timeline_rows(n, rng)
+    for row in rows:
+        row["severity"] = rng.choice(["low", "medium", "medium", "high", "critical"])
+    return rows
+
+
+def _chat_body(n: int, rng: random.Random, messages: list[str]) -> bytes:
+    turns = []
+    for i in range(n):
+        role = "user" if i % 2 == 0 else "assistant"
+        turns.append({"role": role, "content": " ".join(rng.choice(messages) for _ in range(rng.randint(1, 4)))})
+    return json.dumps({"messages": turns, "patientId": str(uuid.UUID(int=rng.getrandbits(128)))}).encode()
+
+
+def build_benchmarks(rng: random.Random) -> dict:
+    """name -> (ops per call, zero-argument callable)."""
+    messages = _load("messages.json")
+    responses = _load("extraction_responses.json")
+    corpus = messages * 20
+    conversation = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": messages[i % len(messages)]}
+        for i in range(12)
+    ]
+    ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(500)]
+    ids += ["not-a-uuid", "", "1234", ids[0].upper(), ids[1][:-1] + "z"] * 20
+    timeline = _timeline_rows(5000, rng)
+    alerts = _alert_rows(5000, rng)
+
+    # ChatRequest lives in main; importing it wires the whole app (against the in-memory store)
+    from main import ChatRequest
+    chat_body = _chat_body(200, rng, messages)
+
+    def extraction():
+        for text in responses:
+            normalize_events(parse_events_json(text), TODAY)
+
+    return {
+        "assess_risk": (len(corpus), lambda: [assess_risk(m) for m in corpus]),
+        "build_extraction_prompt": (len(messages), lambda: [build_extraction_prompt(m, conversation, TODAY) for m in messages]),
+        "parse_and_normalize_events": (len(responses), extraction),
+        "sort_timeline_5k": (1, lambda: sort_timeline(list(timeline))),
+        "sort_alerts_5k": (1, lambda: sort_alerts(list(alerts))),
+        "is_valid_uuid": (len(ids), lambda: [is_valid_uuid(i) for i in ids]),
+        "chat_request_200_messages": (1, lambda: ChatRequest.model_validate_json(chat_body)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", action="append", help="run only this benchmark (repeatable)")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any benchmark exceeds its threshold")
+    parser.add_argument("--update", action="store_true", help=f"rewrite thresholds.json at {UPDATE_HEADROOM:g}x this run")
+    args = parser.parse_args()
+
+    saved = json.loads(THRESHOLDS.read_text()) if THRESHOLDS.exists() else {}
+    thresholds = saved.get("limits", {})
+    benchmarks = build_benchmarks(random.Random(0))
+    if args.only:
+        unknown = set(args.only) - set(benchmarks)
+        if unknown:
+            parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+        benchmarks = {name: benchmarks[name] for name in args.only}
+
+    # Calibrated before and after the benchmarks; the faster run is the one least disturbed by other load
+    calibration_us = _calibrate(args.repeat)
+    measured = {}
+    for name, (ops, fn) in benchmarks.items():
+        fn()  # warm-up: regex compilation, imports, caches
+        measured[name] = _time(fn, args.repeat) / ops * 1e6
+    calibration_us = min(calibration_us, _calibrate(args.repeat))
+    # Measurements are compared in the time of the machine that wrote the limits
+    scale = saved["calibration_us"] / calibration_us if "calibration_us" in saved and not args.update else 1.0
+    print(f"  calibration: {calibration_us:.0f} us (scale {scale:.2f})\n")
+
+    results = {}
+    print(f"  {'benchmark':<30}{'us/op':>10}{'scaled':>10}{'limit':>10}")
+    for name, us in measured.items():
+        results[name] = us * scale
+        limit = thresholds.get(name)
+        flag = "  REGRESSION" if limit is not None and results[name] > limit else ""
+        print(f"  {name:<30}{us:>10.2f}{results[name]:>10.2f}{limit if limit is not None else '-':>10}{flag}")
+
+    if args.update:
+        if thresholds and "calibration_us" in saved:
+            # Re-express limits that are kept (not re-measured here) in this machine's time
+            thresholds = {name: round(limit * calibration_us / saved["calibration_us"], 2) for name, limit in thresholds.items()}
+        thresholds.update({name: round(us * UPDATE_HEADROOM, 2) for name, us in results.items()})
+        saved = {"calibration_us": round(calibration_us, 1), "limits": thresholds}
+        THRESHOLDS.write_text(json.dumps(saved, indent=2, sort_keys=True) + "\n")
+        print(f"\nWrote {THRESHOLDS.name}")
+    if args.check:
+        failed = [name for name, us in results.items() if name in thresholds and us > thresholds[name]]
+        missing = [name for name in results if name not in thresholds]
+        if missing:
+            print(f"\nNo threshold for: {', '.join(missing)}")
+        if failed:
+            print(f"\n{len(failed)} benchmark(s) over threshold: {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
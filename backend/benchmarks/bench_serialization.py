@@ -0,0 +1,98 @@
+"""
+Serialization / compression benchmark for /api/timeline and /api/patients payloads.
+Compares FastAPI's default path (jsonable_encoder + json.dumps) with FastJSONResponse's orjson
+path, and reports encoded size and time for gzip, brotli and MessagePack where installed.
+Payloads are synthetic rows shaped like the Supabase responses.
+
+Run from backend/:  python -m benchmarks.bench_serialization [--rows N] [--repeat N]
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from app.responses import brotli, compress, msgpack
+
+SYMPTOMS = ["Headache", "Dizziness", "Nausea", "Fatigue", "Chest tightness", "Shortness of breath", "Back pain"]
+CONDITIONS = ["Hypertension", "Type 2 Diabetes", "Asthma", "COPD", "Heart Failure", "CKD"]
+
+
+def timeline_rows(n: int, rng: random.Random) -> list[dict]:
+    patient_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    rows = []
+    for i in range(n):
+        kind = rng.choice(["symptom", "symptom", "appointment", "medication"])
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "patient_id": patient_id,
+            "type": kind,
+            "title": rng.choice(SYMPTOMS) if kind == "symptom" else f"{kind.title()} {i}",
+            "details": {"text": f"Reported during check-in: {rng.choice(SYMPTOMS).lower()} for {rng.randint(1, 9)} days"},
+            "created_at": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00+00:00",
+        })
+    return rows
+
+
+def patient_rows(n: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": f"Patient {i}",
+            "age": rng.randint(18, 95),
+            "conditions": rng.sample(CONDITIONS, rng.randint(0, 3)),
+            "address": f"{rng.randint(1, 999)} Main St",
+            "risk_level": rng.choice(["low", "low", "medium", "high"]),
+            "created_at": "2026-01-15T10:00:00+00:00",
+            "updated_at": None,
+        }
+        for i in range(n)
+    ]
+
+
+def _time(fn, repeat: int) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def bench(name: str, payload: list[dict], repeat: int) -> None:
+    print(f"\n{name}: {len(payload)} rows")
+    print(f"  {'encoding':<28}{'ms':>9}{'bytes':>12}")
+    stdlib_ms, stdlib_body = _time(lambda: json.dumps(jsonable_encoder(payload)).encode(), repeat)
+    orjson_ms, body = _time(lambda: orjson.dumps(payload), repeat)
+    print(f"  {'jsonable_encoder + json':<28}{stdlib_ms:>9.2f}{len(stdlib_body):>12}")
+    print(f"  {'orjson':<28}{orjson_ms:>9.2f}{len(body):>12}  ({stdlib_ms / orjson_ms:.1f}x faster)")
+    gzip_ms, gz = _time(lambda: compress(body, "gzip"), repeat)
+    print(f"  {'orjson + gzip':<28}{orjson_ms + gzip_ms:>9.2f}{len(gz):>12}  ({len(body) / len(gz):.1f}x smaller)")
+    if brotli is not None:
+        br_ms, br = _time(lambda: compress(body, "br"), repeat)
+        print(f"  {'orjson + br':<28}{orjson_ms + br_ms:>9.2f}{len(br):>12}  ({len(body) / len(br):.1f}x smaller)")
+    if msgpack is not None:
+        mp_ms, mp = _time(lambda: msgpack.packb(payload), repeat)
+        print(f"  {'msgpack':<28}{mp_ms:>9.2f}{len(mp):>12}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    bench("/api/timeline", timeline_rows(args.rows, rng), args.repeat)
+    bench("/api/patients", patient_rows(args.rows, rng), args.repeat)
+    if brotli is None or msgpack is None:
+        print("\n(brotli / msgpack not installed: those rows are skipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+
+# The app modules read these at import; tests run against a throwaway in-memory database
+os.environ.setdefault("COHERE_API_KEY", "test")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
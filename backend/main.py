@@ -1,11 +1,12 @@
 import logging
 import os
-import asyncio
-from datetime import datetime
+import threading
+from datetime import date, datetime
 from typing import Optional
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from app.supabase import (
@@ -14,7 +15,8 @@ from app.supabase import (
     sign_out as auth_sign_out,
     get_current_user as auth_get_current_user,
 )
-from app.cohere_chat import get_system_prompt, assess_risk, stream_chat, generate_summary, extract_timeline_events
+from app.cohere_chat import get_system_prompt, reserve_chat_stream, stream_chat, generate_summary
+from app.risk_rules import match_risk_keyword
 from app.tts import handle_tts_request
 from app.doctors import (
     create_doctor as doctors_create,
@@ -29,29 +31,83 @@ from app.patients import (
     search_patients_by_name as patients_search_by_name,
     create_patient as patients_create,
     resolve_patient_id as patients_resolve_patient_id,
-    update_patient_risk as patients_update_risk,
+    set_patient_risk as patients_set_risk,
 )
 from app.alerts import (
     get_alerts as alerts_get_alerts,
     acknowledge_alert as alerts_acknowledge_alert,
-    create_alert as alerts_create_alert,
+    acknowledge_alerts as alerts_acknowledge_alerts,
+    get_alert_inbox as alerts_get_alert_inbox,
+    get_unacknowledged_counts as alerts_get_unacknowledged_counts,
+    raise_alert as alerts_raise_alert,
 )
 
+from app.chat_sessions import (
+    open_session as chat_open_session,
+    get_session as chat_get_session,
+    close_session as chat_close_session,
+    append_message as chat_append_message,
+    flush_messages as chat_flush_messages,
+    schedule_summary as chat_schedule_summary,
+    final_summary as chat_final_summary,
+)
+from app.risk_scoring import (
+    get_risk_trend as risk_get_trend,
+    record_keyword_risk as risk_record_keyword,
+)
+from app.analytics import get_panel_analytics as analytics_get_panel
+from app.export import (
+    export_patient,
+    export_doctor_panel,
+    export_clinic,
+    ndjson_stream,
+)
+from app.admin import require_admin
+from app.logs import configure_logging, get_logging_stats, phi, sample
+from app.auth import AuthUser, optional_user
+from app.cache import get_cache_stats
+from app.etag import conditional_json
+from app.responses import FastJSONResponse, NegotiationMiddleware
+from app.resilience import get_upstream_stats
+from app.bus import DEFAULT_UNIX_BUS, get_bus_stats, start_bus, stop_bus
+from app.care_graph import get_care_graph_stats, load as care_graph_load
+from app.timeline_dedup import get_timeline_dedup_stats
+from app.timeline_search import get_timeline_search_stats, load as timeline_search_load, search_timeline
+from app.extraction_batcher import extraction_batcher, get_extraction_batching_stats
+from app.admission import (
+    PRIORITY_ACTIVE,
+    PRIORITY_NEW,
+    AdmittedStreamingResponse,
+    chat_admission,
+    chat_stream_executor,
+    post_stream_executor,
+    get_admission_stats,
+    iterate_in_executor,
+    tts_admission,
+)
+from app.rescore import get_status as rescore_get_status, start_rescore_job
+from app.profiler import ProfilerMiddleware, get_capture as profiler_get_capture, start_capture as profiler_start_capture
 from app.timeline import (
     get_timeline as timeline_get_timeline,
     add_event as timeline_add_event,
+    add_events as timeline_add_events,
     delete_event as timeline_delete_event,
+    VALID_EVENT_TYPES,
 )
 
 # Load environment variables
 load_dotenv()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
-)
+# Queue-backed, rate-limited, PHI-redacting logging (app.logs); log with %-style args, not f-strings
+configure_logging()
+
+app = FastAPI(title="CareBridge API", default_response_class=FastJSONResponse)
 
-app = FastAPI(title="CareBridge API")
+# Accept / Accept-Encoding negotiation for FastJSONResponse (msgpack, brotli/gzip)
+app.add_middleware(NegotiationMiddleware)
+
+# Marks requests to a route being profiled (app.profiler); a no-op when no capture is running
+app.add_middleware(ProfilerMiddleware)
 
 # CORS for frontend
 app.add_middleware(
@@ -62,6 +118,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def join_change_bus():
+    """In multi-worker mode, share app.* writes with the other workers (see app.bus)."""
+    start_bus()
+
+
+@app.on_event("startup")
+def load_care_graph():
+    """Load patient<->doctor links into memory; if the database is unreachable, the first lookup retries."""
+    try:
+        care_graph_load()
+    except Exception as e:
+        logging.error("Failed to load care graph at startup: %s", e)
+
+
+@app.on_event("startup")
+def warm_timeline_search():
+    """Build the timeline search index in the background; a search that arrives first waits for it."""
+    def build():
+        try:
+            timeline_search_load()
+        except Exception as e:
+            logging.error("Failed to build timeline search index at startup: %s", e)
+
+    threading.Thread(target=build, name="timeline-search-load", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def flush_pending_writes():
+    """Persist chat messages still queued for the background writer."""
+    chat_flush_messages()
+    stop_bus()
+
+
 # ============== Pydantic Models ==============
 
 
@@ -71,14 +161,28 @@ class ChatMessage(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    messages: list[ChatMessage]
+    messages: list[ChatMessage] = Field(default_factory=list)
     patientId: Optional[str] = None
+    # Session protocol: after POST /api/chat/session, send only sessionId + the new message
+    sessionId: Optional[str] = None
+    message: Optional[str] = None
+
+
+class ChatSessionOpen(BaseModel):
+    patientId: Optional[str] = None
+    messages: list[ChatMessage] = Field(default_factory=list)
+    # True when re-opening a conversation whose messages are already stored
+    resume: bool = False
 
 
 class AlertAcknowledge(BaseModel):
     acknowledged: bool = True
 
 
+class AlertBulkAcknowledge(BaseModel):
+    ids: list[str]
+
+
 class CreateDoctorBody(BaseModel):
     user_id: str = Field(..., alias="userId")
     specialty: str | None = Field(None)
@@ -109,6 +213,8 @@ class PatientDoctorLink(BaseModel):
 class TTSRequest(BaseModel):
     text: str
     voice_id: str | None = Field(None, alias="voiceId")
+    # Return the audio plus a precomputed lip-sync envelope (app.tts.LIPSYNC_MEDIA_TYPE) instead of plain MP3
+    lipsync: bool = False
 
     class Config:
         populate_by_name = True
@@ -225,11 +331,15 @@ def sign_out():
 
 
 @app.get("/auth/getuser")
-def get_current_user(userId: Optional[str] = None):
+def get_current_user(userId: Optional[str] = None, user: Optional[AuthUser] = Depends(optional_user)):
     """
-    Get current user. If userId is provided as query param, return it.
+    Get current user. With an Authorization: Bearer <accessToken> header, the token is verified
+    locally and its user returned. Otherwise, if userId is provided as query param, return it.
     Otherwise, try to get from Supabase session (may not work due to service role key).
     """
+    if user is not None:
+        return {"status": 200, "user": user.to_dict(), "uid": user.id}
+
     # If userId is provided, use it directly (frontend passes it from localStorage)
     if userId:
         # Verify the user exists in Supabase auth
@@ -275,50 +385,117 @@ def get_greeting():
     return {"text": greeting_text}
 
 
+def _patient_system_prompt(patient_id: str | None) -> tuple[str, str | None]:
+    """Base system prompt plus patient context. Returns (system_prompt, resolved patients.id or None)."""
+    system_prompt = get_system_prompt()
+    resolved_patient_id = None
+    if patient_id:
+        try:
+            patient = patients_get_patient(patient_id)
+            conds = patient.get("conditions") or []
+            conditions = ", ".join(conds) if conds else "None reported"
+            system_prompt += f"\n\nPatient context: {patient['name']}, {patient['age']} years old. Known conditions: {conditions}."
+            resolved_patient_id = patient.get("id")
+        except HTTPException:
+            pass
+    return system_prompt, resolved_patient_id
+
+
+def _require_session(session_id: str):
+    session = chat_get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+    return session
+
+
+@app.post("/api/chat/session")
+def open_chat_session(body: ChatSessionOpen):
+    """
+    Open a server-side chat session. The patient lookup and system prompt are done once here;
+    afterwards /api/chat only needs {sessionId, message}. Optional messages seed the history (e.g. the greeting).
+    """
+    system_prompt, resolved_patient_id = _patient_system_prompt(body.patientId)
+    if body.patientId and not resolved_patient_id:
+        resolved_patient_id = patients_resolve_patient_id(body.patientId)
+    session = chat_open_session(
+        body.patientId,
+        resolved_patient_id,
+        system_prompt,
+        [{"role": msg.role, "content": msg.content} for msg in body.messages],
+        resume=body.resume,
+    )
+    return {"sessionId": session.id}
+
+
+def _add_summary_event(patient_id: str, summary: str) -> None:
+    """Store the conversation summary as a timeline event (runs after /api/chat/end has responded)."""
+    try:
+        # Resolve patient ID (user_id to patient UUID if needed)
+        resolved_patient_id = None
+        try:
+            patient = patients_get_patient(patient_id)
+            resolved_patient_id = patient.get("id")
+        except HTTPException:
+            # If patient lookup fails, try to resolve it
+            resolved_patient_id = patients_resolve_patient_id(patient_id)
+
+        if resolved_patient_id:
+            # Create timeline event with the summary
+            timeline_add_event(
+                resolved_patient_id,
+                "chat",
+                "AI Conversation Summary",
+                summary
+            )
+            logging.info("Created timeline event for conversation summary for patient: %s", phi(resolved_patient_id))
+        else:
+            logging.warning("Could not resolve patient ID for summary timeline event: %s", phi(patient_id))
+    except Exception as e:
+        logging.error("Failed to create summary timeline event: %s", e, exc_info=True)
+
+
 @app.post("/api/chat/end")
-def end_call(request: ChatRequest):
-    """End the call: return closing message and generate conversation summary."""
+def end_call(request: ChatRequest, background_tasks: BackgroundTasks):
+    """
+    End the call: return closing message and conversation summary.
+    With sessionId, messages is optional and only used when the session is gone.
+    Sessions return their rolling summary (kept up to date after each turn); a full summary is
+    generated only when there is none or it cannot be brought up to date.
+    The summary's timeline event is written after responding.
+    """
     # Hardcoded closing message
     closing_message = (
         "Thank you for sharing with me today. Take care and feel better soon!"
     )
 
+    patient_id = request.patientId
+    summary = None
+    # Clients send only sessionId and resend their transcript after a 404; a request carrying
+    # both (evicted session, or one held by another worker) is summarized from messages
+    session = chat_get_session(request.sessionId) if request.sessionId else None
+    if request.sessionId and session is None and not request.messages:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+    if session is not None:
+        messages = session.history()
+        patient_id = patient_id or session.patient_id
+        chat_close_session(session.id)
+        summary = chat_final_summary(session)
+    else:
+        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+
     # Generate summary from conversation messages
-    messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-    summary = ""
     try:
-        if messages:
+        if summary is None and messages:
             summary = generate_summary(messages)
     except Exception as e:
-        logging.error(f"Failed to generate summary: {e}")
+        logging.error("Failed to generate summary: %s", e)
         summary = "**Summary**: Unable to generate conversation summary."
-    
+    summary = summary or ""
+
     # Add summary as a timeline event if patientId is provided
-    if request.patientId:
-        try:
-            # Resolve patient ID (user_id to patient UUID if needed)
-            resolved_patient_id = None
-            try:
-                patient = patients_get_patient(request.patientId)
-                resolved_patient_id = patient.get("id")
-            except HTTPException:
-                # If patient lookup fails, try to resolve it
-                resolved_patient_id = patients_resolve_patient_id(request.patientId)
-            
-            if resolved_patient_id:
-                # Create timeline event with the summary
-                timeline_add_event(
-                    resolved_patient_id,
-                    "chat",
-                    "AI Conversation Summary",
-                    summary
-                )
-                logging.info(f"Created timeline event for conversation summary for patient: {resolved_patient_id}")
-            else:
-                logging.warning(f"Could not resolve patient ID for summary timeline event: {request.patientId}")
-        except Exception as e:
-            logging.error(f"Failed to create summary timeline event: {e}", exc_info=True)
-    
+    if patient_id:
+        background_tasks.add_task(_add_summary_event, patient_id, summary)
+
     return {
         "closingMessage": closing_message,
         "summary": summary
@@ -327,127 +504,176 @@ def end_call(request: ChatRequest):
 
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
-    """Stream chat responses from Cohere (app.cohere_chat)."""
-    system_prompt = get_system_prompt()
-    resolved_patient_id = None
-    if request.patientId:
-        try:
-            patient = patients_get_patient(request.patientId)
-            conds = patient.get("conditions") or []
-            conditions = ", ".join(conds) if conds else "None reported"
-            system_prompt += f"\n\nPatient context: {patient['name']}, {patient['age']} years old. Known conditions: {conditions}."
-            resolved_patient_id = patient.get("id")
-        except HTTPException:
-            pass
-    messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-    last_message = request.messages[-1].content if request.messages else ""
+    """
+    Stream chat responses from Cohere (app.cohere_chat).
+    With sessionId, only the new message is sent and the history comes from the server-side session;
+    otherwise the full messages array is used (legacy clients).
+    Admission-controlled: conversations the patient has already replied in are served before new ones,
+    and a saturated server answers 503 + Retry-After instead of queueing without bound. Cohere's own
+    capacity and circuit are checked before streaming starts too, so they also surface as 503.
+    """
+    session = None
+    if request.sessionId:
+        session = _require_session(request.sessionId)
+        if not request.message:
+            raise HTTPException(status_code=400, detail="message is required with sessionId")
+        in_progress = any(m["role"] == "user" for m in session.history())
+    else:
+        in_progress = any(msg.role == "user" for msg in request.messages[:-1])
+    ticket = await chat_admission.acquire(PRIORITY_ACTIVE if in_progress else PRIORITY_NEW)
+
+    reservation = None
+    try:
+        reservation = await run_in_threadpool(reserve_chat_stream)
+        if session is not None:
+            chat_append_message(session, "user", request.message)
+            patient_id = session.patient_id
+            system_prompt = session.system_prompt
+            resolved_patient_id = session.resolved_patient_id
+            messages = session.history()
+            last_message = request.message
+        else:
+            patient_id = request.patientId
+            system_prompt, resolved_patient_id = await run_in_threadpool(_patient_system_prompt, patient_id)
+            messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+            last_message = request.messages[-1].content if request.messages else ""
+    except BaseException:
+        ticket.release()
+        if reservation is not None:
+            reservation.release()
+        raise
 
     async def generate():
         nonlocal resolved_patient_id
-        logging.info(f"Chat request received. patientId: {request.patientId}, message count: {len(request.messages)}")
+        logging.info("Chat request received. patientId: %s, message count: %d", phi(patient_id), len(messages), extra=sample(0.1))
         try:
-            for chunk in stream_chat(messages, system_prompt):
+            reply = []
+            # Cohere is read on the chat stream pool so the event loop stays free for other routes
+            async for chunk in iterate_in_executor(stream_chat(messages, system_prompt, reservation), chat_stream_executor):
+                reply.append(chunk)
                 yield chunk
-            logging.info(f"Streaming completed. patientId: {request.patientId}")
+            logging.debug("Streaming completed. patientId: %s", phi(patient_id))
+            if session is not None:
+                chat_append_message(session, "assistant", "".join(reply))
+                chat_schedule_summary(session)
             
             # Schedule post-stream processing asynchronously (don't block response)
-            if request.patientId:
-                logging.info(f"Scheduling post-stream actions for patientId: {request.patientId}")
+            if patient_id:
+                logging.debug("Scheduling post-stream actions for patientId: %s", phi(patient_id))
                 # Resolve patient ID before scheduling background task
                 if not resolved_patient_id:
-                    resolved_patient_id = patients_resolve_patient_id(request.patientId)
+                    resolved_patient_id = await run_in_threadpool(patients_resolve_patient_id, patient_id)
                 
-                # Schedule background task for timeline extraction and risk assessment
-                asyncio.create_task(process_post_stream_actions_async(
-                    request.patientId,
+                # Schedule risk assessment and timeline extraction (blocking Supabase calls) on their
+                # own pool, so they never hold the threadpool the sync routes run on
+                post_stream_executor.submit(
+                    process_post_stream_actions,
+                    patient_id,
                     resolved_patient_id,
                     last_message,
                     messages
-                ))
+                )
         except Exception as e:
             import traceback
 
             traceback.print_exc()
             yield f"I'm sorry, I encountered an error: {str(e)}"
 
-    return StreamingResponse(generate(), media_type="text/plain")
+    return AdmittedStreamingResponse(generate(), ticket, reservation, media_type="text/plain")
 
 
-async def process_post_stream_actions_async(
+def process_post_stream_actions(
     patient_id: str,
     resolved_patient_id: str | None,
     last_message: str,
     messages: list[dict]
 ):
-    """Process risk assessment and timeline extraction asynchronously in the background."""
+    """
+    Risk assessment after a reply, then timeline extraction; runs on post_stream_executor.
+    Extraction is queued with the batcher and stored by _store_extracted_events when its batch
+    returns, so no thread waits on the batch window or the Cohere call.
+    """
     try:
         if not resolved_patient_id:
-            logging.warning(f"No patient found for timeline events. patientId: {patient_id}")
+            logging.warning("No patient found for timeline events. patientId: %s", phi(patient_id))
             return
         
-        # Risk assessment
-        risk_level = assess_risk(last_message)
+        # Risk assessment (repeats collapse into the open alert; unchanged risk is not rewritten)
+        risk_level, keyword = match_risk_keyword(last_message)
         if risk_level == "high":
             try:
-                alerts_create_alert(
+                alerts_raise_alert(
                     patient_id,
                     "critical",
                     f"High-risk symptoms reported: \"{last_message[:50]}...\"",
                     "Keywords indicating potentially serious symptoms were detected.",
+                    dedup_key=keyword,
                 )
-                patients_update_risk(patient_id, "high")
+                patients_set_risk(patient_id, "high")
+                risk_record_keyword(resolved_patient_id)
             except HTTPException:
                 pass
         
         # Extract and create timeline events from the conversation
-        logging.info(f"Attempting to extract timeline events from message: {last_message[:100]}")
-        try:
-            extracted_events = extract_timeline_events(last_message, messages)
-            logging.info(f"Extracted {len(extracted_events)} timeline events: {extracted_events}")
-            for event in extracted_events:
-                try:
-                    # Double-check: only allow symptom, appointment, or medication types
-                    event_type = event.get("type")
-                    if event_type not in ["symptom", "appointment", "medication"]:
-                        logging.warning(f"Skipping invalid event type '{event_type}'. Only symptom, appointment, and medication are allowed.")
-                        continue
-                    
-                    # Convert date string to proper format for timeline_add_event
-                    date_str = event.get("date")
-                    logging.info(f"Creating timeline event: type={event_type}, title={event.get('title')}, date={date_str}")
-                    timeline_add_event(
-                        resolved_patient_id,
-                        event_type,
-                        event["title"],
-                        event.get("details", ""),
-                        date_str  # This will be passed as created_at parameter
-                    )
-                    logging.info(f"Successfully created timeline event: {event.get('title')}")
-                except HTTPException as he:
-                    logging.error(f"HTTPException creating timeline event: {he.detail}")
-                except Exception as e:
-                    logging.error(f"Failed to create timeline event: {type(e).__name__}: {e}", exc_info=True)
-        except Exception as e:
-            logging.error(f"Failed to extract timeline events: {type(e).__name__}: {e}", exc_info=True)
+        logging.debug("Attempting to extract timeline events from message: %s", phi(last_message[:100]))
+        # Batched with other patients' turns (app.extraction_batcher) to cut upstream requests
+        extraction_batcher.submit(last_message, messages).add_done_callback(
+            lambda future: post_stream_executor.submit(_store_extracted_events, resolved_patient_id, future)
+        )
     except Exception as e:
-        logging.error(f"Error in post-stream processing: {e}", exc_info=True)
+        logging.error("Error in post-stream processing: %s", e, exc_info=True)
+
+
+def _store_extracted_events(resolved_patient_id: str, future) -> None:
+    """Validate and insert one turn's extracted timeline events (future from extraction_batcher.submit)."""
+    try:
+        extracted_events = future.result()
+        logging.info("Extracted %d timeline events", len(extracted_events), extra=sample(0.1))
+        logging.debug("Extracted timeline events: %s", phi(extracted_events))
+        # Double-check: only allow symptom, appointment, or medication types
+        valid_events = []
+        for event in extracted_events:
+            event_type = event.get("type")
+            if event_type not in ["symptom", "appointment", "medication"]:
+                logging.warning("Skipping invalid event type %r. Only symptom, appointment, and medication are allowed.", event_type)
+                continue
+            valid_events.append(event)
+        if valid_events:
+            # One patient lookup and one multi-row insert for the whole batch
+            results = timeline_add_events(resolved_patient_id, valid_events)
+            for result in results:
+                if result.get("merged"):
+                    logging.debug("Merged duplicate timeline event into %s", result["event"].get("id"))
+                elif result.get("success"):
+                    logging.debug("Created timeline event: %s", phi(result["event"].get("title")))
+                else:
+                    logging.error("Failed to create timeline event: %s", result.get("error"))
+    except HTTPException as he:
+        logging.error("HTTPException creating timeline events: %s", he.detail)
+    except Exception as e:
+        logging.error("Failed to extract timeline events: %s: %s", type(e).__name__, e, exc_info=True)
+
 
 # --- TTS (app.tts / ElevenLabs) ---
 
 
 @app.post("/api/tts")
-def generate_speech(request: TTSRequest):
-    """Generate speech from text using ElevenLabs (app.tts)."""
-    return handle_tts_request(request.text, request.voice_id)
+async def generate_speech(request: TTSRequest):
+    """Generate speech from text using ElevenLabs (app.tts). Admission-controlled like /api/chat."""
+    ticket = await tts_admission.acquire()
+    try:
+        return await run_in_threadpool(handle_tts_request, request.text, request.voice_id, request.lipsync)
+    finally:
+        ticket.release()
 
 
 # --- Patients (Supabase: app.patients) ---
 
 
 @app.get("/api/patients")
-def get_patients():
-    """List all patients from Supabase."""
-    return patients_get_patients()
+def get_patients(request: Request):
+    """List all patients from Supabase. Supports If-None-Match."""
+    return conditional_json(request, ("patients",), patients_get_patients)
 
 
 @app.get("/api/patients/search")
@@ -457,9 +683,15 @@ def search_patients(name: Optional[str] = None):
 
 
 @app.get("/api/patients/{patient_id}")
-def get_patient(patient_id: str):
-    """Get one patient by id from Supabase."""
-    return patients_get_patient(patient_id)
+def get_patient(patient_id: str, request: Request):
+    """Get one patient by id from Supabase. Supports If-None-Match."""
+    return conditional_json(request, ("patients",), lambda: patients_get_patient(patient_id))
+
+
+@app.get("/api/patients/{patient_id}/risk")
+def get_patient_risk_trend(patient_id: str):
+    """Trend-based risk score over the patient's recent symptom events."""
+    return risk_get_trend(patient_id)
 
 
 @app.post("/api/patients")
@@ -488,10 +720,51 @@ class TimelineEventCreate(BaseModel):
         populate_by_name = True
 
 
+class TimelineEventItem(BaseModel):
+    type: str
+    title: str
+    details: Optional[str] = None
+    created_at: Optional[str] = Field(None, alias="createdAt")
+
+    class Config:
+        populate_by_name = True
+
+
+class TimelineBatchCreate(BaseModel):
+    patient_id: str = Field(..., alias="patientId")
+    events: list[TimelineEventItem]
+
+    class Config:
+        populate_by_name = True
+
+
 @app.get("/api/timeline")
-def get_timeline(patientId: Optional[str] = None):
-    """List timeline events from Supabase, optionally filtered by patient."""
-    return timeline_get_timeline(patientId)
+def get_timeline(request: Request, patientId: Optional[str] = None):
+    """List timeline events from Supabase, optionally filtered by patient. Supports If-None-Match."""
+    return conditional_json(request, ("timeline_events", "patients"), lambda: timeline_get_timeline(patientId))
+
+
+@app.get("/api/timeline/search")
+def search_timeline_events(
+    q: str,
+    patientId: Optional[str] = None,
+    type: Optional[str] = None,
+    dateFrom: Optional[date] = None,
+    dateTo: Optional[date] = None,
+    limit: int = 20,
+):
+    """
+    Full-text search over timeline titles and details (BM25-ranked, app.timeline_search).
+    Optional filters: patientId (patients.id or user_id), event type, and an inclusive date range.
+    """
+    if type is not None and type not in VALID_EVENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid event type: {type}")
+    resolved_patient_id = None
+    if patientId:
+        resolved_patient_id = patients_resolve_patient_id(patientId)
+        if not resolved_patient_id:
+            return {"results": [], "total": 0}
+    return search_timeline(q, resolved_patient_id, type, dateFrom, dateTo, limit)
 
 
 @app.post("/api/timeline")
@@ -500,6 +773,13 @@ def create_timeline_event(body: TimelineEventCreate):
     return timeline_add_event(body.patient_id, body.type, body.title, body.details, body.created_at)
 
 
+@app.post("/api/timeline/batch")
+def create_timeline_events(body: TimelineBatchCreate):
+    """Create many timeline events for one patient in a single insert. Returns per-row results."""
+    events = [event.model_dump() for event in body.events]
+    return {"results": timeline_add_events(body.patient_id, events)}
+
+
 @app.delete("/api/timeline/{event_id}")
 def delete_timeline_event(event_id: str):
     """Delete a timeline event by id."""
@@ -510,13 +790,58 @@ def delete_timeline_event(event_id: str):
 
 
 @app.get("/api/alerts")
-def get_alerts(patientId: Optional[str] = None, doctorId: Optional[str] = None):
+def get_alerts(request: Request, patientId: Optional[str] = None, doctorId: Optional[str] = None):
     """
     List alerts scoped by patient or doctor. Doctors only see alerts for their assigned patients.
     Pass patientId (one patient's alerts) or doctorId (alerts for all of that doctor's patients).
-    If neither is passed, returns empty list.
+    If neither is passed, returns empty list. Supports If-None-Match.
     """
-    return alerts_get_alerts(patient_id=patientId, doctor_id=doctorId)
+    return conditional_json(
+        request,
+        ("alerts", "patient_doctors"),
+        lambda: alerts_get_alerts(patient_id=patientId, doctor_id=doctorId),
+    )
+
+
+@app.get("/api/alerts/inbox")
+def get_alert_inbox(
+    request: Request,
+    patientId: Optional[str] = None,
+    doctorId: Optional[str] = None,
+    severity: Optional[str] = None,
+    acknowledged: Optional[bool] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+):
+    """
+    Paginated alert triage list, newest first, with unacknowledged counts for the scope.
+    Filter by severity (critical/warning) and acknowledged; pass nextCursor back as cursor for the next page.
+    """
+    return conditional_json(
+        request,
+        ("alerts", "patient_doctors"),
+        lambda: alerts_get_alert_inbox(
+            doctor_id=doctorId,
+            patient_id=patientId,
+            severity=severity,
+            acknowledged=acknowledged,
+            limit=limit,
+            cursor=cursor,
+        ),
+    )
+
+
+@app.get("/api/alerts/counts")
+def get_alert_counts(patientId: Optional[str] = None, doctorId: Optional[str] = None):
+    """Unacknowledged alert counts for a doctor's panel (with per-patient counts) or one patient."""
+    return alerts_get_unacknowledged_counts(doctor_id=doctorId, patient_id=patientId)
+
+
+@app.post("/api/alerts/acknowledge")
+def acknowledge_alerts(body: AlertBulkAcknowledge):
+    """Acknowledge many alerts in one update. Returns the alerts that changed."""
+    acknowledged = alerts_acknowledge_alerts(body.ids)
+    return {"acknowledged": len(acknowledged), "alerts": acknowledged}
 
 
 @app.post("/api/alerts/{alert_id}/acknowledge")
@@ -534,11 +859,16 @@ def create_doctor(body: CreateDoctorBody):
 
 
 @app.get("/api/doctors/me/patients")
-def get_my_patients():
+def get_my_patients(user: Optional[AuthUser] = Depends(optional_user)):
     """
     List all patients connected to this doctor.
-    Pass doctor_id as query param (UUID). With auth, resolve doctor_id from current user's token.
+    The doctor is the bearer token's user; without a token, falls back to the server's Supabase session.
     """
+    if user is not None:
+        if user.role and user.role != "doctor":
+            raise HTTPException(status_code=403, detail="Only doctors have a patient list")
+        return doctors_get_my_patients(user.id)
+
     # print(res)
     # print(res["status"])
     #
@@ -559,6 +889,12 @@ def get_my_patients():
     return doctors_get_my_patients(doctor["user"].id)
 
 
+@app.get("/api/doctors/{doctor_id}/analytics")
+def get_doctor_analytics(doctor_id: str):
+    """Panel-wide risk distribution, alert rates, condition symptom frequencies and week-over-week changes."""
+    return FastJSONResponse(analytics_get_panel(doctor_id))
+
+
 @app.get("/api/patients/{patient_id}/doctors")
 def get_patient_doctors(patient_id: str):
     """List all doctors connected to this patient."""
@@ -577,17 +913,165 @@ def disconnect_patient_doctor(patient_id: str, doctor_id: str):
     return doctors_disconnect(patient_id, doctor_id)
 
 
+# --- Export (app.export) ---
+
+
+def _export_response(records, filename: str, gzip: bool) -> StreamingResponse:
+    """Stream records as NDJSON, or as a .ndjson.gz download when gzip is set."""
+    if gzip:
+        return StreamingResponse(
+            ndjson_stream(records, compress=True),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson.gz"'},
+        )
+    return StreamingResponse(
+        ndjson_stream(records),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson"'},
+    )
+
+
+@app.get("/api/export/patients/{patient_id}", dependencies=[Depends(require_admin)])
+def export_patient_record(patient_id: str, gzip: bool = False):
+    """Stream one patient's full record (patient, timeline, alerts, messages, doctor links)."""
+    return _export_response(export_patient(patient_id), f"patient-{patient_id}", gzip)
+
+
+@app.get("/api/export/doctors/{doctor_id}", dependencies=[Depends(require_admin)])
+def export_doctor_panel_records(doctor_id: str, gzip: bool = False):
+    """Stream a doctor's whole panel: the doctor, their links and each linked patient's full record."""
+    return _export_response(export_doctor_panel(doctor_id), f"doctor-{doctor_id}", gzip)
+
+
+@app.get("/api/export/clinic", dependencies=[Depends(require_admin)])
+def export_clinic_records(gzip: bool = False):
+    """Stream every clinical table."""
+    return _export_response(export_clinic(), "clinic", gzip)
+
+
+# --- Admin ---
+
+
+@app.get("/api/admin/cache", dependencies=[Depends(require_admin)])
+def get_admin_cache_stats():
+    """Size and hit-rate metrics for every in-process cache and index, plus the change bus and log limiter."""
+    return {
+        "caches": get_cache_stats(),
+        "careGraph": get_care_graph_stats(),
+        "timelineDedup": get_timeline_dedup_stats(),
+        "timelineSearch": get_timeline_search_stats(),
+        "bus": get_bus_stats(),
+        "logging": get_logging_stats(),
+    }
+
+
+@app.get("/api/admin/admission", dependencies=[Depends(require_admin)])
+def get_admin_admission_stats():
+    """Active, waiting and rejected counts for each admission-controlled route."""
+    return {"routes": get_admission_stats()}
+
+
+@app.get("/api/admin/upstreams", dependencies=[Depends(require_admin)])
+def get_admin_upstream_stats():
+    """Circuit breaker state, p95 latency, timeouts and hedging counts per upstream provider, plus extraction batching."""
+    return {"upstreams": get_upstream_stats(), "extractionBatching": get_extraction_batching_stats()}
+
+
+class RescoreStart(BaseModel):
+    resume: bool = False
+    dryRun: bool = False
+    workers: Optional[int] = None
+
+
+@app.post("/api/admin/rescore", dependencies=[Depends(require_admin)])
+def start_admin_rescore(req: RescoreStart):
+    """Start a background re-score of every patient's risk_level."""
+    result = start_rescore_job(resume=req.resume, dry_run=req.dryRun, workers=req.workers)
+    if not result.pop("started"):
+        raise HTTPException(status_code=409, detail="A rescore job is already running")
+    return result
+
+
+@app.get("/api/admin/rescore", dependencies=[Depends(require_admin)])
+def get_admin_rescore_status():
+    """Progress of the current or last re-score job."""
+    return rescore_get_status()
+
+
+class ProfileStart(BaseModel):
+    # Sample for this many seconds, or (with route) during the next `requests` requests to that path
+    seconds: Optional[float] = None
+    route: Optional[str] = None
+    requests: int = 1
+    hz: int = 50
+    tailSeconds: float = 2.0
+    allThreads: bool = False
+
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+def start_admin_profile(req: ProfileStart):
+    """
+    Start a sampling profiler capture (e.g. {"route": "/api/chat/end", "requests": 5}) on the worker
+    that receives this call; fetch the result by the returned id from any worker.
+    """
+    status = profiler_start_capture(
+        seconds=req.seconds,
+        route=req.route,
+        requests=req.requests,
+        hz=req.hz,
+        tail_seconds=req.tailSeconds,
+        all_threads=req.allThreads,
+    )
+    if status is None:
+        raise HTTPException(status_code=409, detail="A profiler capture is already running")
+    return status
+
+
+@app.get("/api/admin/profile/{capture_id}", dependencies=[Depends(require_admin)])
+def get_admin_profile(capture_id: str, format: str = "speedscope"):
+    """
+    The capture's profile once it is done: format=speedscope (JSON for speedscope.app),
+    collapsed (flamegraph.pl / speedscope text) or status. 202 with the status while still running.
+    """
+    capture = profiler_get_capture(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    if format == "status":
+        return capture.status()
+    if not capture.done.is_set():
+        return JSONResponse(status_code=202, content=capture.status())
+    filename = f"profile-{capture.id}"
+    if format == "collapsed":
+        return Response(
+            content=capture.collapsed(),
+            media_type="text/plain",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.txt"'},
+        )
+    if format == "speedscope":
+        return FastJSONResponse(
+            capture.speedscope(),
+            headers={"Content-Disposition": f'attachment; filename="{filename}.speedscope.json"'},
+        )
+    raise HTTPException(status_code=400, detail="format must be speedscope, collapsed or status")
+
+
 # ============== Run ==============
 
 if __name__ == "__main__":
     import uvicorn
 
+    # WEB_CONCURRENCY > 1 runs that many worker processes kept coherent by the change bus
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
     print(
-        """
+        f"""
 CareBridge Backend
 ==================
-Server running on http://localhost:8000
+Server running on http://localhost:8000 ({workers} worker{"s" if workers > 1 else ""})
 Press Ctrl+C to stop
     """
     )
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if workers > 1:
+        os.environ.setdefault("INVALIDATION_BUS", DEFAULT_UNIX_BUS)
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
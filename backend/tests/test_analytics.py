@@ -0,0 +1,47 @@
+import threading
+import time
+import uuid
+
+from app import analytics
+
+PATIENTS = [{"id": "p1", "user_id": "u1", "risk_level": "high", "conditions": ["asthma"]}]
+ALERTS = [
+    {"id": "a1", "patient_id": "u1", "severity": "critical", "acknowledged": False, "created_at": "2026-10-18T00:00:00"},
+    {"id": "a2", "patient_id": "p1", "severity": "warning", "acknowledged": False, "created_at": "2026-10-18T00:00:00"},
+]
+
+
+def _panel_source(monkeypatch, delay: float = 0.0) -> list[str]:
+    reads = []
+
+    def fetch_in(table, columns, column, values):
+        reads.append(table)
+        time.sleep(delay)
+        return {"patients": PATIENTS, "alerts": ALERTS}.get(table, [])
+
+    monkeypatch.setattr(analytics, "patients_of", lambda doctor_id: ["u1"])
+    monkeypatch.setattr(analytics, "_fetch_in", fetch_in)
+    return reads
+
+
+def test_concurrent_requests_share_one_build(monkeypatch):
+    reads = _panel_source(monkeypatch, delay=0.05)
+    doctor_id = str(uuid.uuid4())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(analytics.get_panel_analytics(doctor_id))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert reads.count("patients") == 1
+    assert len(results) == 4 and all(r["alerts"]["total"] == 2 for r in results)
+
+
+def test_deleted_alert_leaves_the_panel(monkeypatch):
+    _panel_source(monkeypatch)
+    doctor_id = str(uuid.uuid4())
+    assert analytics.get_panel_analytics(doctor_id)["alerts"]["critical"] == 1
+    analytics._on_alerts("delete", [{"id": "a1", "patient_id": "u1"}])
+    result = analytics.get_panel_analytics(doctor_id)
+    assert result["alerts"]["total"] == 1
+    assert result["alerts"]["critical"] == 0
@@ -0,0 +1,81 @@
+import threading
+import queue
+
+from app import chat_sessions
+from app.chat_sessions import ChatSession, append_message, final_summary, schedule_summary
+
+
+def _session(turns: int) -> ChatSession:
+    session = ChatSession(None, None, "system prompt")
+    for i in range(turns):
+        append_message(session, "user" if i % 2 == 0 else "assistant", f"message {i}")
+    return session
+
+
+def _in_background() -> bool:
+    return threading.current_thread().name.startswith("chat-summary")
+
+
+def test_caught_up_summary_is_returned_as_is(monkeypatch):
+    calls = []
+
+    def update_summary(previous, new_messages):
+        calls.append(len(new_messages))
+        return f"{previous or ''}+{len(new_messages)}"
+
+    monkeypatch.setattr(chat_sessions, "update_summary", update_summary)
+    session = _session(2)
+    schedule_summary(session)
+    assert final_summary(session, wait=5) == "+2"
+    assert calls == [2]
+
+
+def test_slow_update_is_caught_up_synchronously(monkeypatch):
+    release = threading.Event()
+
+    def update_summary(previous, new_messages):
+        if _in_background():
+            release.wait(5)
+            return "stale"
+        return f"{previous or ''}+{len(new_messages)}"
+
+    monkeypatch.setattr(chat_sessions, "update_summary", update_summary)
+    session = _session(2)
+    schedule_summary(session)
+    try:
+        # Covers both turns, not the (missing) result of the update still running
+        assert final_summary(session, wait=0.05) == "+2"
+    finally:
+        release.set()
+
+
+def test_turns_after_the_last_update_are_folded_in(monkeypatch):
+    monkeypatch.setattr(chat_sessions, "update_summary", lambda previous, new: f"{previous or ''}+{len(new)}")
+    session = _session(2)
+    schedule_summary(session)
+    assert final_summary(session, wait=5) == "+2"
+    append_message(session, "user", "one more thing")
+    assert final_summary(session, wait=5) == "+2+1"
+
+
+def test_failed_update_returns_none_for_a_full_summary(monkeypatch):
+    def update_summary(previous, new_messages):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(chat_sessions, "update_summary", update_summary)
+    session = _session(2)
+    schedule_summary(session)
+    assert final_summary(session, wait=5) is None
+
+
+def test_queued_messages_keep_their_append_order(monkeypatch):
+    monkeypatch.setattr(chat_sessions, "_pending", queue.Queue())
+    monkeypatch.setattr(chat_sessions, "_ensure_writer", lambda: None)
+    session = ChatSession("patient", "resolved", "system prompt")
+    for i in range(50):
+        append_message(session, "user" if i % 2 == 0 else "assistant", f"message {i}")
+    batch = chat_sessions._drain()
+    stamps = [row["created_at"] for row in batch]
+    assert [row["content"] for row in batch] == [f"message {i}" for i in range(50)]
+    assert all("+00:00" in stamp for stamp in stamps)
+    assert stamps == sorted(stamps) and len(set(stamps)) == len(stamps)
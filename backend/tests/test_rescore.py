@@ -0,0 +1,26 @@
+import uuid
+
+from app import rescore
+from app.supabase import supabase
+
+
+def _patient(level: str) -> str:
+    row = {"user_id": str(uuid.uuid4()), "name": "Test", "age": 40, "risk_level": level}
+    return supabase.table("patients").insert(row).execute().data[0]["id"]
+
+
+def _level(patient_id: str) -> str:
+    return supabase.table("patients").select("risk_level").eq("id", patient_id).execute().data[0]["risk_level"]
+
+
+def test_rescore_raises_levels_but_never_lowers_them(monkeypatch, tmp_path):
+    monkeypatch.setattr(rescore, "CHECKPOINT_PATH", str(tmp_path / "checkpoint.json"))
+    manual_high = _patient("high")
+    keyword = _patient("low")
+    supabase.table("messages").insert({"patient_id": keyword, "role": "user", "content": "I have chest pain"}).execute()
+
+    status = rescore.run_rescore(workers=1)
+
+    assert status["state"] == "done"
+    assert _level(manual_high) == "high"
+    assert _level(keyword) == "high"
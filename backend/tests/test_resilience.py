@@ -0,0 +1,30 @@
+import time
+
+import pytest
+
+from app.resilience import Upstream, UpstreamUnavailable
+
+
+def test_reserve_fails_fast_when_the_circuit_is_open():
+    upstream = Upstream("test-open", deadline=1, max_concurrency=2)
+    upstream.breaker.state = "open"
+    upstream.breaker.opened_at = time.monotonic()
+    with pytest.raises(UpstreamUnavailable) as exc:
+        upstream.reserve()
+    assert exc.value.status_code == 503 and "Retry-After" in exc.value.headers
+    assert upstream._slots._value == 2
+
+
+def test_reserved_stream_gives_its_slot_back_once():
+    upstream = Upstream("test-reserved", deadline=1, max_concurrency=1)
+    reservation = upstream.reserve()
+    assert list(upstream.stream(lambda: iter(["a", "b"]), 1, 1, reservation)) == ["a", "b"]
+    reservation.release()
+    assert upstream._slots._value == 1
+
+
+def test_unstarted_reservation_is_released_by_its_owner():
+    upstream = Upstream("test-unstarted", deadline=1, max_concurrency=1)
+    upstream.reserve().release()
+    upstream.reserve().release()
+    assert upstream._slots._value == 1
@@ -0,0 +1,66 @@
+import pytest
+
+from app import risk_scoring
+from app.risk_rules import LEVEL_THRESHOLDS
+from app.risk_scoring import _apply_level, _PatientTrend, level_for_score
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Stand-in for patients.risk_level: records trend writes instead of hitting the database."""
+    levels = {}
+    monkeypatch.setattr(risk_scoring, "get_cached_risk_level", levels.get)
+    monkeypatch.setattr(risk_scoring, "set_patient_risk", lambda user_id, level: levels.__setitem__(user_id, level))
+    return levels
+
+
+def _trend(level: str) -> _PatientTrend:
+    trend = _PatientTrend("user-1")
+    trend.level = level
+    return trend
+
+
+def _score(level: str) -> float:
+    return dict(LEVEL_THRESHOLDS).get(level, 0.0)
+
+
+def test_falling_trend_lowers_a_level_it_set(stored):
+    trend = _trend("low")
+    trend.score = _score("high")
+    _apply_level("patient-1", trend)
+    assert stored["user-1"] == "high" and trend.written == "high"
+
+    trend.score = _score("medium")
+    _apply_level("patient-1", trend)
+    assert stored["user-1"] == "medium"
+
+
+def test_falling_trend_never_lowers_a_keyword_high(stored):
+    stored["user-1"] = "high"  # set by a high-risk chat message
+    trend = _trend("high")
+    trend.score = _score("low")
+    _apply_level("patient-1", trend)
+    assert stored["user-1"] == "high"
+    assert trend.level == level_for_score(trend.score) == "low"
+
+
+def test_keyword_takes_over_a_level_the_trend_set(stored, monkeypatch):
+    trend = _trend("low")
+    monkeypatch.setitem(risk_scoring._trends, "patient-1", trend)
+    trend.score = _score("high")
+    _apply_level("patient-1", trend)
+    # The same patient then sends a high-risk keyword: the level is no longer the trend's to lower
+    risk_scoring.record_keyword_risk("patient-1")
+    risk_scoring._executor.submit(lambda: None).result()
+    assert trend.written is None
+    trend.score = _score("medium")
+    _apply_level("patient-1", trend)
+    assert stored["user-1"] == "high"
+
+
+def test_rising_trend_never_lowers_a_higher_level(stored):
+    stored["user-1"] = "high"
+    trend = _trend("low")
+    trend.score = _score("medium")
+    _apply_level("patient-1", trend)
+    assert stored["user-1"] == "high" and trend.written is None
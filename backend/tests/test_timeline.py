@@ -0,0 +1,42 @@
+import uuid
+
+from app import timeline
+from app.supabase import supabase
+
+
+def _patient() -> str:
+    res = supabase.table("patients").insert({"user_id": str(uuid.uuid4()), "name": "Test", "age": 40}).execute()
+    return res.data[0]["id"]
+
+
+def test_mixed_batch_sends_the_same_columns_for_every_row(monkeypatch):
+    # PostgREST inserts the union of keys and stores a key missing from a row as NULL
+    sent = []
+    table = supabase.table
+
+    def recording_table(name):
+        query = table(name)
+        insert = query.insert
+
+        def record(payload, *args, **kwargs):
+            if name == "timeline_events":
+                sent.extend(payload)
+            return insert(payload, *args, **kwargs)
+
+        query.insert = record
+        return query
+
+    monkeypatch.setattr(timeline.supabase, "table", recording_table)
+    results = timeline.add_events(_patient(), [
+        {"type": "symptom", "title": "Headache", "date": "2026-01-05", "details": "since Monday"},
+        {"type": "appointment", "title": "GP visit"},
+    ])
+
+    assert all(r["success"] for r in results)
+    assert len(sent) == 2
+    assert set(sent[0]) == set(sent[1])
+    dated, undated = (r["event"] for r in results)
+    assert dated["created_at"].startswith("2026-01-05")
+    assert undated["created_at"]
+    assert dated["details"] == {"text": "since Monday"}
+    assert undated["details"] == {"text": ""}
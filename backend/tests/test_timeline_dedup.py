@@ -0,0 +1,26 @@
+from app.timeline_dedup import more_specific, title_words, titles_match
+
+
+def _match(new: str, existing: str) -> bool:
+    return titles_match(title_words(new), title_words(existing))
+
+
+def test_repeats_and_less_specific_titles_match():
+    assert _match("Headache", "Severe headaches")
+    assert _match("Headaches", "Headache")
+    assert _match("Started taking ibuprofen", "Ibuprofen")
+
+
+def test_a_title_that_adds_words_is_a_new_event():
+    assert not _match("Chest pain", "Pain")
+
+
+def test_negation_and_stop_words_never_match():
+    assert not _match("No fever", "Fever")
+    assert not _match("Fever", "No fever")
+    assert not _match("Stopped ibuprofen", "Ibuprofen")
+
+
+def test_more_specific_title_is_kept():
+    assert more_specific("Severe headache", "Headache")
+    assert not more_specific("Headache", "Severe headache")
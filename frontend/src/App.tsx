@@ -6,6 +6,7 @@ import {
   useNavigate,
 } from "react-router-dom";
 import { useAppStore } from "./stores/appStore";
+import { authHeaders, clearAccessTokenOn401 } from "./lib/auth";
 
 // Pages
 import { Home } from "./pages/Home";
@@ -26,8 +27,11 @@ function RoleRoute({
   const nav = useNavigate();
   useEffect(() => {
     const checkAuth = async () => {
-      const res = await fetch("http://localhost:8000/auth/getuser");
+      const res = await fetch("http://localhost:8000/auth/getuser", {
+        headers: authHeaders(),
+      });
       if (!res.ok) {
+        clearAccessTokenOn401(res);
         nav("/");
       }
     };
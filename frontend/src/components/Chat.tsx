@@ -26,7 +26,7 @@ function CameraFocus() {
 }
 
 export function Chat({ patientId, onEndCall, endCallRef }: ChatProps) {
-  const { messages, sendMessage, isLoading, audioUrl, initializeGreeting, handleEndCall } = useChat(patientId);
+  const { messages, sendMessage, isLoading, audioUrl, lipSync, initializeGreeting, handleEndCall } = useChat(patientId);
   const [input, setInput] = useState('');
   const [triggerAnimation, setTriggerAnimation] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
@@ -161,6 +161,7 @@ export function Chat({ patientId, onEndCall, endCallRef }: ChatProps) {
             playAnimation={triggerAnimation} 
             onAnimationComplete={handleAnimationComplete}
             audioElement={currentAudioElement}
+            lipSync={lipSync}
           />
           <Environment preset="sunset" />
         </Canvas>
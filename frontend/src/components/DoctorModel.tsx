@@ -4,14 +4,17 @@ import { useGLTF, useAnimations } from '@react-three/drei';
 import * as THREE from 'three';
 
 import { useAudioAnalysis } from '../hooks/useAudioAnalysis';
+import { sampleLipSync, type LipSyncTrack } from '../lib/lipSync';
 
 interface DoctorModelProps {
   playAnimation?: boolean;
   onAnimationComplete?: () => void;
   audioElement?: HTMLAudioElement | null;
+  // Server-computed mouth envelope for audioElement; when present no Web Audio analysis runs
+  lipSync?: LipSyncTrack | null;
 }
 
-export function DoctorModel({ playAnimation, onAnimationComplete, audioElement }: DoctorModelProps) {
+export function DoctorModel({ playAnimation, onAnimationComplete, audioElement, lipSync }: DoctorModelProps) {
   const group = useRef<THREE.Group>(null);
   const [previousPlayState, setPreviousPlayState] = useState(false);
   const idleActionRef = useRef<THREE.AnimationAction | null>(null);
@@ -26,8 +29,8 @@ export function DoctorModel({ playAnimation, onAnimationComplete, audioElement }
   
   const { actions, mixer } = useAnimations(animations || [], group);
   
-  // Analyze audio for lip sync
-  const audioAmplitude = useAudioAnalysis(audioElement || null);
+  // Analyze audio for lip sync (fallback for audio without a precomputed envelope)
+  const analysedAmplitude = useAudioAnalysis(lipSync ? null : audioElement || null);
 
   // Get all available animation names - use animations array as source of truth
   const animationNames = animations?.map(clip => clip.name) || [];
@@ -247,6 +250,10 @@ export function DoctorModel({ playAnimation, onAnimationComplete, audioElement }
     // Apply jaw rotation with adjusted pivot point AFTER mixer updates
     // This must happen after mixer.update() to override animation-driven rotation
     if (jawBoneRef.current && originalJawRotationRef.current && originalJawPositionRef.current) {
+      // Envelope lookup at the playback position: no per-frame audio analysis
+      const audioAmplitude = lipSync && audioElement && !audioElement.paused
+        ? sampleLipSync(lipSync, audioElement.currentTime)
+        : analysedAmplitude;
       if (audioAmplitude > 0) {
         // Rotate jaw down (open) based on audio amplitude
         const maxRotation = .8; // Maximum jaw opening in radians
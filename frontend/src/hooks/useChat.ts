@@ -1,12 +1,24 @@
-import { useState, useCallback } from 'react';
-import { streamChat, generateSpeech, getGreeting, endCall } from '../lib/api';
+import { useState, useCallback, useRef } from 'react';
+import {
+  streamSessionChat,
+  openChatSession,
+  ChatSessionExpiredError,
+  generateSpeech,
+  getGreeting,
+  endCall,
+} from '../lib/api';
 import { generateId } from '../lib/utils';
+import type { LipSyncTrack } from '../lib/lipSync';
 import type { Message } from '../types';
 
 export function useChat(patientId: string) {
   const [messages, setMessages] = useState<Message[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const [audioUrl, setAudioUrl] = useState<string | null>(null);
+  // Mouth envelope for the audio at audioUrl (null: the avatar analyses the audio itself)
+  const [lipSync, setLipSync] = useState<LipSyncTrack | null>(null);
+  // Server-side chat session; opened lazily and seeded with what is already on screen
+  const sessionIdRef = useRef<string | null>(null);
 
   const sendMessage = useCallback(async (content: string) => {
     // Add user message
@@ -27,24 +39,44 @@ export function useChat(patientId: string) {
         { id: assistantId, role: 'assistant', content: '', createdAt: new Date() },
       ]);
 
-      // Stream the response into a buffer (don't update UI yet)
-      const chatMessages = [...messages, userMessage].map((m) => ({
+      // Stream the response into a buffer (don't update UI yet).
+      // Only the new message is sent; the server keeps the history in the session.
+      const history = messages.map((m) => ({
         role: m.role,
         content: m.content,
       }));
 
+      const streamReply = async (resume = false) => {
+        if (!sessionIdRef.current) {
+          const { sessionId } = await openChatSession(patientId, history, resume);
+          sessionIdRef.current = sessionId;
+        }
+        let content = '';
+        for await (const chunk of streamSessionChat(sessionIdRef.current, userMessage.content)) {
+          content += chunk;
+          // Don't update messages here - buffer the content
+        }
+        return content;
+      };
+
       let fullContent = '';
-      for await (const chunk of streamChat(chatMessages, patientId)) {
-        fullContent += chunk;
-        // Don't update messages here - buffer the content
+      try {
+        fullContent = await streamReply();
+      } catch (error) {
+        if (!(error instanceof ChatSessionExpiredError)) throw error;
+        // Session expired (or lives on another worker): reopen it with the full history and retry once.
+        // The history is already stored, so the server only seeds the new session with it.
+        sessionIdRef.current = null;
+        fullContent = await streamReply(true);
       }
       
       // Generate speech audio from the complete response
       let audioUrlValue: string | null = null;
       if (fullContent.trim()) {
         try {
-          const audioBlob = await generateSpeech(fullContent);
-          audioUrlValue = URL.createObjectURL(audioBlob);
+          const speech = await generateSpeech(fullContent);
+          audioUrlValue = URL.createObjectURL(speech.audio);
+          setLipSync(speech.lipSync);
           setAudioUrl(audioUrlValue);
         } catch (error) {
           console.error('Failed to generate speech:', error);
@@ -102,8 +134,9 @@ export function useChat(patientId: string) {
       
       // Generate speech audio from the greeting
       try {
-        const audioBlob = await generateSpeech(greetingText);
-        const audioUrlValue = URL.createObjectURL(audioBlob);
+        const speech = await generateSpeech(greetingText);
+        const audioUrlValue = URL.createObjectURL(speech.audio);
+        setLipSync(speech.lipSync);
         setAudioUrl(audioUrlValue);
       } catch (error) {
         console.error('Failed to generate speech for greeting:', error);
@@ -127,7 +160,8 @@ export function useChat(patientId: string) {
       }));
       
       // Call end call endpoint
-      const result = await endCall(chatMessages, patientId);
+      const result = await endCall(chatMessages, patientId, sessionIdRef.current);
+      sessionIdRef.current = null;
       
       // Add closing message to chat
       const closingId = generateId();
@@ -141,8 +175,9 @@ export function useChat(patientId: string) {
       
       // Generate speech for closing message
       try {
-        const audioBlob = await generateSpeech(result.closingMessage);
-        const audioUrlValue = URL.createObjectURL(audioBlob);
+        const speech = await generateSpeech(result.closingMessage);
+        const audioUrlValue = URL.createObjectURL(speech.audio);
+        setLipSync(speech.lipSync);
         setAudioUrl(audioUrlValue);
       } catch (error) {
         console.error('Failed to generate speech for closing message:', error);
@@ -159,12 +194,14 @@ export function useChat(patientId: string) {
 
   const clearMessages = useCallback(() => {
     setMessages([]);
+    sessionIdRef.current = null;
     // Clean up audio URL
     if (audioUrl) {
       URL.revokeObjectURL(audioUrl);
       setAudioUrl(null);
+      setLipSync(null);
     }
   }, [audioUrl]);
 
-  return { messages, sendMessage, isLoading, clearMessages, audioUrl, initializeGreeting, handleEndCall };
+  return { messages, sendMessage, isLoading, clearMessages, audioUrl, lipSync, initializeGreeting, handleEndCall };
 }
@@ -1,11 +1,15 @@
 import type { Patient } from "../types";
+import { authHeaders, clearAccessTokenOn401 } from "./auth";
 
 export async function addPatient(
   patient: Patient,
 ): Promise<{ success: boolean }> {
-  const res = await fetch("http://localhost:8000/auth/getuser");
+  const res = await fetch("http://localhost:8000/auth/getuser", {
+    headers: authHeaders(),
+  });
 
   if (!res.ok) {
+    clearAccessTokenOn401(res);
     return { success: false };
   }
 
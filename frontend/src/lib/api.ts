@@ -1,3 +1,5 @@
+import { LIPSYNC_MEDIA_TYPE, parseLipSync, type LipSyncTrack } from "./lipSync";
+
 const API_BASE = "http://localhost:8000/api";
 
 // Generic fetch wrapper
@@ -91,6 +93,54 @@ export async function* streamChat(
   }
 }
 
+// Chat session API - open once, then send only the new message each turn
+export async function openChatSession(
+  patientId: string,
+  messages: { role: string; content: string }[] = [],
+  resume = false,
+): Promise<{ sessionId: string }> {
+  const res = await fetch(`${API_BASE}/chat/session`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ patientId, messages, resume }),
+  });
+
+  if (!res.ok) {
+    throw new Error("Failed to open chat session");
+  }
+
+  return res.json();
+}
+
+export class ChatSessionExpiredError extends Error {}
+
+export async function* streamSessionChat(
+  sessionId: string,
+  message: string,
+): AsyncGenerator<string> {
+  const res = await fetch(`${API_BASE}/chat`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ sessionId, message }),
+  });
+
+  if (res.status === 404) {
+    throw new ChatSessionExpiredError("Chat session expired");
+  }
+  if (!res.ok || !res.body) {
+    throw new Error("Chat stream failed");
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    yield decoder.decode(value);
+  }
+}
+
 // Greeting API - Get initial hardcoded greeting
 export async function getGreeting(): Promise<{ text: string }> {
   const res = await fetch(`${API_BASE}/chat/greeting`, {
@@ -109,12 +159,21 @@ export async function getGreeting(): Promise<{ text: string }> {
 export async function endCall(
   messages: { role: string; content: string }[],
   patientId: string,
+  sessionId?: string | null,
 ): Promise<{ closingMessage: string; summary: string }> {
-  const res = await fetch(`${API_BASE}/chat/end`, {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ messages, patientId }),
-  });
+  const post = (body: object) =>
+    fetch(`${API_BASE}/chat/end`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body),
+    });
+
+  // With a session the server already has the transcript
+  let res = await post(sessionId ? { sessionId, patientId } : { messages, patientId });
+  if (sessionId && res.status === 404) {
+    // Session expired or was evicted: send the local transcript to summarize instead
+    res = await post({ messages, patientId });
+  }
 
   if (!res.ok) {
     throw new Error("Failed to end call");
@@ -123,15 +182,21 @@ export async function endCall(
   return res.json();
 }
 
-// TTS API - Generate speech audio from text
+export interface Speech {
+  audio: Blob;
+  // Precomputed mouth envelope; null if the server sent plain audio
+  lipSync: LipSyncTrack | null;
+}
+
+// TTS API - Generate speech audio (and its lip-sync envelope) from text
 export async function generateSpeech(
   text: string,
   voiceId?: string,
-): Promise<Blob> {
+): Promise<Speech> {
   const res = await fetch(`${API_BASE}/tts`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ text, voice_id: voiceId }),
+    body: JSON.stringify({ text, voice_id: voiceId, lipsync: true }),
   });
 
   if (!res.ok) {
@@ -160,5 +225,8 @@ export async function generateSpeech(
     throw new Error(errorMessage);
   }
 
-  return res.blob();
+  if (res.headers.get("Content-Type")?.startsWith(LIPSYNC_MEDIA_TYPE)) {
+    return parseLipSync(await res.arrayBuffer());
+  }
+  return { audio: await res.blob(), lipSync: null };
 }
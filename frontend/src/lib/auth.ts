@@ -1,5 +1,20 @@
 import type { Patient, Provider, UserRole } from "../types";
 
+const ACCESS_TOKEN_KEY = "accessToken";
+
+// Bearer header for routes that identify the caller from their Supabase access token
+export function authHeaders(): Record<string, string> {
+  const token = localStorage.getItem(ACCESS_TOKEN_KEY);
+  return token ? { Authorization: `Bearer ${token}` } : {};
+}
+
+// Forget an access token the backend rejected (expired or revoked)
+export function clearAccessTokenOn401(res: Response) {
+  if (res.status === 401) {
+    localStorage.removeItem(ACCESS_TOKEN_KEY);
+  }
+}
+
 export type LoginError =
   | "empty_fields"
   | "invalid_credentials"
@@ -33,6 +48,9 @@ export async function login(
   if (userId) {
     localStorage.setItem("userId", userId);
   }
+  if (body?.accessToken) {
+    localStorage.setItem(ACCESS_TOKEN_KEY, body.accessToken);
+  }
   return { success: true, userId };
 }
 export async function registerPatient(
@@ -110,6 +128,7 @@ export async function signOut() {
   }
 
   localStorage.removeItem("userId");
+  localStorage.removeItem(ACCESS_TOKEN_KEY);
   return { success: true };
 }
 
@@ -128,8 +147,11 @@ export async function getCurrentUserId(): Promise<string | null> {
       // If verification fails, clear cache and try again
       localStorage.removeItem("userId");
     }
-    const res = await fetch("http://localhost:8000/auth/getuser");
+    const res = await fetch("http://localhost:8000/auth/getuser", {
+      headers: authHeaders(),
+    });
     if (!res.ok) {
+      clearAccessTokenOn401(res);
       console.error("getCurrentUserId: Response not OK", res.status);
       return null;
     }
@@ -1,13 +1,17 @@
 import { useEffect, useState } from "react";
 import type { Patient } from "../types";
+import { authHeaders, clearAccessTokenOn401 } from "./auth";
 
 export async function getPatients(): Promise<{
   success: boolean;
   patient_list?: Patient[];
 }> {
-  const res = await fetch("http://localhost:8000/api/doctors/me/patients");
+  const res = await fetch("http://localhost:8000/api/doctors/me/patients", {
+    headers: authHeaders(),
+  });
 
   if (!res.ok) {
+    clearAccessTokenOn401(res);
     console.log("error");
     console.log(await res.json());
     return { success: false };
@@ -0,0 +1,53 @@
+// Lip-sync responses from /api/tts (lipsync: true), see app/tts.py on the backend:
+// "CBLS" + version byte, then frames of [type u8][length u32 LE][payload].
+const MAGIC = [0x43, 0x42, 0x4c, 0x53, 0x01];
+const FRAME_ENVELOPE = 1;
+const FRAME_AUDIO = 2; // WAV
+const FRAME_AUDIO_MP3 = 3;
+
+export const LIPSYNC_MEDIA_TYPE = "application/vnd.carebridge.lipsync";
+
+export interface LipSyncTrack {
+  fps: number;
+  // Mouth opening per frame, 0-255
+  envelope: Uint8Array;
+}
+
+export function parseLipSync(buffer: ArrayBuffer): { audio: Blob; lipSync: LipSyncTrack } {
+  const view = new DataView(buffer);
+  if (MAGIC.some((byte, i) => view.getUint8(i) !== byte)) {
+    throw new Error("Not a lip-sync response");
+  }
+
+  let audio: Blob | null = null;
+  let lipSync: LipSyncTrack | null = null;
+  let offset = MAGIC.length;
+  while (offset + 5 <= buffer.byteLength) {
+    const type = view.getUint8(offset);
+    const length = view.getUint32(offset + 1, true);
+    const start = offset + 5;
+    if (type === FRAME_ENVELOPE) {
+      lipSync = {
+        fps: view.getUint16(start, true),
+        envelope: new Uint8Array(buffer, start + 2, length - 2),
+      };
+    } else if (type === FRAME_AUDIO || type === FRAME_AUDIO_MP3) {
+      audio = new Blob([new Uint8Array(buffer, start, length)], {
+        type: type === FRAME_AUDIO_MP3 ? "audio/mpeg" : "audio/wav",
+      });
+    }
+    offset = start + length;
+  }
+
+  if (!audio || !lipSync) {
+    throw new Error("Incomplete lip-sync response");
+  }
+  return { audio, lipSync };
+}
+
+// Amplitude (0-1) at the given playback time; cheap enough to call every animation frame
+export function sampleLipSync(track: LipSyncTrack, time: number): number {
+  const index = Math.floor(time * track.fps);
+  if (index < 0 || index >= track.envelope.length) return 0;
+  return track.envelope[index] / 255;
+}